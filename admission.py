@@ -0,0 +1,369 @@
+"""
+准入控制：按客户端（API Key / IP）加权公平排队 + 过载快速拒绝
+所有 gunicorn worker 通过 RUNTIME_DIR 下的 SQLite 文件共享槽位与排队状态
+
+调度规则：
+  - 全机共 ADMISSION_SLOTS 个计算槽位，作业按同时占用的计算器数占用槽位（单点计算 1 个，
+    在多个计算进程间并行的对比/批量作业按并行度占用多个），凑齐所需槽位才开始
+  - slots=0 的票据只计费、不占槽位（微批处理中各请求按自己的客户端排队计费，批次另取一个槽位）
+  - 排队时按客户端的加权虚拟服务时间（WFQ）排序：vtime 每次获得槽位后增加 cost/weight，
+    因此 /dome、批量作业等高成本请求会让出槽位给交互式的 /calculate
+  - 有其他客户端排队时，单个客户端最多占用按权重分得的槽位份额；无人竞争时可用满全部槽位
+  - 单客户端排队超过 ADMISSION_QUEUE_PER_KEY 返回 429，全机排队超过 ADMISSION_QUEUE_TOTAL
+    或等待超过 ADMISSION_MAX_WAIT 返回 503，均带 Retry-After
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, Optional
+
+from fastapi import HTTPException
+
+from config import (
+    ADMISSION_ENABLED,
+    ADMISSION_MAX_WAIT,
+    ADMISSION_QUEUE_PER_KEY,
+    ADMISSION_QUEUE_TOTAL,
+    ADMISSION_SLOTS,
+    API_KEY_WEIGHTS,
+    RUNTIME_DIR,
+)
+
+# 作业成本模型：以单次 /calculate（1 次闪蒸）为 1 个单位，约等于 REFPROP 调用次数
+JOB_COSTS: Dict[str, float] = {
+    "calculate": 1.0,
+    "fluid_info": 8.0,     # 临界点、沸点、三相点、k 值及 INFO 字符串等约 8 次调用
+    "fluid_limits": 4.0,   # 输入范围查询：临界点（混合物含 SATSPLN 拟合）、EOSMIN、EOSMAX、三相点
+    "dome": 135.0,         # 临界点 + EOSMIN + 约 65 个温度 × 液/气两条线
+    "chart_line": 60.0,    # P-h 图每条等值线的自适应采样约 60 次调用（饱和包络线按 2 条计）
+    "compressor_point": 7.0,  # 压缩机性能图每个网格点：饱和压力、吸气、等熵排气、实际排气、冷凝器出口
+}
+
+COST_UNIT_SECONDS = 0.005  # 每个成本单位的估计耗时 [s]，用于估算 Retry-After
+POLL_MIN = 0.002           # 排队轮询间隔下限 [s]
+POLL_MAX = 0.02            # 排队轮询间隔上限 [s]
+REAP_INTERVAL = 1.0        # 清理已退出 worker 遗留票据的间隔 [s]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    client  TEXT NOT NULL,
+    cost    REAL NOT NULL,
+    pid     INTEGER NOT NULL,
+    state   TEXT NOT NULL,
+    created REAL NOT NULL,
+    slots   INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS tickets_state ON tickets (state, client);
+CREATE TABLE IF NOT EXISTS clients (
+    client TEXT PRIMARY KEY,
+    weight REAL NOT NULL,
+    vtime  REAL NOT NULL
+);
+"""
+
+
+def job_cost(kind: str, n_items: int = 1) -> float:
+    """按作业类型估算成本；批量作业按条目数线性累加"""
+    return JOB_COSTS.get(kind, 1.0) * max(int(n_items), 1)
+
+
+def client_weight(client: str) -> float:
+    """客户端权重：API_KEY_WEIGHTS 中配置的 Key 使用其权重，其余为 1"""
+    if client.startswith("key:"):
+        return max(API_KEY_WEIGHTS.get(client[4:], 1.0), 1e-6)
+    return 1.0
+
+
+def client_digest(client: str) -> str:
+    """共享状态中只保存客户端标识的摘要，避免 API Key 明文落盘"""
+    kind, _, ident = client.partition(":")
+    return f"{kind}:{hashlib.sha256(ident.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AdmissionController:
+    """跨进程的加权公平准入控制器（SQLite WAL 共享状态）"""
+
+    def __init__(
+        self,
+        db_path: str,
+        slots: int = ADMISSION_SLOTS,
+        queue_per_key: int = ADMISSION_QUEUE_PER_KEY,
+        queue_total: int = ADMISSION_QUEUE_TOTAL,
+        max_wait: float = ADMISSION_MAX_WAIT,
+    ):
+        self.db_path = db_path
+        self.slots = max(int(slots), 1)
+        self.queue_per_key = max(int(queue_per_key), 0)
+        self.queue_total = max(int(queue_total), 0)
+        self.max_wait = float(max_wait)
+        self._local = threading.local()
+        self._last_reap = 0.0
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        # 旧版本创建的状态文件（RUNTIME_DIR 在内存盘上，跨服务重启保留）没有 slots 列
+        if "slots" not in [row[1] for row in conn.execute("PRAGMA table_info(tickets)")]:
+            try:
+                conn.execute("ALTER TABLE tickets ADD COLUMN slots INTEGER NOT NULL DEFAULT 1")
+            except sqlite3.OperationalError:
+                pass  # 其他 worker 已同时添加
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接；autocommit 模式，事务由 BEGIN IMMEDIATE 显式开启"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # 状态仅在运行期有效，无需落盘保证
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _reap(self, conn: sqlite3.Connection) -> None:
+        """
+        清理已退出 worker 遗留的票据（worker 崩溃或被 gunicorn 超时杀死时），以及空闲客户端的记录
+
+        没有票据、vtime 不高于活跃客户端最小值的客户端，重新活跃时本来就会被提升到该最小值，
+        删除其记录不改变调度结果；无活跃客户端时全部空闲记录都可删除。clients 表因此只保留
+        活跃客户端和仍有“欠账”的客户端，不随出现过的客户端（如不同 IP）无限增长。
+        """
+        now = time.monotonic()
+        if now - self._last_reap < REAP_INTERVAL:
+            return
+        self._last_reap = now
+        me = os.getpid()
+        for (pid,) in conn.execute("SELECT DISTINCT pid FROM tickets").fetchall():
+            if pid != me and not _pid_alive(pid):
+                conn.execute("DELETE FROM tickets WHERE pid = ?", (pid,))
+        conn.execute(
+            """
+            DELETE FROM clients
+            WHERE NOT EXISTS (SELECT 1 FROM tickets t WHERE t.client = clients.client)
+              AND vtime <= COALESCE(
+                  (SELECT MIN(c.vtime) FROM clients c
+                   WHERE EXISTS (SELECT 1 FROM tickets t WHERE t.client = c.client)),
+                  vtime)
+            """
+        )
+
+    def _retry_after(self, conn: sqlite3.Connection) -> int:
+        """按排队总成本估算 Retry-After 秒数"""
+        (queued_cost,) = conn.execute(
+            "SELECT COALESCE(SUM(cost), 0) FROM tickets WHERE state = 'queued'"
+        ).fetchone()
+        return max(1, math.ceil(queued_cost * COST_UNIT_SECONDS / self.slots))
+
+    def _try_grant(self, conn: sqlite3.Connection, ticket_id: int) -> bool:
+        """若该票据是当前最应获得槽位的排队者且空闲槽位足够，则授予槽位"""
+        cost, slots = conn.execute("SELECT cost, slots FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+        (running,) = conn.execute(
+            "SELECT COALESCE(SUM(slots), 0) FROM tickets WHERE state = 'running'"
+        ).fetchone()
+        if slots and running >= self.slots:
+            return False
+
+        rows = conn.execute(
+            """
+            SELECT t.client, MIN(t.id), c.weight, c.vtime,
+                   (SELECT COALESCE(SUM(r.slots), 0) FROM tickets r
+                    WHERE r.client = t.client AND r.state = 'running')
+            FROM tickets t JOIN clients c ON c.client = t.client
+            WHERE t.state = 'queued'
+            GROUP BY t.client
+            """
+        ).fetchall()
+        if not rows:
+            return False
+        # 仅在有其他客户端排队时才按权重限制份额，无人竞争时可占满全部槽位
+        total_weight = sum(r[2] for r in rows)
+        contended = len(rows) > 1
+        eligible = [
+            r for r in rows
+            if not contended or r[4] < max(1, math.floor(self.slots * r[2] / total_weight))
+        ]
+        # 份额取整后可能所有排队者都已达上限，此时仍按 vtime 分配空闲槽位（保持工作守恒）
+        best = min(eligible or rows, key=lambda r: (r[3], r[1]))
+        if best[1] != ticket_id:
+            return False
+
+        client, _, weight, vtime, _ = best
+        if running + slots > self.slots:
+            return False  # 多槽位作业等到槽位凑齐；其间后来者不插队，避免其一直凑不齐
+        conn.execute("UPDATE tickets SET state = 'running' WHERE id = ?", (ticket_id,))
+        conn.execute(
+            "UPDATE clients SET vtime = ? WHERE client = ?",
+            (vtime + cost / weight, client),
+        )
+        return True
+
+    def _enqueue(self, client: str, weight: float, cost: float, slots: int, capped: bool = True) -> int:
+        with self._tx() as conn:
+            self._reap(conn)
+            (queued_total,) = conn.execute(
+                "SELECT COUNT(*) FROM tickets WHERE state = 'queued'"
+            ).fetchone()
+            (queued_mine,) = conn.execute(
+                "SELECT COUNT(*) FROM tickets WHERE state = 'queued' AND client = ?",
+                (client,),
+            ).fetchone()
+            if capped and queued_mine >= self.queue_per_key:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many queued requests for this client. 当前客户端排队请求过多，请稍后重试。",
+                    headers={"Retry-After": str(self._retry_after(conn))},
+                )
+            if capped and queued_total >= self.queue_total:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server overloaded. 服务繁忙，请稍后重试。",
+                    headers={"Retry-After": str(self._retry_after(conn))},
+                )
+
+            # 空闲后重新活跃的客户端，vtime 提升到当前活跃客户端的最小值，避免积攒过多优先级
+            active = conn.execute(
+                "SELECT MIN(c.vtime) FROM clients c WHERE c.client != ? AND EXISTS "
+                "(SELECT 1 FROM tickets t WHERE t.client = c.client)",
+                (client,),
+            ).fetchone()[0]
+            mine_active = conn.execute(
+                "SELECT 1 FROM tickets WHERE client = ? LIMIT 1", (client,)
+            ).fetchone()
+            row = conn.execute("SELECT vtime FROM clients WHERE client = ?", (client,)).fetchone()
+            vtime = row[0] if row else 0.0
+            if not mine_active and active is not None:
+                vtime = max(vtime, active)
+            conn.execute(
+                "INSERT OR REPLACE INTO clients (client, weight, vtime) VALUES (?, ?, ?)",
+                (client, weight, vtime),
+            )
+
+            cur = conn.execute(
+                "INSERT INTO tickets (client, cost, pid, state, created, slots) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (client, cost, os.getpid(), time.time(), slots),
+            )
+            ticket_id = cur.lastrowid
+            if self._try_grant(conn, ticket_id):
+                return ticket_id
+        self._wait(ticket_id)
+        return ticket_id
+
+    def _wait(self, ticket_id: int) -> None:
+        """轮询等待槽位；超时则撤销票据并返回 503"""
+        deadline = time.monotonic() + self.max_wait
+        delay = POLL_MIN
+        while True:
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_MAX)
+            with self._tx() as conn:
+                self._reap(conn)
+                if self._try_grant(conn, ticket_id):
+                    return
+                if time.monotonic() < deadline:
+                    continue
+                conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+                retry_after = self._retry_after(conn)
+            raise HTTPException(
+                status_code=503,
+                detail="Queue wait timeout. 排队超时，服务繁忙，请稍后重试。",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+    def _release(self, ticket_id: int) -> None:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+
+    @contextmanager
+    def admit(self, client: str, cost: float, slots: int = 1, capped: bool = True) -> Iterator[None]:
+        """
+        获取 slots 个计算槽位（不超过总槽位数），退出时释放；过载时抛出 HTTPException 429/503
+
+        slots=0 时只按 cost 计费、按加权公平顺序排队，不等待空闲槽位；capped=False 时不检查排队上限
+        （已经计费的作业再取槽位，见 admit_slot）。
+        """
+        slots = min(max(int(slots), 0), self.slots)
+        ticket_id = self._enqueue(client_digest(client), client_weight(client), cost, slots, capped)
+        try:
+            yield
+        finally:
+            self._release(ticket_id)
+
+    def snapshot(self) -> dict:
+        """当前槽位占用与排队情况（供 /stats 使用）；running 为占用的槽位数，queued 为排队的作业数"""
+        conn = self._conn()
+        clients = {}
+        for client, state, n, cost, slots in conn.execute(
+            "SELECT client, state, COUNT(*), SUM(cost), SUM(slots) FROM tickets GROUP BY client, state"
+        ):
+            entry = clients.setdefault(client, {"running": 0, "queued": 0, "queued_cost": 0.0})
+            entry[state] = slots if state == "running" else n
+            if state == "queued":
+                entry["queued_cost"] = cost
+        return {
+            "slots": self.slots,
+            "running": sum(c["running"] for c in clients.values()),
+            "queued": sum(c["queued"] for c in clients.values()),
+            "clients": clients,
+        }
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_controller() -> AdmissionController:
+    """进程内单例；各 worker 的实例共享同一个 SQLite 文件"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController(os.path.join(RUNTIME_DIR, "admission.sqlite3"))
+    return _controller
+
+
+def admit(client: str, kind: str, n_items: int = 1, slots: int = 1):
+    """
+    路由中使用的准入上下文：
+        with admit(client, "dome"):
+            ...
+    作业在 k 个计算器上并行执行（run_tasks）时传 slots=k，按实际占用的计算器数计入槽位；
+    slots=0 只计费、不占槽位（计算时再用 admit_slot 取槽位）。
+    ADMISSION_ENABLED=0 时不做任何限制
+    """
+    if not ADMISSION_ENABLED:
+        return nullcontext()
+    return get_controller().admit(client, job_cost(kind, n_items), slots)
+
+
+def admit_slot(client: str):
+    """
+    为已经按 slots=0 计费的作业获取一个计算槽位：不再计费，也不受排队上限限制（作业已通过准入）；
+    等待超过 ADMISSION_MAX_WAIT 仍返回 503
+    """
+    if not ADMISSION_ENABLED:
+        return nullcontext()
+    return get_controller().admit(client, 0.0, 1, capped=False)
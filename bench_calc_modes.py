@@ -0,0 +1,127 @@
+"""
+计算器形态对比：进程模式（GUNICORN_WORKERS 个 worker × CALC_PROCESSES 个计算子进程）与
+线程模式（1 个 worker × 同样数量的计算线程，每线程一组 librefprop.so 独立副本）的内存占用与吞吐
+
+两种形态的并行计算器总数相同（workers × calc_processes）。每种形态在单独的子进程中测量，互不影响：
+  - 内存：测量进程及其计算子进程的 VmRSS 之和；进程模式另加 (workers - 1) 个空闲 worker 的基线
+    （导入 main 后、启动计算器前的 RSS），即其余 worker 各自重复的 Python 运行时与进程内缓存
+  - 吞吐：与计算器总数相同的客户端线程持续调用单点 calculate，统计每秒完成的状态点数
+
+用法（需真实的 REFPROP，RPPREFIX 指向含 librefprop.so 的目录；替身库为纯 Python，受 GIL 限制，数字没有参考意义）：
+  python bench_calc_modes.py --workers 4 --calc-processes 2 --points 4000 --fluid R32
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODES = ("process", "thread")
+
+
+def _rss_kb(pid: int) -> int:
+    """进程的 VmRSS [kB]（Linux /proc）；进程已退出时为 0"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def _tree_rss_kb(pid: int) -> int:
+    return _rss_kb(pid) + sum(_tree_rss_kb(child) for child in _children(pid))
+
+
+def _point(i: int, fluid: str) -> dict:
+    """单相区的 PT 状态点，逐点略有不同，避免任何层面的结果复用"""
+    return {"fluid_string": fluid, "input_type": "PT", "value1": 500.0 + (i % 97), "value2": 320.0 + (i % 53) * 0.1}
+
+
+def run_mode(mode: str, workers: int, calc_processes: int, points: int, fluid: str) -> dict:
+    """在当前进程内按 mode 启动计算器并测量（由 main() 在独立子进程中调用）"""
+    import main  # noqa: F401  与 worker 相同的导入集，作为基线
+    from calc_pool import CalculatorPool, ThreadCalculatorPool
+
+    baseline = _rss_kb(os.getpid())
+    size = workers * calc_processes
+    pool = ThreadCalculatorPool(size, spares=0) if mode == "thread" else CalculatorPool(size, spares=0)
+    pool.start()
+    try:
+        for i in range(size):  # 每个计算器先设置一次工质
+            pool.call("calculate", 10.0, **_point(i, fluid))
+        start = time.perf_counter()
+        with ThreadPoolExecutor(size) as executor:
+            errors = sum(
+                1 for r in executor.map(lambda i: _try(pool, _point(i, fluid)), range(points)) if r is None
+            )
+        elapsed = time.perf_counter() - start
+        rss = _tree_rss_kb(os.getpid())
+    finally:
+        pool.shutdown()
+    if mode == "process":
+        rss += (workers - 1) * baseline  # 其余 worker 的 Python 运行时（各自另有计算子进程，已计入 size）
+    return {
+        "mode": mode,
+        "workers": workers if mode == "process" else 1,
+        "calculators": size,
+        "points": points,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "points_per_second": round(points / elapsed, 1) if elapsed > 0 else None,
+        "rss_mb": round(rss / 1024.0, 1),
+        "worker_baseline_mb": round(baseline / 1024.0, 1),
+    }
+
+
+def _try(pool, point: dict):
+    try:
+        return pool.call("calculate", 10.0, **point)
+    except (ValueError, RuntimeError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="进程模式的 gunicorn worker 数")
+    parser.add_argument("--calc-processes", type=int, default=2, help="每个 worker 的计算进程数")
+    parser.add_argument("--points", type=int, default=4000, help="每种形态计算的状态点数")
+    parser.add_argument("--fluid", default="R32")
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run, args.workers, args.calc_processes, args.points, args.fluid)))
+        return
+
+    env = {**os.environ, "RESULT_CACHE_PATH": ""}
+    results = []
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", mode,
+             "--workers", str(args.workers), "--calc-processes", str(args.calc_processes),
+             "--points", str(args.points), "--fluid", args.fluid],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<8} {'workers':>7} {'calculators':>11} {'points/s':>10} {'RSS MB':>8} {'errors':>6}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['workers']:>7} {r['calculators']:>11} {r['points_per_second']:>10} "
+              f"{r['rss_mb']:>8} {r['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+批量文件作业：上传 CSV / Parquet 状态点文件，流式返回结果文件
+仿真日志后处理等场景一次需要上百万个状态点，无法通过 JSON POST 提交。
+
+流水线（内存占用与文件大小无关）：
+  读取  上传内容先落盘为临时文件，再按 BULK_CHUNK_ROWS 行分块读取（CSV 逐行解析，Parquet 按行组批读取）
+  校验  每块中作业内缓存（定长 LRU）没有的工质，在一次准入下批量查询输入范围
+  计算  每块按（规范化工质, 输入类型）分组，每组再切成不超过 BULK_TASK_POINTS 点的 calculate_batch 任务，
+        在本 worker 的计算进程间并行；每块单独准入，大作业不会长期独占计算进程
+  写出  结果按原始行序写成同格式的文件片段，每块计算完立即发送
+
+输入列：fluid（或 fluid_string）、input_type、value1、value2，其余列忽略；单位同 /calculate。
+输出列：row（输入文件中的数据行序号，从 0 开始）、输入四列、StateProperties 各性质、error。
+单行失败（缺列、数值无法解析、工质字符串错误、超出适用范围、REFPROP 错误）只写入该行的 error 列；
+响应开始后某块整体失败（准入重试后仍被拒绝等）时，该块各行的 error 列写入失败原因，作业继续；
+响应开始后读取输入文件失败（编码错误、CSV 格式错误、Parquet 数据损坏等）时，写出一行说明原因后正常结束文件。
+Parquet 需安装 pyarrow（可选依赖）。
+"""
+import csv
+import io
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from admission import admit
+from calc_pool import batch_timeout, pool_size, run_tasks
+from config import BULK_CHUNK_ROWS, BULK_TASK_POINTS
+from input_limits import InputOutOfRange, check_inputs, get_limits_many
+from refprop_engine import canonical_fluid_key
+from result_cache import LRUCache
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖：仅 Parquet 文件需要
+    pa = None
+    pq = None
+
+PARQUET_MAGIC = b"PAR1"
+INPUT_COLUMNS = ("fluid", "input_type", "value1", "value2")
+FLUID_ALIASES = ("fluid", "fluid_string")
+PROPERTY_COLUMNS = ("T", "P", "D", "H", "S", "Q", "CP", "CV", "W", "VIS", "TCX", "PRANDTL")
+OUTPUT_COLUMNS = ("row",) + INPUT_COLUMNS + PROPERTY_COLUMNS + ("error",)
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+ADMISSION_RETRIES = 20  # 后续分块准入被拒（429/503）时按 Retry-After 重试的次数
+ADMISSION_DEADLINE = 120.0  # 后续分块等待准入的总时长上限 [s]
+JOB_LIMITS_CACHE = 64   # 作业内缓存的工质范围数（逐行改变组成的混合物文件不会让其随文件增长）
+
+Row = Dict[str, Any]
+
+# 读取输入文件时可能出现的错误（Parquet 的 ArrowInvalid 同时是 ValueError）
+READ_ERRORS: Tuple[type, ...] = (csv.Error, UnicodeDecodeError, OSError)
+if pa is not None:
+    READ_ERRORS += (pa.ArrowException,)
+
+
+def detect_format(path: str) -> str:
+    """按文件头识别格式：Parquet 文件以 PAR1 开头，其余按 CSV 处理"""
+    with open(path, "rb") as f:
+        if f.read(len(PARQUET_MAGIC)) != PARQUET_MAGIC:
+            return "csv"
+    if pq is None:
+        raise ValueError("读取 Parquet 文件需要安装 pyarrow")
+    return "parquet"
+
+
+def _resolve_columns(names: Iterable[str]) -> Dict[str, str]:
+    """输入列名（不区分大小写）-> 文件中的列名；缺少必需列时抛出 ValueError"""
+    by_lower = {name.strip().lower(): name for name in names if name}
+    columns: Dict[str, str] = {}
+    for alias in FLUID_ALIASES:
+        if alias in by_lower:
+            columns["fluid"] = by_lower[alias]
+            break
+    for name in INPUT_COLUMNS[1:]:
+        if name in by_lower:
+            columns[name] = by_lower[name]
+    missing = [name for name in INPUT_COLUMNS if name not in columns]
+    if missing:
+        raise ValueError(f"输入文件缺少列: {', '.join(missing)}（需要 fluid、input_type、value1、value2）")
+    return columns
+
+
+def _iter_csv(path: str, chunk_rows: int) -> Iterator[List[Row]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        columns = _resolve_columns(reader.fieldnames or [])
+        chunk: List[Row] = []
+        for record in reader:
+            chunk.append({name: record.get(source) for name, source in columns.items()})
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _iter_parquet(path: str, chunk_rows: int) -> Iterator[List[Row]]:
+    parquet = pq.ParquetFile(path)
+    columns = _resolve_columns(parquet.schema_arrow.names)
+    for batch in parquet.iter_batches(batch_size=chunk_rows, columns=list(columns.values())):
+        data = {name: batch.column(source).to_pylist() for name, source in columns.items()}
+        yield [{name: data[name][i] for name in columns} for i in range(batch.num_rows)]
+
+
+def iter_chunks(path: str, fmt: str, chunk_rows: int = BULK_CHUNK_ROWS) -> Iterator[List[Row]]:
+    """按块读取输入文件，每块为 [{fluid, input_type, value1, value2}, ...]（值为原始内容，未校验）"""
+    if fmt == "parquet":
+        return _iter_parquet(path, chunk_rows)
+    return _iter_csv(path, chunk_rows)
+
+
+def _parse(row: Row) -> Tuple[str, str, str, float, float]:
+    """解析一行输入，返回 (工质字符串, 规范化工质键, 输入类型, value1, value2)；无效时抛出 ValueError"""
+    fluid = str(row["fluid"] or "").strip()
+    h_in = str(row["input_type"] or "").upper().strip()
+    if not fluid:
+        raise ValueError("fluid 为空")
+    if len(h_in) != 2:
+        raise ValueError(f"input_type 必须为两个字符，如 PT/PQ/PH。当前: {row['input_type']}")
+    try:
+        value1, value2 = float(row["value1"]), float(row["value2"])
+    except (TypeError, ValueError):
+        raise ValueError(f"value1/value2 不是数值: {row['value1']!r}, {row['value2']!r}")
+    return fluid, canonical_fluid_key(fluid), h_in, value1, value2
+
+
+def _chunk_limits(
+    client: str, parsed: Iterable[Tuple[str, str, str, float, float]], limits: LRUCache
+) -> Dict[str, Optional[dict]]:
+    """本块各工质的输入范围：作业内缓存未命中的工质一次批量查询（在 client 的准入下）"""
+    fluids = {key: fluid for fluid, key, *_ in parsed}
+    found = {key: limits.get(key) for key in fluids}
+    new = {key: fluids[key] for key, value in found.items() if value is None}
+    if new:
+        for key, value in get_limits_many(new, client).items():
+            found[key] = value
+            limits.put(key, value)
+    return found
+
+
+@contextmanager
+def _admit_chunk(client: str, n_points: int, slots: int, first: bool) -> Iterator[None]:
+    """
+    每块单独准入；首块的拒绝直接抛出（响应尚未开始），后续分块按 Retry-After 等待后重试，
+    重试次数不超过 ADMISSION_RETRIES、总等待不超过 ADMISSION_DEADLINE 秒
+    """
+    deadline = time.monotonic() + ADMISSION_DEADLINE
+    with ExitStack() as stack:
+        for attempt in range(ADMISSION_RETRIES + 1):
+            try:
+                stack.enter_context(admit(client, "calculate", n_points, slots))
+                break
+            except HTTPException as e:
+                wait = float((e.headers or {}).get("Retry-After", 1))
+                if (
+                    first
+                    or attempt == ADMISSION_RETRIES
+                    or e.status_code not in (429, 503)
+                    or time.monotonic() + wait > deadline
+                ):
+                    raise
+                time.sleep(wait)
+        yield
+
+
+def compute_chunk(client: str, rows: List[Row], limits: LRUCache, first: bool = False) -> List[Row]:
+    """
+    计算一块：按（工质, 输入类型）分组后切成任务并行计算，返回与 rows 一一对应的输出行（不含 row 列）
+
+    limits 为作业内的工质范围缓存（规范化工质键 -> 范围，定长 LRU），跨块复用。
+    """
+    outputs: List[Row] = [dict(row) for row in rows]
+    parsed: Dict[int, Tuple[str, str, str, float, float]] = {}
+    for i, row in enumerate(rows):
+        try:
+            parsed[i] = _parse(row)
+        except ValueError as e:
+            outputs[i]["error"] = str(e)
+    chunk_limits = _chunk_limits(client, parsed.values(), limits)
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for i, (fluid, key, h_in, value1, value2) in parsed.items():
+        outputs[i].update(fluid=fluid, input_type=h_in, value1=value1, value2=value2)
+        try:
+            check_inputs(chunk_limits[key], h_in, value1, value2)
+        except InputOutOfRange as e:
+            outputs[i]["error"] = str(e)
+            continue
+        groups.setdefault((key, h_in), []).append(i)
+
+    tasks: List[List[int]] = []
+    for indices in groups.values():
+        tasks.extend(indices[lo:lo + BULK_TASK_POINTS] for lo in range(0, len(indices), BULK_TASK_POINTS))
+    if not tasks:
+        return outputs
+    kwargs_list = [
+        {
+            "fluid_string": outputs[indices[0]]["fluid"],
+            "input_type": outputs[indices[0]]["input_type"],
+            "points": [[outputs[i]["value1"], outputs[i]["value2"]] for i in indices],
+        }
+        for indices in tasks
+    ]
+    n_points = sum(len(indices) for indices in tasks)
+    timeout = batch_timeout(max(len(indices) for indices in tasks))
+    with _admit_chunk(client, n_points, min(len(tasks), pool_size()), first):
+        for t, items, err in run_tasks("calculate_batch", kwargs_list, timeout):
+            for i, item in zip(tasks[t], items if err is None else [{"error": err}] * len(tasks[t])):
+                if "result" in item:
+                    outputs[i].update({name: item["result"].get(name) for name in PROPERTY_COLUMNS})
+                else:
+                    outputs[i]["error"] = item["error"]
+    return outputs
+
+
+class _Drain(io.RawIOBase):
+    """只写缓冲：Parquet 写入器写出的字节暂存于此，每块结束后取走发送"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._size
+
+    def take(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+class CsvWriter:
+    """把输出行编码为 CSV 片段（首个片段含表头）"""
+
+    def __init__(self):
+        self._header = True
+
+    def write(self, rows: List[Row]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if self._header:
+            writer.writerow(OUTPUT_COLUMNS)
+            self._header = False
+        for row in rows:
+            writer.writerow(["" if row.get(name) is None else row.get(name) for name in OUTPUT_COLUMNS])
+        return buffer.getvalue().encode("utf-8")
+
+    def close(self) -> bytes:
+        return self.write([]) if self._header else b""
+
+
+class ParquetWriter:
+    """把输出行编码为 Parquet：每块一个行组，文件尾（元数据）在 close 时写出"""
+
+    def __init__(self):
+        self._closed = False
+        fields = [pa.field("row", pa.int64())]
+        fields += [pa.field(name, pa.string()) for name in ("fluid", "input_type")]
+        fields += [pa.field(name, pa.float64()) for name in ("value1", "value2") + PROPERTY_COLUMNS]
+        fields += [pa.field("error", pa.string())]
+        self._schema = pa.schema(fields)
+        self._sink = _Drain()
+        self._writer = pq.ParquetWriter(self._sink, self._schema)
+
+    @staticmethod
+    def _cell(row: Row, field) -> Any:
+        value = row.get(field.name)
+        if value is None or pa.types.is_string(field.type):
+            return None if value is None else str(value)
+        try:
+            return int(value) if pa.types.is_integer(field.type) else float(value)
+        except (TypeError, ValueError):
+            return None  # 无法解析的原始输入值（该行 error 列已说明）
+
+    def write(self, rows: List[Row]) -> bytes:
+        columns = {field.name: [self._cell(row, field) for row in rows] for field in self._schema}
+        self._writer.write_table(pa.Table.from_pydict(columns, schema=self._schema))
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        """写出文件尾；重复调用返回空字节"""
+        if self._closed:
+            return b""
+        self._closed = True
+        self._writer.close()
+        return self._sink.take()
+
+
+def _failed_chunk(rows: List[Row], e: Exception) -> List[Row]:
+    """整块失败时的输出行：各行保留原始输入，error 列为失败原因"""
+    message = e.detail if isinstance(e, HTTPException) else str(e)
+    return [dict(row, error=f"本块计算失败: {message}") for row in rows]
+
+
+def _read_failure(offset: int, e: Exception) -> Row:
+    """读取输入文件中途失败时的输出行：row 为第一个未能读出的数据行序号"""
+    return {"row": offset, "error": f"读取输入文件失败，此后各行未计算: {e}"}
+
+
+def run_job(client: str, path: str, fmt: str, chunk_rows: int = BULK_CHUNK_ROWS) -> Iterator[Optional[bytes]]:
+    """
+    执行批量作业：首次迭代完成首块的读取、准入与计算后产出 None（由路由同步执行，
+    格式错误与准入拒绝在响应开始前抛出），然后依次产出输出文件的字节片段
+
+    响应开始后不再抛出计算、准入与读取错误（否则客户端收到截断的 CSV 或没有文件尾的 Parquet）：
+    分块计算失败时把原因写入该块各行的 error 列，读取输入文件失败时写出一行说明后正常结束文件；
+    任何情况下都会关闭写入器。
+    """
+    writer = ParquetWriter() if fmt == "parquet" else CsvWriter()
+    try:
+        limits = LRUCache(JOB_LIMITS_CACHE)
+        offset = 0
+        first = True
+        chunks = iter_chunks(path, fmt, chunk_rows)
+        while True:
+            failure = None
+            try:
+                rows = next(chunks, None)
+            except READ_ERRORS as e:
+                if first:
+                    raise
+                rows, failure = None, _read_failure(offset, e)
+            if failure is not None:
+                yield writer.write([failure])
+            if rows is None:
+                break
+            try:
+                outputs = compute_chunk(client, rows, limits, first)
+            except Exception as e:
+                if first:
+                    raise
+                outputs = _failed_chunk(rows, e)
+            for i, row in enumerate(outputs):
+                row["row"] = offset + i
+            offset += len(rows)
+            if first:
+                yield None
+                first = False
+            yield writer.write(outputs)
+        if first:
+            yield None
+        yield writer.close()
+    finally:
+        writer.close()  # 首块出错、客户端断开等提前结束时释放 Parquet 写入器
@@ -0,0 +1,614 @@
+"""
+REFPROP 计算子进程池（看门狗监督）
+近临界闪蒸或不收敛的状态可能让 REFPROP 长时间卡住；此前只能依赖 gunicorn 的 worker 超时，
+会连带杀掉该 worker 上正在处理的所有请求。
+
+每个 gunicorn worker 常驻 CALC_PROCESSES 个计算子进程 + CALC_SPARES 个预热备用进程：
+  - 每次调用带截止时间，超时则杀掉该计算进程，由预热好的备用进程顶替，后台再补充新的备用进程
+  - 调用方收到 CalculationTimeout（路由返回 504），同 worker 的其他请求不受影响
+  - 计算进程意外退出同样会被替换，调用方收到 RuntimeError（500）
+每个计算进程单线程串行执行，REFPROP 的 Fortran 全局状态不会被并发请求互相踩踏。
+
+工质亲和调度（CALC_AFFINITY）：按规范化工质键在一致性哈希环上确定首选计算进程，
+首选进程忙时沿哈希环溢出到下一个空闲进程。同一工质总落在少数固定进程上，
+配合进程内的工质设置 LRU（refprop_session）减少重新设置工质的次数。
+
+线程模式（CALC_MODE=thread，ThreadCalculatorPool）：计算器为 worker 进程内的线程，每个线程独占一组
+librefprop.so 独立副本（refprop_session.Session），REFPROP 调用经 ctypes 释放 GIL，可真正并行。
+一个 worker 即可并行 CALC_PROCESSES 个计算并共享同一份进程内缓存，省去多个 worker 重复的 Python 运行时。
+代价是超时的线程无法强杀：调用方照常收到 CalculationTimeout，该线程被弃用（算完后自行退出），
+槽位由预热备用线程顶替；弃用线程的库副本在其退出前仍占用内存（/stats 的 abandoned_alive）。
+"""
+import bisect
+import importlib
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    CALC_AFFINITY,
+    CALC_MODE,
+    CALC_PROCESSES,
+    CALC_SPARES,
+    CALC_TIMEOUT_BATCH,
+    CALC_TIMEOUT_CALCULATE,
+    CALC_TIMEOUT_CHART,
+    CALC_TIMEOUT_DOME,
+    CALC_TIMEOUT_FLUID_INFO,
+    FLUIDS_PATH,
+    RPPREFIX,
+)
+from refprop_engine import canonical_fluid_key
+
+# 可在计算进程中执行的任务：任务名 -> "模块:函数"
+TASKS: Dict[str, str] = {
+    "calculate": "refprop_engine:calculate_properties",
+    "calculate_batch": "refprop_engine:calculate_batch",
+    "dome": "dome_engine:compute_saturation_dome",
+    "chart": "dome_engine:compute_ph_chart",
+    "fluid_info": "fluid_info:get_fluid_info",
+    "fluid_info_batch": "fluid_info:get_fluid_info_batch",
+    "fluid_limits": "fluid_info:get_fluid_limits",
+    "hx_profile": "hx_profile:compute_hx_profile",
+    "compressor_points": "compressor_map:compute_compressor_points",
+}
+
+# 各任务默认超时 [s]
+TASK_TIMEOUTS: Dict[str, float] = {
+    "calculate": CALC_TIMEOUT_CALCULATE,
+    "calculate_batch": CALC_TIMEOUT_CALCULATE,
+    "dome": CALC_TIMEOUT_DOME,
+    "chart": CALC_TIMEOUT_CHART,
+    "fluid_info": CALC_TIMEOUT_FLUID_INFO,
+    "fluid_info_batch": CALC_TIMEOUT_FLUID_INFO,
+    "fluid_limits": CALC_TIMEOUT_FLUID_INFO,
+    "hx_profile": CALC_TIMEOUT_BATCH,
+    "compressor_points": CALC_TIMEOUT_BATCH,
+}
+
+READY_TIMEOUT = 30.0  # 计算进程预热（导入模块、加载 librefprop.so）最长等待 [s]
+RING_VNODES = 64      # 一致性哈希环上每个计算进程的虚拟节点数
+
+# 计算进程上报的工质设置统计（refprop_session.setup_stats）-> 进程池累计计数器
+SETUP_COUNTERS: Dict[str, str] = {
+    "setup_hits": "hits",
+    "setup_switches": "switches",
+    "spline_fits": "spline_fits",
+    "spline_reuses": "spline_reuses",
+}
+
+
+class CalculationTimeout(Exception):
+    """计算超时：对应计算进程已被终止并替换"""
+
+
+def _resolve(task: str) -> Callable[..., Any]:
+    """按任务名解析出实际执行的函数"""
+    target = TASKS.get(task)
+    if target is None:
+        raise ValueError(f"未知的计算任务: {task}")
+    module_name, func_name = target.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _warm_up() -> None:
+    """预热：导入全部计算模块并加载一次 REFPROP 库，使首个请求无需承担加载开销"""
+    for task in TASKS:
+        _resolve(task)
+    if RPPREFIX and os.path.isdir(RPPREFIX):
+        try:
+            from refprop_session import get_rp
+
+            get_rp(None, RPPREFIX, FLUIDS_PATH)
+        except Exception:
+            pass  # 加载失败时由具体调用返回明确的错误信息
+
+
+def _calculator_main(conn) -> None:
+    """计算子进程主循环：接收 (任务名, 参数)，返回 (状态, 结果, 工质设置统计)"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # 由父进程统一管理生命周期
+    _warm_up()
+    from refprop_session import setup_stats
+
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break  # 父进程已退出
+        if msg is None:
+            break
+        task, kwargs = msg
+        try:
+            reply = ("ok", _resolve(task)(**kwargs))
+        except ValueError as e:
+            reply = ("value_error", str(e))
+        except Exception as e:
+            reply = ("runtime_error", str(e) or type(e).__name__)
+        conn.send(reply + (setup_stats(),))
+
+
+class _Calculator:
+    """一个计算子进程及其管道"""
+
+    def __init__(self, ctx):
+        parent_conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(
+            target=_calculator_main,
+            args=(child_conn,),
+            name="refprop-calculator",
+            daemon=True,
+        )
+        self.proc.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.calls = 0
+        self.setups: dict = {}  # 该进程最近一次上报的工质设置统计
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.proc.pid
+
+    def wait_ready(self, timeout: float = READY_TIMEOUT) -> bool:
+        try:
+            if self.conn.poll(timeout):
+                return self.conn.recv()[0] == "ready"
+        except (EOFError, OSError):
+            pass
+        return False
+
+    def kill(self) -> None:
+        try:
+            self.proc.kill()
+            self.proc.join(1.0)
+        finally:
+            self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.proc.join(1.0)
+        if self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join(1.0)
+        self.conn.close()
+
+
+class CalculatorPool:
+    """固定数量的计算子进程 + 预热备用进程；调用线程安全"""
+
+    mode = "process"
+
+    def __init__(self, size: int = CALC_PROCESSES, spares: int = CALC_SPARES):
+        self.size = max(int(size), 1)
+        self.n_spares = max(int(spares), 0)
+        self._ctx = mp.get_context("spawn")  # gunicorn worker 内有线程，避免 fork 继承锁状态
+        self._slots: List[_Calculator] = []
+        self._busy: List[bool] = []
+        self._spares: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.counters = {
+            "calls": 0,
+            "timeouts": 0,
+            "crashes": 0,
+            "replacements": 0,
+            "affinity_home": 0,    # 落在首选进程的调用
+            "affinity_spills": 0,  # 首选进程忙、溢出到其他进程的调用
+            "setup_hits": 0,       # 工质设置已常驻、直接复用
+            "setup_switches": 0,   # 需重新设置工质
+            "spline_fits": 0,      # 混合物 SATSPLN 样条拟合
+            "spline_reuses": 0,    # 复用已拟合的样条
+        }
+        self._ring = sorted(
+            (zlib.crc32(f"calculator-{idx}#{v}".encode()), idx)
+            for idx in range(self.size)
+            for v in range(RING_VNODES)
+        )
+
+    def start(self) -> None:
+        calcs = [_Calculator(self._ctx) for _ in range(self.size + self.n_spares)]
+        for calc in calcs:
+            if not calc.wait_ready():
+                raise RuntimeError(f"计算进程启动失败 (pid={calc.pid})")
+        self._slots = calcs[: self.size]
+        self._busy = [False] * self.size
+        self._spares.extend(calcs[self.size:])
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            calcs = self._slots + list(self._spares)
+            self._spares.clear()
+        for calc in calcs:
+            calc.stop()
+
+    def _ring_order(self, key: str) -> List[int]:
+        """工质键在哈希环上对应的计算进程优先顺序（首项为首选进程）"""
+        pos = bisect.bisect(self._ring, (zlib.crc32(key.encode()), -1))
+        order: List[int] = []
+        for i in range(len(self._ring)):
+            idx = self._ring[(pos + i) % len(self._ring)][1]
+            if idx not in order:
+                order.append(idx)
+                if len(order) == self.size:
+                    break
+        return order
+
+    def _acquire(self, affinity: Optional[str] = None) -> int:
+        order = self._ring_order(affinity) if affinity else list(range(self.size))
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("计算进程池已关闭")
+                for i in order:
+                    if not self._busy[i]:
+                        self._busy[i] = True
+                        if affinity:
+                            self.counters["affinity_home" if i == order[0] else "affinity_spills"] += 1
+                        return i
+                self._cond.wait()
+
+    def _release(self, idx: int) -> None:
+        with self._cond:
+            self._busy[idx] = False
+            self._cond.notify_all()  # 等待者的首选进程各不相同，全部唤醒后各自按优先顺序抢占
+
+    def _spawn_spares(self) -> None:
+        """后台补充预热备用进程"""
+        while True:
+            with self._cond:
+                if self._closed or len(self._spares) >= self.n_spares:
+                    return
+            calc = _Calculator(self._ctx)
+            if not calc.wait_ready():
+                calc.kill()
+                return
+            with self._cond:
+                if self._closed:
+                    calc.stop()
+                    return
+                self._spares.append(calc)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._cond:
+            self.counters[name] += n
+
+    def _replace(self, idx: int) -> None:
+        """
+        杀掉第 idx 个计算进程，用预热备用进程（无备用时现场新建）顶替
+
+        新计算器未能就绪时抛出 RuntimeError，槽位保留已杀掉的计算器：下次调用发送失败时再次替换，
+        不会把启动失败的计算器放进槽位。调用方持有该槽位。
+        """
+        self._slots[idx].kill()
+        with self._cond:
+            spare = self._spares.popleft() if self._spares else None
+        if spare is None or not spare.proc.is_alive():
+            if spare is not None:
+                spare.kill()
+            spare = _Calculator(self._ctx)
+            if not spare.wait_ready():
+                spare.kill()
+                raise RuntimeError("REFPROP 计算进程启动失败，请稍后重试。")
+        self._slots[idx] = spare
+        self._count("replacements")
+        threading.Thread(target=self._spawn_spares, name="calculator-spares", daemon=True).start()
+
+    def call(self, task: str, timeout: float, affinity: Optional[str] = None, **kwargs) -> Any:
+        """
+        在空闲计算进程中执行任务；超时抛出 CalculationTimeout
+        
+        affinity 为规范化工质键时优先选择哈希环上的首选进程，None 时取任一空闲进程。
+        """
+        idx = self._acquire(affinity)
+        try:
+            calc = self._slots[idx]
+            try:
+                calc.conn.send((task, kwargs))
+            except (OSError, ValueError):
+                # 空闲期间进程已退出（或上次替换失败）：请求尚未执行，替换后重发一次
+                self._replace(idx)
+                calc = self._slots[idx]
+                try:
+                    calc.conn.send((task, kwargs))
+                except (OSError, ValueError):
+                    raise RuntimeError("REFPROP 计算进程不可用，请稍后重试。")
+            calc.calls += 1
+            self._count("calls")
+            try:
+                if not calc.conn.poll(timeout):
+                    self._count("timeouts")
+                    try:
+                        self._replace(idx)
+                    except RuntimeError:
+                        pass  # 下次使用该槽位时再替换；本次调用仍按超时返回
+                    raise CalculationTimeout(
+                        f"REFPROP 计算超时（>{timeout:g} s），已终止该计算进程。"
+                    )
+                status, payload, setups = calc.conn.recv()
+            except (EOFError, OSError):
+                self._count("crashes")
+                self._replace(idx)
+                raise RuntimeError("REFPROP 计算进程异常退出，已自动重启，请重试。")
+            with self._cond:
+                for name, key in SETUP_COUNTERS.items():
+                    self.counters[name] += setups.get(key, 0) - calc.setups.get(key, 0)
+            calc.setups = setups
+        finally:
+            self._release(idx)
+
+        if status == "ok":
+            return payload
+        if status == "value_error":
+            raise ValueError(payload)
+        raise RuntimeError(payload)
+
+    def idle(self) -> int:
+        """当前空闲的计算进程数"""
+        with self._cond:
+            return self._busy.count(False)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "mode": self.mode,
+                "size": self.size,
+                "busy": sum(self._busy),
+                "spares_ready": len(self._spares),
+                "calculators": [
+                    {
+                        "pid": c.pid,
+                        "calls": c.calls,
+                        "busy": b,
+                        "fluids_loaded": c.setups.get("loaded", []),
+                        "library_instances": c.setups.get("instances"),
+                        "setup_switches": c.setups.get("switches", 0),
+                    }
+                    for c, b in zip(self._slots, self._busy)
+                ],
+                **self.counters,
+            }
+
+
+class _ThreadCalculator:
+    """一个计算线程：绑定独立的 refprop_session.Session，经队列串行执行任务"""
+
+    def __init__(self):
+        from refprop_session import Session
+
+        self.session = Session(isolated=True)
+        self.inbox: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.ready = threading.Event()
+        self.calls = 0
+        self.setups: dict = {}
+        self.thread = threading.Thread(target=self._main, name="refprop-thread-calculator", daemon=True)
+        self.thread.start()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.thread.native_id
+
+    def _main(self) -> None:
+        from refprop_session import bind_session, setup_stats
+
+        bind_session(self.session)
+        _warm_up()
+        self.ready.set()
+        while True:
+            msg = self.inbox.get()
+            if msg is None:
+                break
+            task, kwargs, outbox = msg
+            try:
+                reply = ("ok", _resolve(task)(**kwargs))
+            except ValueError as e:
+                reply = ("value_error", str(e))
+            except Exception as e:
+                reply = ("runtime_error", str(e) or type(e).__name__)
+            outbox.put(reply + (setup_stats(),))
+
+    def wait_ready(self, timeout: float = READY_TIMEOUT) -> bool:
+        return self.ready.wait(timeout)
+
+    def stop(self) -> None:
+        """任务执行完后退出（不等待；卡住的线程无法强制结束）"""
+        self.inbox.put(None)
+
+
+class ThreadCalculatorPool(CalculatorPool):
+    """CALC_MODE=thread：计算器为进程内线程，各自使用独立的 librefprop.so 副本；调度与进程模式相同"""
+
+    mode = "thread"
+
+    def __init__(self, size: int = CALC_PROCESSES, spares: int = CALC_SPARES):
+        super().__init__(size, spares)
+        self.counters["abandoned"] = 0  # 超时后弃用的计算线程
+        self._abandoned: List[_ThreadCalculator] = []
+
+    def start(self) -> None:
+        calcs = [_ThreadCalculator() for _ in range(self.size + self.n_spares)]
+        for calc in calcs:
+            if not calc.wait_ready():
+                raise RuntimeError("计算线程预热超时")
+        self._slots = calcs[: self.size]
+        self._busy = [False] * self.size
+        self._spares.extend(calcs[self.size:])
+
+    def _spawn_spares(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed or len(self._spares) >= self.n_spares:
+                    return
+            calc = _ThreadCalculator()
+            if not calc.wait_ready():
+                calc.stop()
+                return
+            with self._cond:
+                if self._closed:
+                    calc.stop()
+                    return
+                self._spares.append(calc)
+
+    def _replace(self, idx: int) -> None:
+        """弃用第 idx 个计算线程（算完当前任务后退出），用预热备用线程顶替；调用方持有该槽位"""
+        stuck = self._slots[idx]
+        stuck.stop()
+        with self._cond:
+            self._abandoned = [c for c in self._abandoned if c.thread.is_alive()] + [stuck]
+            spare = self._spares.popleft() if self._spares else None
+        if spare is None:
+            spare = _ThreadCalculator()
+            if not spare.wait_ready():
+                spare.stop()
+                raise RuntimeError("REFPROP 计算线程启动失败，请稍后重试。")
+        self._slots[idx] = spare
+        self._count("abandoned")
+        self._count("replacements")
+        threading.Thread(target=self._spawn_spares, name="calculator-spares", daemon=True).start()
+
+    def call(self, task: str, timeout: float, affinity: Optional[str] = None, **kwargs) -> Any:
+        idx = self._acquire(affinity)
+        try:
+            calc = self._slots[idx]
+            outbox: "queue.Queue[tuple]" = queue.Queue(maxsize=1)  # 每次调用独立，弃用线程迟到的结果无人读取
+            calc.inbox.put((task, kwargs, outbox))
+            calc.calls += 1
+            self._count("calls")
+            try:
+                status, payload, setups = outbox.get(timeout=timeout)
+            except queue.Empty:
+                self._count("timeouts")
+                try:
+                    self._replace(idx)
+                except RuntimeError:
+                    pass
+                raise CalculationTimeout(f"REFPROP 计算超时（>{timeout:g} s），已弃用该计算线程。")
+            with self._cond:
+                for name, key in SETUP_COUNTERS.items():
+                    self.counters[name] += setups.get(key, 0) - calc.setups.get(key, 0)
+            calc.setups = setups
+        finally:
+            self._release(idx)
+
+        if status == "ok":
+            return payload
+        if status == "value_error":
+            raise ValueError(payload)
+        raise RuntimeError(payload)
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            calcs = self._slots + list(self._spares)
+            self._spares.clear()
+        for calc in calcs:
+            calc.stop()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._cond:
+            alive = [c for c in self._abandoned if c.thread.is_alive()]
+            stats["abandoned_alive"] = len(alive)
+            # 本进程内全部计算线程（含备用、弃用但未退出的线程）已加载的库实例数
+            stats["library_instances"] = sum(c.session.n_loaded for c in self._slots + list(self._spares) + alive)
+        return stats
+
+
+_pool: Optional[CalculatorPool] = None
+
+
+def start_pool() -> None:
+    """在当前 worker 进程中启动计算进程池（CALC_PROCESSES=0 时不启动）"""
+    global _pool
+    if CALC_PROCESSES <= 0 or _pool is not None:
+        return
+    pool = ThreadCalculatorPool() if CALC_MODE == "thread" else CalculatorPool()
+    pool.start()
+    _pool = pool
+
+
+def stop_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def _affinity_key(kwargs: dict) -> Optional[str]:
+    """按单一工质参数 fluid_string 确定亲和键；多工质任务或关闭亲和调度时为 None"""
+    fluid = kwargs.get("fluid_string")
+    if not CALC_AFFINITY or not fluid:
+        return None
+    try:
+        return canonical_fluid_key(fluid)
+    except ValueError:
+        return None  # 工质字符串无效，由计算函数返回明确的错误
+
+
+def run_task(task: str, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    执行计算任务
+
+    进程池已启动时在计算子进程中执行并受超时保护；
+    否则（CALC_PROCESSES=0 或脚本直接调用）在当前进程内直接执行。
+    """
+    if _pool is None:
+        return _resolve(task)(**kwargs)
+    timeout = timeout if timeout is not None else TASK_TIMEOUTS[task]
+    return _pool.call(task, timeout, _affinity_key(kwargs), **kwargs)
+
+
+def run_tasks(
+    task: str,
+    kwargs_list: List[dict],
+    timeout: Optional[float] = None,
+) -> Iterator[Tuple[int, Any, Optional[str]]]:
+    """
+    在各计算进程间并行执行同一任务的多组参数，按完成顺序产出 (序号, 结果, 错误信息)
+    
+    单组失败（参数错误、REFPROP 错误、超时）只体现在该组的错误信息中；
+    迭代提前结束（如流式响应的客户端断开）时取消尚未开始的任务。
+    """
+    if not kwargs_list:
+        return
+    executor = ThreadPoolExecutor(max_workers=min(len(kwargs_list), pool_size()))
+    try:
+        futures = {
+            executor.submit(run_task, task, timeout, **kwargs): i
+            for i, kwargs in enumerate(kwargs_list)
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except (ValueError, RuntimeError, CalculationTimeout) as e:
+                yield futures[future], None, str(e)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def batch_timeout(n_items: int, per_item: float = CALC_TIMEOUT_CALCULATE) -> float:
+    """一次调用依次计算 n_items 项的任务超时：按项数累加，不超过 CALC_TIMEOUT_BATCH"""
+    return min(per_item * max(int(n_items), 1), max(CALC_TIMEOUT_BATCH, per_item))
+
+
+def pool_size() -> int:
+    """可并行执行任务的计算进程数；未启用进程池时为 1（REFPROP 不可在同一进程内并发调用）"""
+    return _pool.size if _pool is not None else 1
+
+
+def pool_idle() -> int:
+    """空闲的计算进程数；未启用进程池时为 1（任务在调用线程内直接执行，无需等待计算进程）"""
+    return _pool.idle() if _pool is not None else 1
+
+
+def pool_stats() -> Optional[dict]:
+    return _pool.stats() if _pool is not None else None
@@ -0,0 +1,203 @@
+"""
+生产流量抓取（CAPTURE_PATH 非空时开启，供 replay.py 回放）
+合成基准无法反映真实的工质分布、输入类型与突发请求；抓取真实流量后在本机按原速（或加速）回放，
+检验性能改动对实际负载是否有效。
+
+CaptureMiddleware 记录 /calculate、/dome、/fluid-info 的 POST 请求，每行一条 JSON：
+  {"t": 到达时间（Unix 秒）, "p": 路径, "c": 客户端摘要, "s": 状态码, "ms": 耗时 [ms], "b": 脱敏请求体}
+  - 请求体只保留 CAPTURED_FIELDS 中的字段（字符串截断至 STRING_MAX），无法解析时为 null
+  - 不记录 API Key、来源 IP 与任何请求头；客户端只保存摘要（与准入控制相同），回放时据此区分客户端
+写入不在请求路径上：放入有界队列，由后台线程批量追加到本 worker 的 capture-<pid>.jsonl，队列满时放弃。
+文件超过 CAPTURE_FILE_MB 时轮转为 capture-<pid>-<毫秒时间戳>.jsonl，目录内已轮转的文件
+（全部 worker 合计）超过 CAPTURE_MAX_FILES 时删除最旧的。
+"""
+import glob
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from admission import client_digest
+from config import CAPTURE_FILE_MB, CAPTURE_MAX_FILES, CAPTURE_PATH, CAPTURE_SAMPLE
+from dependencies import scope_identity
+
+# 抓取的路径 -> 保留的请求体字段
+CAPTURED_FIELDS: Dict[str, tuple] = {
+    "/calculate": ("fluid_string", "input_type", "value1", "value2", "derivatives", "jacobian"),
+    "/dome": ("fluid_string", "mode"),
+    "/fluid-info": ("fluid_string",),
+}
+MAX_BODY_BYTES = 64 * 1024  # 超过此大小的请求体不解析（只记录时间与状态）
+STRING_MAX = 200            # 字符串字段的最大长度
+QUEUE_MAX = 4096            # 待写入队列上限，满时放弃新的记录
+WRITE_BATCH = 256           # 后台线程每次最多写入的条数
+
+
+def sanitize(path: str, raw: bytes) -> Optional[dict]:
+    """请求体脱敏：只保留该路径的已知字段；无法解析或过大时返回 None"""
+    if len(raw) > MAX_BODY_BYTES:
+        return None
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    clean = {}
+    for name in CAPTURED_FIELDS.get(path, ()):
+        if name not in body:
+            continue
+        value = body[name]
+        if isinstance(value, str):
+            value = value[:STRING_MAX]
+        elif isinstance(value, list):
+            value = [v[:STRING_MAX] if isinstance(v, str) else v for v in value[:32]]
+        elif not isinstance(value, (int, float, bool)) and value is not None:
+            continue
+        clean[name] = value
+    return clean
+
+
+class CaptureWriter:
+    """抓取记录的后台写入与文件轮转"""
+
+    def __init__(self, directory: str, file_mb: float = CAPTURE_FILE_MB, max_files: int = CAPTURE_MAX_FILES):
+        self.directory = directory
+        self.max_bytes = int(file_mb * 1024 * 1024)
+        self.max_files = max(int(max_files), 1)
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f"capture-{self.pid}.jsonl")
+        self._queue: "queue.Queue[dict]" = queue.Queue(QUEUE_MAX)
+        self._lock = threading.Lock()
+        self.counters = {"recorded": 0, "dropped": 0, "rotations": 0, "errors": 0}
+        self._rotated_at = 0
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._write_loop, name="capture-writer", daemon=True).start()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def record(self, entry: dict) -> None:
+        """放入后台队列，立即返回"""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._count("dropped")
+
+    def flush(self) -> None:
+        """等待已排队的记录写入完成"""
+        self._queue.join()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                data = "".join(json.dumps(e, separators=(",", ":"), ensure_ascii=False) + "\n" for e in batch)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(data)
+                    size = f.tell()
+                self._count("recorded", len(batch))
+                if size >= self.max_bytes:
+                    self._rotate()
+            except (OSError, TypeError, ValueError):
+                self._count("errors")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _rotate(self) -> None:
+        self._rotated_at = max(int(time.time() * 1000), self._rotated_at + 1)  # 同一毫秒内多次轮转不覆盖
+        os.replace(self.path, os.path.join(self.directory, f"capture-{self.pid}-{self._rotated_at}.jsonl"))
+        self._count("rotations")
+        rotated = sorted(
+            glob.glob(os.path.join(self.directory, "capture-*-*.jsonl")),
+            key=lambda p: int(os.path.basename(p)[: -len(".jsonl")].rsplit("-", 1)[1]),  # 按轮转时间戳
+        )
+        for path in rotated[: max(len(rotated) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # 其他 worker 已删除
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        return {"path": self.path, "pending": self._queue.qsize(), **counters}
+
+
+class CaptureMiddleware:
+    """ASGI 中间件：按 CAPTURE_SAMPLE 抽样记录 CAPTURED_FIELDS 中路径的 POST 请求"""
+
+    def __init__(self, app, writer: Optional[CaptureWriter] = None, sample: float = CAPTURE_SAMPLE):
+        self.app = app
+        self.writer = writer
+        self.sample = sample
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope.get("method") != "POST"
+            or scope.get("path") not in CAPTURED_FIELDS
+            or random.random() >= self.sample
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.time()
+        start = time.perf_counter()
+        chunks = []
+        status = [500]  # 应用未发出响应即抛出异常时按 500 记录
+
+        async def receive_body():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, send_status)
+        finally:
+            path = scope["path"]
+            get_writer(self.writer).record({
+                "t": round(arrived, 3),
+                "p": path,
+                "c": client_digest(scope_identity(scope)),
+                "s": status[0],
+                "ms": round((time.perf_counter() - start) * 1000.0, 2),
+                "b": sanitize(path, b"".join(chunks)),
+            })
+
+
+_writer: Optional[CaptureWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(writer: Optional[CaptureWriter] = None) -> CaptureWriter:
+    """指定的写入器，或本 worker 的单例（首次抓取时创建，gunicorn worker 各自一个文件）"""
+    global _writer
+    if writer is not None:
+        return writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = CaptureWriter(CAPTURE_PATH)
+    return _writer
+
+
+def capture_stats() -> Optional[dict]:
+    """抓取统计（供 /stats 使用）；未开启或尚未抓取时为 None"""
+    return _writer.stats() if _writer is not None else None
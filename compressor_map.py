@@ -0,0 +1,192 @@
+"""
+压缩机性能图与 AHRI 540 多项式拟合
+拟合 AHRI 540 十系数多项式、或在蒸发/冷凝温度网格上绘制等熵效率、排气温度、质量流量图，
+每个网格点需要饱和压力、吸气状态 (PT)、等熵压缩终点 (PS)、实际排气状态 (PH) 与冷凝器出口状态等多次计算。
+
+compute_compressor_points 在一个计算进程、一次工质设置内依次计算一组网格点（路由把网格分块后
+在各计算进程间并行）；fit_ahri540 在 API 进程内对汇总后的性能图做最小二乘拟合。
+
+压缩机模型：
+  - 蒸发、冷凝温度为饱和露点温度（AHRI 540），吸气过热度、冷凝器出口过冷度给定
+  - 等熵效率、容积效率为压比 PR = P_cond / P_evap 的多项式 η = Σ c_k · PR^k（只给一个系数即为常数）
+  - 质量流量 = η_vol × 理论排量 × 吸气密度；制冷量按蒸发器进出口焓差，功率按实际压缩焓升
+
+单位：T [K]，P [kPa]，排量 [m³/h]，质量流量 [kg/s]，制冷量/功率 [W]；
+AHRI 540 多项式的自变量 S（蒸发露点）、D（冷凝露点）为 °C。
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from refprop_engine import KPA_TO_PA, canonical_fluid_key, flash, molar_base_si, parse_fluid_string
+from refprop_session import get_rp, mark_spline_fitted, spline_flag
+
+SUPERHEAT_DEFAULT = 11.1   # 吸气过热度 [K]（AHRI 540 额定工况 20 °F）
+SUBCOOLING_DEFAULT = 8.3   # 冷凝器出口过冷度 [K]（AHRI 540 额定工况 15 °F）
+KELVIN_OFFSET = 273.15
+AHRI540_TERMS = 10
+AHRI540_FITTED = ("mass_flow", "capacity", "power")  # 拟合的性能参数
+RANK_TOLERANCE = 1e-10     # QR 分解对角元相对最大值低于此值视为秩亏
+
+
+def _efficiency(coefficients: Sequence[float], ratio: float) -> float:
+    return sum(c * ratio ** k for k, c in enumerate(coefficients))
+
+
+def compute_compressor_points(
+    fluid_string: str,
+    points: Sequence[Sequence[float]],
+    displacement: float,
+    superheat: float = SUPERHEAT_DEFAULT,
+    subcooling: float = SUBCOOLING_DEFAULT,
+    isentropic: Sequence[float] = (0.7,),
+    volumetric: Sequence[float] = (0.9,),
+    rpprefix: Optional[str] = None,
+    fluids_path: Optional[str] = None,
+) -> List[dict]:
+    """
+    计算一组 (蒸发露点温度, 冷凝露点温度) 网格点的压缩机性能
+
+    Args:
+        points: [(T_evap, T_cond), ...] [K]
+        displacement: 理论排量 [m³/h]
+        superheat, subcooling: 吸气过热度、冷凝器出口过冷度 [K]
+        isentropic, volumetric: 等熵效率、容积效率对压比的多项式系数（常数项在前）
+
+    Returns:
+        与 points 顺序一致的列表，每项为 {"result": {...}} 或 {"error": 错误信息}；单点失败不影响其他点
+    """
+    refprop_fluid, z = parse_fluid_string(fluid_string)
+    RP = get_rp(canonical_fluid_key(fluid_string), rpprefix, fluids_path)
+    iflag = spline_flag(RP) if "*" in refprop_fluid else 0
+    r = RP.REFPROPdll(refprop_fluid, "CRIT", "M", molar_base_si(RP), 0, iflag, 0.0, 0.0, list(z))
+    if r.ierr > 100:
+        raise RuntimeError(f"REFPROP 获取分子量失败 (ierr={r.ierr}): {r.herr.strip()}")
+    if iflag:
+        mark_spline_fitted(RP)
+    mol_mass = float(r.Output[0])  # [kg/mol]（MOLAR BASE SI）
+
+    def solve(h_in: str, p: float, b: float) -> dict:
+        """以压力 [kPa] 与另一输入（T/S/H/Q，MOLAR BASE SI 与 API 单位相同）闪蒸"""
+        return flash(RP, refprop_fluid, z, h_in, p * KPA_TO_PA, b, [])
+
+    saturation: Dict[Tuple[float, float], dict] = {}  # (T, q) -> 饱和状态，网格行列共用
+
+    def saturated(t: float, q: float) -> dict:
+        if (t, q) not in saturation:
+            saturation[t, q] = flash(RP, refprop_fluid, z, "TQ", t, q, [])
+        return saturation[t, q]
+
+    results: List[dict] = []
+    for t_evap, t_cond in points:
+        try:
+            if t_cond <= t_evap:
+                raise ValueError("冷凝温度须高于蒸发温度")
+            p_evap = saturated(t_evap, 1.0)["P"]
+            p_cond = saturated(t_cond, 1.0)["P"]
+            ratio = p_cond / p_evap
+            eta_is = _efficiency(isentropic, ratio)
+            eta_vol = _efficiency(volumetric, ratio)
+            if not 0.0 < eta_is <= 1.0 or not 0.0 < eta_vol <= 1.0:
+                raise ValueError(f"压比 {ratio:.3g} 下效率超出 (0, 1]：等熵 {eta_is:.3g}，容积 {eta_vol:.3g}")
+            suction = solve("PT", p_evap, t_evap + superheat)
+            h_2s = solve("PS", p_cond, suction["S"])["H"]
+            h_2 = suction["H"] + (h_2s - suction["H"]) / eta_is
+            discharge = solve("PH", p_cond, h_2)
+            liquid = solve("PQ", p_cond, 0.0)
+            if subcooling > 0:
+                liquid = solve("PT", p_cond, liquid["T"] - subcooling)
+            molar_flow = eta_vol * displacement / 3600.0 * suction["D"] * 1000.0  # [mol/s]
+            capacity = molar_flow * (suction["H"] - liquid["H"])
+            power = molar_flow * (h_2 - suction["H"])
+            results.append({"result": {
+                "T_evap": t_evap,
+                "T_cond": t_cond,
+                "P_evap": p_evap,
+                "P_cond": p_cond,
+                "pressure_ratio": ratio,
+                "T_suction": suction["T"],
+                "T_discharge": discharge["T"],
+                "eta_isentropic": eta_is,
+                "eta_volumetric": eta_vol,
+                "mass_flow": molar_flow * mol_mass,
+                "capacity": capacity,
+                "power": power,
+                "COP": capacity / power if power > 0 else None,
+            }})
+        except (ValueError, RuntimeError) as e:
+            results.append({"error": str(e)})
+    return results
+
+
+def ahri540_terms(s: float, d: float) -> List[float]:
+    """AHRI 540 多项式各项：1, S, D, S², S·D, D², S³, D·S², S·D², D³（S、D 为蒸发、冷凝露点 [°C]）"""
+    return [1.0, s, d, s * s, s * d, d * d, s ** 3, d * s * s, s * d * d, d ** 3]
+
+
+def _least_squares(rows: List[List[float]], y: List[float]) -> Optional[List[float]]:
+    """列缩放后的 Householder QR 最小二乘；秩亏（网格不足以确定全部系数）时返回 None"""
+    m, n = len(rows), len(rows[0])
+    if m < n:
+        return None
+    scale = [max(abs(row[j]) for row in rows) or 1.0 for j in range(n)]
+    a = [[row[j] / scale[j] for j in range(n)] for row in rows]
+    b = list(y)
+    for k in range(n):
+        norm = math.sqrt(sum(a[i][k] ** 2 for i in range(k, m)))
+        if norm == 0.0:
+            return None
+        alpha = -norm if a[k][k] >= 0 else norm
+        v = [0.0] * k + [a[k][k] - alpha] + [a[i][k] for i in range(k + 1, m)]
+        vv = sum(x * x for x in v[k:])
+        if vv == 0.0:
+            continue
+        for j in range(k, n):
+            dot = sum(v[i] * a[i][j] for i in range(k, m)) * 2.0 / vv
+            for i in range(k, m):
+                a[i][j] -= dot * v[i]
+        dot = sum(v[i] * b[i] for i in range(k, m)) * 2.0 / vv
+        for i in range(k, m):
+            b[i] -= dot * v[i]
+    diag = [abs(a[k][k]) for k in range(n)]
+    if min(diag) < RANK_TOLERANCE * max(diag):
+        return None
+    x = [0.0] * n
+    for k in reversed(range(n)):
+        x[k] = (b[k] - sum(a[k][j] * x[j] for j in range(k + 1, n))) / a[k][k]
+    return [x[j] / scale[j] for j in range(n)]
+
+
+def fit_ahri540(results: Sequence[Optional[dict]]) -> Dict[str, dict]:
+    """
+    对性能图（compute_compressor_points 的结果，失败点为 None）拟合 AHRI 540 十系数多项式
+
+    Returns:
+        {性能参数: {"coefficients": [C1..C10] | None, "rms", "max_abs", "max_rel", "residuals": [...]}}；
+        residuals 与 results 一一对应（拟合值减计算值，失败点为 None），max_rel 为相对计算值的最大偏差；
+        有效点不足或网格无法确定全部系数（每个方向至少 4 个温度）时 coefficients 为 None 并附 error
+    """
+    valid = [i for i, r in enumerate(results) if r is not None]
+    rows = [ahri540_terms(results[i]["T_evap"] - KELVIN_OFFSET, results[i]["T_cond"] - KELVIN_OFFSET) for i in valid]
+    fits: Dict[str, dict] = {}
+    for name in AHRI540_FITTED:
+        coefficients = _least_squares(rows, [results[i][name] for i in valid]) if valid else None
+        if coefficients is None:
+            fits[name] = {
+                "coefficients": None,
+                "error": f"有效网格点 {len(valid)} 个，不足以确定 AHRI 540 的 {AHRI540_TERMS} 个系数"
+                         "（蒸发、冷凝温度各需至少 4 个）",
+            }
+            continue
+        residuals: List[Optional[float]] = [None] * len(results)
+        for i, row in zip(valid, rows):
+            residuals[i] = sum(c * t for c, t in zip(coefficients, row)) - results[i][name]
+        errors = [residuals[i] for i in valid]
+        relative = [abs(residuals[i] / results[i][name]) for i in valid if results[i][name]]
+        fits[name] = {
+            "coefficients": coefficients,
+            "rms": math.sqrt(sum(e * e for e in errors) / len(errors)),
+            "max_abs": max(abs(e) for e in errors),
+            "max_rel": max(relative) if relative else None,
+            "residuals": residuals,
+        }
+    return fits
@@ -3,7 +3,8 @@ REFPROP 热力学计算 API 配置
 使用 python-dotenv 读取 .env，支持多域 CORS、API Key、REFPROP 路径等
 """
 import os
-from typing import List
+import tempfile
+from typing import Dict, List
 
 from dotenv import load_dotenv
 
@@ -23,6 +24,15 @@ ALLOWED_ORIGINS: List[str] = (
 # 公网防护：所有 /calculate 请求必须携带正确的 X-API-Key
 SECRET_API_KEY: str = os.environ.get("SECRET_API_KEY", "").strip()
 
+# 多客户端 Key 及其公平调度权重，逗号分隔的 key:weight。例如：frontend-key:4,batch-key:1
+# 未列出的 Key（或按 IP 区分的匿名客户端）权重为 1；开启鉴权时这些 Key 同样视为有效
+_weights = os.environ.get("API_KEY_WEIGHTS", "").strip()
+API_KEY_WEIGHTS: Dict[str, float] = {
+    k.strip(): float(w)
+    for k, _, w in (item.rpartition(":") for item in _weights.split(",") if item.strip())
+    if k.strip()
+}
+
 # ============== REFPROP 路径配置 ==============
 # REFPROP 安装根目录，需含 librefprop.so 和 FLUIDS 文件夹
 # 阿里云服务器安装位置：/www/refprop/Refprop10.0
@@ -35,3 +45,87 @@ RPPREFIX: str = (
 # FLUIDS 路径（可选，若与 RPPREFIX 同目录可留空）
 # 某些部署下 FLUIDS 可能单独放置
 FLUIDS_PATH: str = os.environ.get("FLUIDS_PATH", "").strip() or RPPREFIX
+
+# ============== 运行时共享状态目录 ==============
+# 多个 gunicorn worker 共享的准入控制状态（SQLite）存放于此，优先使用内存盘 /dev/shm
+_runtime_default = (
+    "/dev/shm/refbackend"
+    if os.path.isdir("/dev/shm")
+    else os.path.join(tempfile.gettempdir(), "refbackend")
+)
+RUNTIME_DIR: str = os.environ.get("RUNTIME_DIR", "").strip() or _runtime_default
+
+# ============== 准入控制（按 API Key 加权公平排队 + 过载保护）==============
+# 设为 0 关闭准入控制（本地单进程调试时可关闭）
+ADMISSION_ENABLED: bool = os.environ.get("ADMISSION_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+# 全机并发计算槽位数（跨所有 gunicorn worker 共享）。默认等于全机计算器总数：
+# GUNICORN_WORKERS（start.sh，默认 4）× CALC_PROCESSES（默认 2，为 0 时每个 worker 按 1 计）
+_workers = int(os.environ.get("GUNICORN_WORKERS", "4"))
+_calculators = max(int(os.environ.get("CALC_PROCESSES", "2")), 1)
+ADMISSION_SLOTS: int = int(os.environ.get("ADMISSION_SLOTS") or max(_workers * _calculators, 1))
+# 单个客户端最多排队的请求数，超出立即返回 429
+ADMISSION_QUEUE_PER_KEY: int = int(os.environ.get("ADMISSION_QUEUE_PER_KEY", "8"))
+# 全机最多排队的请求数，超出立即返回 503
+ADMISSION_QUEUE_TOTAL: int = int(os.environ.get("ADMISSION_QUEUE_TOTAL", "64"))
+# 排队最长等待时间 [s]，超时返回 503
+ADMISSION_MAX_WAIT: float = float(os.environ.get("ADMISSION_MAX_WAIT", "10"))
+# 可信反向代理地址，逗号分隔：只有来自这些地址的请求才按 X-Real-IP 区分客户端，
+# 其余按连接的对端地址（防止直连客户端伪造请求头逃避按客户端的公平排队）
+TRUSTED_PROXIES: List[str] = [
+    p.strip() for p in os.environ.get("TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if p.strip()
+]
+
+# ============== REFPROP 计算子进程（看门狗监督）==============
+# 每个 gunicorn worker 常驻的计算子进程数；设为 0 则在 worker 进程内直接计算（无超时保护）
+CALC_PROCESSES: int = int(os.environ.get("CALC_PROCESSES", "2"))
+# 计算器形态：process 为子进程（超时可强杀）；thread 为 worker 内的线程，每个线程独占 librefprop.so 独立副本，
+# 一个 worker 即可并行 CALC_PROCESSES 个计算（此时建议 GUNICORN_WORKERS=1，共享同一份进程内缓存）
+CALC_MODE: str = os.environ.get("CALC_MODE", "process").strip().lower()
+if CALC_MODE not in ("process", "thread"):
+    raise ValueError(f"CALC_MODE 须为 process 或 thread。当前: {CALC_MODE}")
+# 预热备用进程数：计算进程超时被杀后立即由备用进程顶替
+CALC_SPARES: int = int(os.environ.get("CALC_SPARES", "1"))
+# 单次调用超时 [s]，超时后计算进程被杀掉并替换，接口返回 504
+CALC_TIMEOUT_CALCULATE: float = float(os.environ.get("CALC_TIMEOUT_CALCULATE", "2"))
+CALC_TIMEOUT_FLUID_INFO: float = float(os.environ.get("CALC_TIMEOUT_FLUID_INFO", "10"))
+CALC_TIMEOUT_DOME: float = float(os.environ.get("CALC_TIMEOUT_DOME", "30"))
+CALC_TIMEOUT_CHART: float = float(os.environ.get("CALC_TIMEOUT_CHART", "60"))
+# 批量任务（一次调用计算多个状态点）的超时上限 [s]：超时按点数累加但不超过此值，须小于 gunicorn 的 --timeout（120）
+CALC_TIMEOUT_BATCH: float = float(os.environ.get("CALC_TIMEOUT_BATCH", "60"))
+# 按工质亲和调度：同一工质的请求按一致性哈希优先发往同一计算进程，忙时溢出到哈希环上的下一个空闲进程
+CALC_AFFINITY: bool = os.environ.get("CALC_AFFINITY", "1").strip().lower() not in ("0", "false", "no")
+# 每个计算进程常驻的工质设置数（每个占用一份 librefprop.so 副本的内存），1 表示单实例
+RP_SETUP_CACHE: int = int(os.environ.get("RP_SETUP_CACHE", "3"))
+
+# ============== 单点计算微批处理 ==============
+# 计算进程全忙时，同一工质、同一输入类型的并发单点 /calculate 请求最多等待多少毫秒合并为一批，0 表示关闭
+MICROBATCH_WINDOW_MS: float = float(os.environ.get("MICROBATCH_WINDOW_MS", "3"))
+# 每批最多合并的请求数，凑满立即计算
+MICROBATCH_MAX_SIZE: int = int(os.environ.get("MICROBATCH_MAX_SIZE", "32"))
+
+# ============== 批量文件作业（/calculate/file） ==============
+# 每块读取、准入、计算、写出的行数（决定作业的内存占用）
+BULK_CHUNK_ROWS: int = max(int(os.environ.get("BULK_CHUNK_ROWS", "5000")), 1)
+# 每个计算任务（同一工质、同一输入类型）最多的状态点数，大分组切成多个任务在计算进程间并行
+BULK_TASK_POINTS: int = max(int(os.environ.get("BULK_TASK_POINTS", "500")), 1)
+# 上传文件大小上限 [MB]（上传内容先写入临时文件）
+BULK_MAX_MB: float = float(os.environ.get("BULK_MAX_MB", "2048"))
+
+# ============== 计算结果缓存 ==============
+# 每个 worker 进程内每类结果（calculate、dome 等）最多缓存的条目数（L1），0 表示不缓存
+RESULT_CACHE_SIZE: int = int(os.environ.get("RESULT_CACHE_SIZE", "256"))
+# 同机所有 worker 共享的结果缓存文件（SQLite WAL，L2），放在持久目录下可跨服务重启保留；设为空则关闭
+RESULT_CACHE_PATH: str = os.environ.get(
+    "RESULT_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "results.sqlite3")
+).strip()
+# 共享缓存文件大小上限 [MB]，超出后按最久未访问淘汰
+RESULT_CACHE_MAX_MB: float = float(os.environ.get("RESULT_CACHE_MAX_MB", "256"))
+
+# ============== 流量抓取（replay.py 回放） ==============
+# 抓取目录：记录 /calculate、/dome、/fluid-info 的脱敏请求体与耗时（各 worker 各写一个文件）；留空关闭
+CAPTURE_PATH: str = os.environ.get("CAPTURE_PATH", "").strip()
+# 抓取比例（0~1），按请求随机抽样
+CAPTURE_SAMPLE: float = min(max(float(os.environ.get("CAPTURE_SAMPLE", "1")), 0.0), 1.0)
+# 单个抓取文件大小上限 [MB]，超出后轮转；目录内最多保留的已轮转文件数（全部 worker 合计，超出删除最旧的）
+CAPTURE_FILE_MB: float = float(os.environ.get("CAPTURE_FILE_MB", "64"))
+CAPTURE_MAX_FILES: int = max(int(os.environ.get("CAPTURE_MAX_FILES", "20")), 1)
@@ -0,0 +1,57 @@
+"""
+pytest 公共设置
+运行期文件（准入控制、结果缓存）放在临时目录；本机没有 ctREFPROP 时使用 tools/fake_refprop 替身库
+（数值无意义，只验证调度、校验与错误处理逻辑）。须在导入 config 之前设置环境变量。
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FAKE_PATH = os.path.join(ROOT, "tools", "fake_refprop")
+
+_tmp = tempfile.mkdtemp(prefix="refbackend-test-")
+os.environ.setdefault("RUNTIME_DIR", os.path.join(_tmp, "run"))
+os.environ.setdefault("RESULT_CACHE_PATH", "")
+os.environ.setdefault("CAPTURE_PATH", "")
+
+# 与 refprop_session.LIBRARY_NAMES 相同；此处不能导入项目模块（config 须在环境变量设置之后导入）
+_LIBRARY_NAMES = ("librefprop.so", "librefprop.dylib", "REFPRP64.DLL")
+
+
+def _refprop_installed() -> bool:
+    """本机能否使用真实的 REFPROP：ctREFPROP 可导入且 RPPREFIX 下有共享库文件"""
+    prefix = os.environ.get("RPPREFIX", "")
+    if not prefix or not any(os.path.isfile(os.path.join(prefix, n)) for n in _LIBRARY_NAMES):
+        return False
+    try:
+        import ctREFPROP  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+HAVE_REFPROP = _refprop_installed() or os.path.isdir(FAKE_PATH)
+if not _refprop_installed() and HAVE_REFPROP:
+    sys.path.insert(0, FAKE_PATH)
+    sys.modules.pop("ctREFPROP", None)
+    os.environ["PYTHONPATH"] = os.pathsep.join(p for p in (FAKE_PATH, ROOT, os.environ.get("PYTHONPATH")) if p)
+    _prefix = os.path.join(_tmp, "refprop")
+    os.makedirs(_prefix)
+    with open(os.path.join(_prefix, "librefprop.so"), "wb") as f:
+        f.write(b"\0" * 64 * 1024)
+    os.environ["RPPREFIX"] = os.environ["FLUIDS_PATH"] = _prefix
+
+
+@pytest.fixture
+def refprop():
+    """需要 REFPROP（或替身库）的测试"""
+    if not HAVE_REFPROP:
+        pytest.skip("未安装 ctREFPROP，且没有 tools/fake_refprop 替身库")
+
+
+@pytest.fixture
+def tmp_db(tmp_path):
+    return str(tmp_path / "state.sqlite3")
@@ -4,9 +4,10 @@ FastAPI 依赖函数
 """
 from typing import Optional
 
-from fastapi import Header, HTTPException
+from fastapi import Depends, Header, HTTPException, Request
+from starlette.datastructures import Headers
 
-from config import SECRET_API_KEY
+from config import API_KEY_WEIGHTS, SECRET_API_KEY, TRUSTED_PROXIES
 
 
 def verify_api_key(x_api_key: Optional[str] = Header(None, description="API 密钥，用于鉴权")) -> str:
@@ -33,11 +34,51 @@ def verify_api_key(x_api_key: Optional[str] = Header(None, description="API 密
             detail="Missing X-API-Key header. 请在请求头中提供 X-API-Key。",
         )
     
-    # 密钥不匹配
-    if x_api_key.strip() != SECRET_API_KEY:
+    # 密钥不匹配（SECRET_API_KEY 或 API_KEY_WEIGHTS 中登记的客户端 Key 均有效）
+    if x_api_key.strip() != SECRET_API_KEY and x_api_key.strip() not in API_KEY_WEIGHTS:
         raise HTTPException(
             status_code=401,
             detail="Invalid API Key. X-API-Key 无效。",
         )
     
     return x_api_key
+
+
+def verified_key(api_key: Optional[str]) -> Optional[str]:
+    """
+    经过验证的 API Key：等于 SECRET_API_KEY（已配置时），或登记在 API_KEY_WEIGHTS 中；否则为 None
+
+    未配置 SECRET_API_KEY 时 verify_api_key 不做鉴权，任意 X-API-Key 都能通过，
+    不能据此区分客户端（否则每个请求换一个 Key 即可绕过单客户端排队上限与公平份额）。
+    """
+    key = (api_key or "").strip()
+    if not key:
+        return None
+    if (SECRET_API_KEY and key == SECRET_API_KEY) or key in API_KEY_WEIGHTS:
+        return key
+    return None
+
+
+def scope_identity(scope: dict) -> str:
+    """
+    按 ASGI scope 划分客户端（准入控制与流量抓取共用）
+
+    携带经过验证的 X-API-Key（见 verified_key）时按 Key 区分（"key:<Key>"）；否则（未携带、
+    开发模式下的未登记 Key）按来源 IP 区分（"ip:<IP>"）。只有对端是 TRUSTED_PROXIES 中的反向代理时
+    才取 X-Real-IP，直连的客户端无法通过伪造请求头为每个请求换一个身份。
+    """
+    headers = Headers(scope=scope)
+    key = verified_key(headers.get("x-api-key"))
+    if key:
+        return f"key:{key}"
+    peer = scope["client"][0] if scope.get("client") else "unknown"
+    ip = headers.get("x-real-ip") if peer in TRUSTED_PROXIES else None
+    return f"ip:{ip or peer}"
+
+
+def client_identity(
+    request: Request,
+    api_key: str = Depends(verify_api_key),
+) -> str:
+    """准入控制使用的客户端标识（鉴权通过后按 scope_identity 划分）"""
+    return scope_identity(request.scope)
@@ -1,15 +1,23 @@
 """
 饱和包络线 (Saturation Dome) 计算引擎
-为 P-h 压焓图提供饱和液线 (q=0) 和饱和气线 (q=1) 的坐标点数组
+为 P-h 压焓图提供饱和液线 (q=0) 和饱和气线 (q=1) 的坐标点数组，
+以及同一次工质设置内计算的等温线、等熵线、等容线、等干度线（compute_ph_chart）
 
 单位：API 遵循 NIST REFPROP DEFAULT 单位制，P [kPa]，H [J/mol]，T [K]。
 内部用 MOLAR BASE SI 调用 REFPROP，输出 P 从 Pa 转为 kPa。
 """
-import os
-from typing import List, Optional, Tuple
+import math
+from typing import Callable, List, Optional, Sequence, Tuple
 
-from config import FLUIDS_PATH, RPPREFIX
-from refprop_engine import KPA_TO_PA, parse_fluid_string
+from refprop_engine import (
+    KPA_TO_PA,
+    MOL_DM3_TO_MOL_M3,
+    REFPROP_UNDEFINED,
+    canonical_fluid_key,
+    molar_base_si,
+    parse_fluid_string,
+)
+from refprop_session import get_rp, mark_spline_fitted, spline_flag
 
 
 # 扫描参数
@@ -18,17 +26,18 @@ T_CRIT_OFFSET = 0.5      # 临界点前停止的偏移 [K]，避免临界区发
 TARGET_POINTS = 65       # 目标总点数（液线+气线各约一半，保证绘图性能）
 LOW_FRAC = 0.75          # 低温区占比（前 75% 用大步长，后 25% 用小步长）
 
+# 混合物相包络线（SATSPLN 相界样条）参数
+ENVELOPE_POINTS = 160        # 沿样条自变量（密度）的采样点数
+DOME_MODES = ("tq", "envelope")
 
-def _get_rp_instance(rpprefix: Optional[str] = None):
-    """创建并配置 REFPROP 实例"""
-    prefix = rpprefix or RPPREFIX
-    fluids = FLUIDS_PATH or prefix
-    if not prefix or not os.path.isdir(prefix):
-        raise RuntimeError(f"REFPROP 路径未配置或无效: {prefix}。请设置 RPPREFIX 环境变量。")
-    from ctREFPROP.ctREFPROP import REFPROPFunctionLibrary
-    RP = REFPROPFunctionLibrary(prefix)
-    RP.SETPATHdll(fluids)
-    return RP
+# P-h 图等值线采样参数
+CHART_INITIAL_SEGMENTS = 8   # 每段曲线的初始等分段数
+CHART_TOLERANCE = 0.002      # 中点偏离弦线的允许值（归一化窗口坐标，约为图宽的 0.2%）
+CHART_MAX_DEPTH = 6          # 每个初始分段最多二分的层数
+CHART_MAX_LINES = 60         # 单张图最多的等值线条数
+CHART_MAX_CALLS = 12000      # 单张图的等值线 REFPROP 调用总预算（不含饱和包络线）
+CHART_P_MAX_FACTOR = 3.0     # 未给定 p_max 时取临界压力的倍数
+CHART_H_MARGIN = 0.5         # 未给定 h_max 时饱和气线最大焓之外的余量（占饱和焓范围的比例）
 
 
 def _get_critical_point(
@@ -39,10 +48,10 @@ def _get_critical_point(
 ) -> Tuple[float, float, float]:
     """
     获取临界点 (Tc, Pc, Hc)
-    混合物需 iFlag=1 调用 SATSPLN 后临界点才准确
+    混合物需 iFlag=1 调用 SATSPLN 后临界点才准确；同一实例上已拟合过的混合物直接复用样条
     """
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
-    iFlag = 1 if is_mixture else 0  # 混合物必须调 SATSPLN
+    MOLAR_BASE_SI = molar_base_si(RP)
+    iFlag = spline_flag(RP) if is_mixture else 0  # 混合物必须调 SATSPLN（已拟合则复用）
     r = RP.REFPROPdll(
         refprop_fluid,
         "CRIT",           # hIn: 临界点
@@ -56,13 +65,15 @@ def _get_critical_point(
     )
     if r.ierr > 100:
         raise RuntimeError(f"获取临界点失败 (ierr={r.ierr}): {r.herr.strip()}")
+    if iFlag == 1:
+        mark_spline_fitted(RP)
     Tc, Pc_Pa, Hc = float(r.Output[0]), float(r.Output[1]), float(r.Output[2])
     return Tc, Pc_Pa / KPA_TO_PA, Hc  # P: Pa -> kPa
 
 
 def _get_eos_min_temperature(RP, refprop_fluid: str, z: List[float]) -> float:
     """获取状态方程最低温度（通常为三相点液相温度）"""
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
+    MOLAR_BASE_SI = molar_base_si(RP)
     r = RP.REFPROPdll(
         refprop_fluid,
         "EOSMIN",
@@ -113,7 +124,7 @@ def _saturation_ph_at_t(
     在给定温度 T 和干度 q 下计算饱和压力 P 和焓 H
     quality=0 饱和液，quality=1 饱和气
     """
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
+    MOLAR_BASE_SI = molar_base_si(RP)
     r = RP.REFPROPdll(
         refprop_fluid,
         "TQ",             # hIn: 温度 + 干度
@@ -131,33 +142,13 @@ def _saturation_ph_at_t(
     return P_Pa / KPA_TO_PA, H  # P: Pa -> kPa
 
 
-def compute_saturation_dome(
-    fluid_string: str,
-    rpprefix: Optional[str] = None,
-) -> dict:
-    """
-    计算饱和包络线 (P-h Dome) 数据
-    
-    从最低温度（三相点或 223.15 K）步进到略低于临界温度，
-    对每个温度计算饱和液 (q=0) 和饱和气 (q=1) 的 (P, H)，
-    供前端绘制 P-h 图。
-    
-    Args:
-        fluid_string: 工质字符串，如 "R32", "CO2", "R32&R125|0.5&0.5"
-        rpprefix: REFPROP 路径，默认从配置读取
-    
-    Returns:
-        {
-            "liquid": [{"P": kPa, "H": J/mol}, ...],   # 饱和液线
-            "vapor":  [{"P": kPa, "H": J/mol}, ...],   # 饱和气线
-            "critical": {"T": K, "P": kPa, "H": J/mol}
-        }
-    """
-    refprop_fluid, z = parse_fluid_string(fluid_string)
-    is_mixture = "*" in refprop_fluid or "|" in fluid_string
-
-    RP = _get_rp_instance(rpprefix)
-
+def _dome_on(
+    RP,
+    refprop_fluid: str,
+    z: List[float],
+    is_mixture: bool,
+) -> Tuple[dict, float]:
+    """在已设置工质的实例上计算饱和包络线，返回 (dome, 扫描最低温度 T_min)"""
     # 1. 获取临界点 (Tc, Pc, Hc)
     Tc, Pc, Hc = _get_critical_point(RP, refprop_fluid, z, is_mixture)
 
@@ -196,7 +187,7 @@ def compute_saturation_dome(
 
     # 6. 可选：在临界点追加顶点（若未因错误提前终止）
     # 临界点液气相合一，P、H 相同，前端可用来闭合 dome
-    return {
+    dome = {
         "liquid": liquid_points,
         "vapor": vapor_points,
         "critical": {
@@ -205,3 +196,351 @@ def compute_saturation_dome(
             "H": round(Hc, 2),
         },
     }
+    return dome, T_min
+
+
+def _spline_value(RP, isp: int, rho: float) -> float:
+    """相界样条在密度 rho [mol/L] 处的函数值（SPLNVAL 使用 REFPROP 旧单位：K、kPa、mol/L、J/mol）"""
+    r = RP.SPLNVALdll(isp, 0, rho)
+    if r.ierr > 0:
+        raise RuntimeError(f"相界样条取值失败 (ierr={r.ierr}): {r.herr.strip()}")
+    return float(r.f)
+
+
+def _spline_state(RP, nc: int, rho: float) -> Tuple[float, float, float]:
+    """样条上密度 rho 处的 (T [K], P [kPa], H [J/mol])"""
+    return _spline_value(RP, nc + 1, rho), _spline_value(RP, nc + 2, rho), _spline_value(RP, nc + 4, rho)
+
+
+def _envelope_extremum(RP, nc: int, z: List[float], name: str) -> dict:
+    """
+    临界凝析温度点（MAXTdll）或临界凝析压力点（MAXPdll）：REFPROP 沿已拟合的相界样条直接求极值，
+    返回 T [K]、P [kPa]、D [mol/L]；H 取样条在该密度处的值
+    """
+    r = getattr(RP, name)(list(z))
+    if r.ierr > 0:
+        raise RuntimeError(f"{name} 失败 (ierr={r.ierr}): {r.herr.strip()}")
+    H = _spline_value(RP, nc + 4, float(r.Dm))
+    return {"T": round(float(r.Tm), 4), "P": round(float(r.Pm), 6), "H": round(H, 2)}
+
+
+def _phase_envelope(
+    RP,
+    refprop_fluid: str,
+    z: List[float],
+) -> dict:
+    """
+    混合物完整相包络线：沿 SATSPLN 样条（自变量为密度）从低密度露点端连续扫描到高密度泡点端，
+    经过临界点、临界凝析压力点 (cricondenbar) 与临界凝析温度点 (cricondentherm)。
+    每点只需 3 次样条取值，不做闪蒸计算。样条须已拟合（_get_critical_point 以 iFlag=1 调用 CRIT）。
+    """
+    nc = len(refprop_fluid.split("*"))
+    Tc, Pc, Hc = _get_critical_point(RP, refprop_fluid, z, True)
+    lo = RP.SPLNVALdll(nc + 1, -1, 0.0)
+    hi = RP.SPLNVALdll(nc + 1, -2, 0.0)
+    if lo.ierr > 0 or hi.ierr > 0 or not hi.f > lo.f:
+        raise RuntimeError("相界样条不可用")
+    rho_lo, rho_hi = float(lo.f), float(hi.f)
+
+    # 露点侧密度跨越数个数量级，下界为正时按对数等分
+    if rho_lo > 0:
+        step = (rho_hi / rho_lo) ** (1.0 / ENVELOPE_POINTS)
+        rhos = [rho_lo * step ** i for i in range(ENVELOPE_POINTS + 1)]
+    else:
+        rhos = [rho_lo + (rho_hi - rho_lo) * i / ENVELOPE_POINTS for i in range(ENVELOPE_POINTS + 1)]
+    rhos[-1] = rho_hi
+    curve: List[Tuple[float, float, float, float]] = []
+    for rho in rhos:
+        try:
+            curve.append((rho,) + _spline_state(RP, nc, rho))
+        except RuntimeError:
+            continue
+    if len(curve) < 3:
+        raise RuntimeError("相界样条取值失败")
+
+    # 样条上离临界点最近的点把曲线分为露点线（低密度侧）与泡点线（高密度侧）
+    k = min(range(len(curve)), key=lambda i: ((curve[i][1] - Tc) / Tc) ** 2 + ((curve[i][2] - Pc) / Pc) ** 2)
+    critical = {"P": round(Pc, 6), "H": round(Hc, 2)}
+    vapor = [{"P": round(P, 6), "H": round(H, 2)} for _, _, P, H in curve[:k]] + [critical]
+    liquid = [{"P": round(P, 6), "H": round(H, 2)} for _, _, P, H in reversed(curve[k + 1:])] + [critical]
+
+    return {
+        "liquid": liquid,
+        "vapor": vapor,
+        "critical": {"T": round(Tc, 4), "P": round(Pc, 6), "H": round(Hc, 2)},
+        "cricondenbar": _envelope_extremum(RP, nc, z, "MAXPdll"),
+        "cricondentherm": _envelope_extremum(RP, nc, z, "MAXTdll"),
+    }
+
+
+def compute_saturation_dome(
+    fluid_string: str,
+    rpprefix: Optional[str] = None,
+    mode: str = "tq",
+) -> dict:
+    """
+    计算饱和包络线 (P-h Dome) 数据
+    
+    mode="tq"（默认）：从最低温度（三相点或 223.15 K）步进到略低于临界温度，
+    对每个温度计算饱和液 (q=0) 和饱和气 (q=1) 的 (P, H)，供前端绘制 P-h 图。
+    mode="envelope"：混合物沿 SATSPLN 相界样条连续扫描完整相包络线（穿过临界点），
+    并给出临界凝析压力点与临界凝析温度点；纯工质按 "tq" 计算。混合物的样条拟合或取值失败时
+    也按 "tq" 计算，并在 "fallback" 中给出原因（调用方不应把这样的结果当作包络线缓存）。
+    
+    Args:
+        fluid_string: 工质字符串，如 "R32", "CO2", "R32&R125|0.5&0.5"
+        rpprefix: REFPROP 路径，默认从配置读取
+        mode: "tq" 或 "envelope"
+    
+    Returns:
+        {
+            "liquid": [{"P": kPa, "H": J/mol}, ...],   # 饱和液线（envelope 模式为泡点线，低温端 → 临界点）
+            "vapor":  [{"P": kPa, "H": J/mol}, ...],   # 饱和气线（envelope 模式为露点线，低温端 → 临界点）
+            "critical": {"T": K, "P": kPa, "H": J/mol},
+            "cricondenbar": {"T", "P", "H"},            # 仅 envelope 模式
+            "cricondentherm": {"T", "P", "H"},          # 仅 envelope 模式
+            "fallback": str,                            # 仅 envelope 模式退回 tq 计算时
+        }
+    """
+    if mode not in DOME_MODES:
+        raise ValueError(f"不支持的 dome 模式: {mode}。可选: {', '.join(DOME_MODES)}")
+    refprop_fluid, z = parse_fluid_string(fluid_string)
+    is_mixture = "*" in refprop_fluid or "|" in fluid_string
+
+    RP = get_rp(canonical_fluid_key(fluid_string), rpprefix)
+    fallback = None
+    if mode == "envelope" and is_mixture:
+        try:
+            return _phase_envelope(RP, refprop_fluid, z)
+        except RuntimeError as e:
+            fallback = f"相包络线计算失败，已按 tq 计算: {e}"  # 样条拟合或取值失败：退回逐温度 TQ 扫描
+    dome, _ = _dome_on(RP, refprop_fluid, z, is_mixture)
+    if fallback is not None:
+        dome["fallback"] = fallback
+    return dome
+
+
+def _state_ph(RP, refprop_fluid: str, z: List[float], h_in: str, a: float, b: float) -> Optional[Tuple[float, float]]:
+    """单次闪蒸取 (P [kPa], H [J/mol])，输入为 MOLAR BASE SI；REFPROP 报错时返回 None"""
+    r = RP.REFPROPdll(refprop_fluid, h_in, "P;H", molar_base_si(RP), 0, 0, a, b, list(z))
+    if r.ierr > 100:
+        return None
+    P_Pa, H = float(r.Output[0]), float(r.Output[1])
+    if P_Pa <= 0 or H <= REFPROP_UNDEFINED:
+        return None
+    return P_Pa / KPA_TO_PA, H
+
+
+class _Window:
+    """绘图窗口：P 按对数、H 按线性归一化到 [0, 1]，曲率判据与裁剪都在归一化坐标中进行"""
+
+    def __init__(self, p_min: float, p_max: float, h_min: float, h_max: float):
+        self.p_min, self.p_max, self.h_min, self.h_max = p_min, p_max, h_min, h_max
+        self._lp_min = math.log(p_min)
+        self._lp_span = math.log(p_max) - self._lp_min
+        self._h_span = h_max - h_min
+
+    def xy(self, point: Tuple[float, float]) -> Tuple[float, float]:
+        P, H = point
+        return (H - self.h_min) / self._h_span, (math.log(P) - self._lp_min) / self._lp_span
+
+    def contains(self, point: Tuple[float, float]) -> bool:
+        x, y = self.xy(point)
+        return -1e-9 <= x <= 1 + 1e-9 and -1e-9 <= y <= 1 + 1e-9
+
+
+def _trace(
+    f: Callable[[float], Optional[Tuple[float, float]]],
+    t0: float,
+    t1: float,
+    window: _Window,
+    budget: List[int],
+    first: Optional[Tuple[float, float]] = None,
+    last: Optional[Tuple[float, float]] = None,
+) -> List[Tuple[float, float]]:
+    """
+    沿参数 t ∈ [t0, t1] 自适应采样一条曲线 f(t) -> (P, H)
+    先取 CHART_INITIAL_SEGMENTS 段等分点，再对中点偏离弦线超过 CHART_TOLERANCE（归一化坐标）的区间递归二分；
+    first/last 给定时替代两端点的计算（如等温线在露点、泡点处的分段端点）。budget[0] 为剩余可用的 REFPROP 调用数。
+    """
+    def evaluate(t: float) -> Optional[Tuple[float, float]]:
+        if budget[0] <= 0:
+            return None
+        budget[0] -= 1
+        return f(t)
+
+    ts = [t0 + (t1 - t0) * i / CHART_INITIAL_SEGMENTS for i in range(CHART_INITIAL_SEGMENTS + 1)]
+    samples = [evaluate(t) for t in ts[1:-1]]
+    samples.insert(0, first or evaluate(t0))
+    samples.append(last or evaluate(t1))
+
+    def refine(ta, pa, tb, pb, depth) -> List[Tuple[float, float]]:
+        if pa is None or pb is None or depth >= CHART_MAX_DEPTH:
+            return []
+        tm = 0.5 * (ta + tb)
+        pm = evaluate(tm)
+        if pm is None:
+            return []
+        (xa, ya), (xb, yb), (xm, ym) = window.xy(pa), window.xy(pb), window.xy(pm)
+        chord = math.hypot(xb - xa, yb - ya)
+        if chord > 0:
+            deviation = abs((xb - xa) * (ya - ym) - (xa - xm) * (yb - ya)) / chord
+        else:
+            deviation = math.hypot(xm - xa, ym - ya)
+        if deviation <= CHART_TOLERANCE:
+            return [pm]
+        return refine(ta, pa, tm, pm, depth + 1) + [pm] + refine(tm, pm, tb, pb, depth + 1)
+
+    points: List[Tuple[float, float]] = []
+    for i, (t, p) in enumerate(zip(ts, samples)):
+        if i > 0:
+            points.extend(refine(ts[i - 1], samples[i - 1], t, p, 0))
+        if p is not None:
+            points.append(p)
+    return points
+
+
+def _clip(points: List[Tuple[float, float]], window: _Window) -> List[dict]:
+    """保留窗口内的点及其相邻的窗口外点（曲线画到窗口边缘），转为 {P, H} 列表"""
+    inside = [window.contains(p) for p in points]
+    keep = [
+        inside[i] or (i > 0 and inside[i - 1]) or (i + 1 < len(points) and inside[i + 1])
+        for i in range(len(points))
+    ]
+    return [{"P": round(P, 6), "H": round(H, 2)} for (P, H), k in zip(points, keep) if k]
+
+
+def _log_p_range(window: _Window, lo: float, hi: float) -> Optional[Tuple[float, float]]:
+    """压力区间 [lo, hi] 与窗口压力范围的交集（对数），为空时返回 None"""
+    lo, hi = max(lo, window.p_min), min(hi, window.p_max)
+    if lo >= hi:
+        return None
+    return math.log(lo), math.log(hi)
+
+
+def _p_sweep(RP, refprop_fluid: str, z: List[float], h_in: str, b: float):
+    """沿 ln P [kPa] 扫描的闪蒸函数：h_in 首字母为 P，b 为另一个输入（MOLAR BASE SI）"""
+    def f(lp: float) -> Optional[Tuple[float, float]]:
+        return _state_ph(RP, refprop_fluid, z, h_in, math.exp(lp) * KPA_TO_PA, b)
+    return f
+
+
+def _isotherm(RP, refprop_fluid, z, T, Tc, window, budget) -> List[Tuple[float, float]]:
+    """
+    等温线：低压气相段 (PT) → 两相段 (TQ，干度 1→0) → 高压液相段 (PT)
+    两相段两端用露点、泡点状态，避免 PT 在饱和压力处的相态歧义；纯工质的两相段为水平线，混合物因温度滑移倾斜
+    """
+    pt = _p_sweep(RP, refprop_fluid, z, "PT", T)
+    dew = _state_ph(RP, refprop_fluid, z, "TQ", T, 1.0) if T < Tc else None
+    bubble = _state_ph(RP, refprop_fluid, z, "TQ", T, 0.0) if T < Tc else None
+    if dew is None or bubble is None:
+        span = _log_p_range(window, window.p_min, window.p_max)
+        return _trace(pt, *span, window, budget) if span else []
+    def tq(q: float) -> Optional[Tuple[float, float]]:
+        return _state_ph(RP, refprop_fluid, z, "TQ", T, q)
+
+    segments = [_trace(tq, 1.0, 0.0, window, budget, first=dew, last=bubble)]
+    span = _log_p_range(window, window.p_min, dew[0])
+    if span:
+        segments.insert(0, _trace(pt, *span, window, budget, last=dew if dew[0] <= window.p_max else None))
+    span = _log_p_range(window, bubble[0], window.p_max)
+    if span:
+        segments.append(_trace(pt, *span, window, budget, first=bubble if bubble[0] >= window.p_min else None))
+    points: List[Tuple[float, float]] = []
+    for segment in segments:
+        points += segment[1:] if points and segment and segment[0] == points[-1] else segment  # 露点、泡点不重复
+    return points
+
+
+def compute_ph_chart(
+    fluid_string: str,
+    p_min: Optional[float] = None,
+    p_max: Optional[float] = None,
+    h_min: Optional[float] = None,
+    h_max: Optional[float] = None,
+    isotherms: Sequence[float] = (),
+    isentropes: Sequence[float] = (),
+    isochores: Sequence[float] = (),
+    qualities: Sequence[float] = (),
+    rpprefix: Optional[str] = None,
+) -> dict:
+    """
+    完整 P-h 图数据：饱和包络线 + 等温线、等熵线、等容线、等干度线，一次工质设置内完成
+
+    各等值线在归一化的绘图窗口（log P × H）中按曲率自适应采样：平直段点少，
+    临界区、饱和线交点附近的拐折处自动加密。未给定的窗口边界由饱和包络线确定。
+
+    Args:
+        fluid_string: 工质字符串，同 compute_saturation_dome
+        p_min, p_max: 窗口压力范围 [kPa]
+        h_min, h_max: 窗口焓范围 [J/mol]
+        isotherms: 等温线温度 [K]
+        isentropes: 等熵线熵值 [J/(mol·K)]
+        isochores: 等容线密度 [mol/dm³]
+        qualities: 等干度线干度 (0~1)
+
+    Returns:
+        {
+            "dome": 同 compute_saturation_dome,
+            "window": {"P": [p_min, p_max], "H": [h_min, h_max]},
+            "isotherms" / "isentropes" / "isochores" / "qualities": [
+                {"value": 等值线取值, "points": [{"P": kPa, "H": J/mol}, ...]}, ...
+            ],
+        }
+        无法计算的等值线 points 为空列表
+    """
+    families = {"isotherms": isotherms, "isentropes": isentropes, "isochores": isochores, "qualities": qualities}
+    if sum(len(v) for v in families.values()) > CHART_MAX_LINES:
+        raise ValueError(f"等值线总数不能超过 {CHART_MAX_LINES} 条")
+    if any(not 0.0 <= q <= 1.0 for q in qualities):
+        raise ValueError("等干度线的干度须在 0~1 之间")
+    if any(d <= 0 for d in isochores):
+        raise ValueError("等容线的密度须大于 0")
+
+    refprop_fluid, z = parse_fluid_string(fluid_string)
+    is_mixture = "*" in refprop_fluid or "|" in fluid_string
+    RP = get_rp(canonical_fluid_key(fluid_string), rpprefix)
+
+    dome, T_min = _dome_on(RP, refprop_fluid, z, is_mixture)
+    saturated = dome["liquid"] + dome["vapor"]
+    if (p_min is None or h_min is None or h_max is None) and not saturated:
+        raise RuntimeError("饱和包络线计算失败，无法确定绘图窗口，请显式给出 p_min、h_min、h_max")
+    Pc, Tc = dome["critical"]["P"], dome["critical"]["T"]
+    if p_min is None:
+        p_min = min(p["P"] for p in saturated)
+    if p_max is None:
+        p_max = Pc * CHART_P_MAX_FACTOR
+    if h_min is None:
+        h_min = min(p["H"] for p in saturated)
+    if h_max is None:
+        h_lo, h_hi = min(p["H"] for p in saturated), max(p["H"] for p in saturated)
+        h_max = h_hi + CHART_H_MARGIN * (h_hi - h_lo)
+    if not 0 < p_min < p_max:
+        raise ValueError(f"压力窗口无效: p_min={p_min}, p_max={p_max}（须 0 < p_min < p_max）")
+    if not h_min < h_max:
+        raise ValueError(f"焓窗口无效: h_min={h_min}, h_max={h_max}（须 h_min < h_max）")
+    window = _Window(p_min, p_max, h_min, h_max)
+
+    full = _log_p_range(window, p_min, p_max)
+    budget = [CHART_MAX_CALLS]  # 全图共享的 REFPROP 调用预算，防止病态等值线耗尽超时
+    lines = {name: [] for name in families}
+    for T in isotherms:
+        points = _isotherm(RP, refprop_fluid, z, T, Tc, window, budget)
+        lines["isotherms"].append({"value": T, "points": _clip(points, window)})
+    for S in isentropes:
+        points = _trace(_p_sweep(RP, refprop_fluid, z, "PS", S), *full, window, budget)
+        lines["isentropes"].append({"value": S, "points": _clip(points, window)})
+    for D in isochores:
+        points = _trace(_p_sweep(RP, refprop_fluid, z, "PD", D * MOL_DM3_TO_MOL_M3), *full, window, budget)
+        lines["isochores"].append({"value": D, "points": _clip(points, window)})
+    for q in qualities:
+        def tq(T: float, q: float = q) -> Optional[Tuple[float, float]]:
+            return _state_ph(RP, refprop_fluid, z, "TQ", T, q)
+        points = _trace(tq, T_min, Tc - T_CRIT_OFFSET, window, budget)
+        lines["qualities"].append({"value": q, "points": _clip(points, window)})
+
+    return {
+        "dome": dome,
+        "window": {"P": [p_min, p_max], "H": [h_min, h_max]},
+        **lines,
+    }
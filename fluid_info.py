@@ -3,31 +3,15 @@
 获取制冷剂的安全类别、GWP、ODP、临界温度、标准沸点、CAS、三相点、分子量、k值
 基于 REFPROP 10.0 REFPROPdll / ALLPROPSdll
 """
-import os
 from typing import Any, Dict, List, Optional
 
-from config import FLUIDS_PATH, RPPREFIX
-from refprop_engine import KPA_TO_PA, parse_fluid_string
+from refprop_engine import KPA_TO_PA, MOL_DM3_TO_MOL_M3, canonical_fluid_key, molar_base_si, parse_fluid_string
+from refprop_session import get_rp, mark_spline_fitted, spline_flag
 
 # REFPROP 未定义标记
 REFPROP_UNDEFINED = -9999970
 
 
-def _get_rp_instance(rpprefix: Optional[str] = None):
-    """创建并配置 REFPROP 实例"""
-    prefix = rpprefix or RPPREFIX
-    fluids = FLUIDS_PATH or prefix
-    if not prefix or not os.path.isdir(prefix):
-        raise RuntimeError(
-            f"REFPROP 路径未配置或无效: {prefix}。请设置 RPPREFIX 环境变量。"
-        )
-    from ctREFPROP.ctREFPROP import REFPROPFunctionLibrary
-
-    RP = REFPROPFunctionLibrary(prefix)
-    RP.SETPATHdll(fluids)
-    return RP
-
-
 def _clean_num(value: float) -> Optional[float]:
     """将 REFPROP 哨兵值转为 None"""
     if value is None or (isinstance(value, (int, float)) and value <= REFPROP_UNDEFINED):
@@ -40,7 +24,7 @@ def _get_info_string(RP, refprop_fluid: str, z: List[float], h_out: str) -> Opti
     通过 REFPROPdll 获取字符串类 INFO（SAFETY, CAS# 等）
     REFPROP 2dll/1dll 文档：ierr=0 时，hUnits 字符串通过 herr 返回
     """
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
+    MOLAR_BASE_SI = molar_base_si(RP)
     r = RP.REFPROPdll(
         refprop_fluid,
         "CRIT",  # hIn: 临界点（作为有效输入以获取流体信息）
@@ -63,7 +47,7 @@ def _get_info_string(RP, refprop_fluid: str, z: List[float], h_out: str) -> Opti
 
 def _get_info_number(RP, refprop_fluid: str, z: List[float], h_out: str, i_flag: int = 0) -> Optional[float]:
     """通过 REFPROPdll 获取数值类 INFO（GWP, ODP 等）"""
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
+    MOLAR_BASE_SI = molar_base_si(RP)
     r = RP.REFPROPdll(
         refprop_fluid,
         "CRIT",
@@ -85,9 +69,9 @@ def _get_info_number(RP, refprop_fluid: str, z: List[float], h_out: str, i_flag:
 def _get_crit_and_mix_setup(
     RP, refprop_fluid: str, z: List[float], is_mixture: bool
 ) -> tuple:
-    """获取临界点并（混合物）调用 SATSPLN"""
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
-    i_flag = 1 if is_mixture else 0
+    """获取临界点并（混合物）调用 SATSPLN；同一实例上已拟合过的混合物直接复用样条"""
+    MOLAR_BASE_SI = molar_base_si(RP)
+    i_flag = spline_flag(RP) if is_mixture else 0
     r = RP.REFPROPdll(
         refprop_fluid,
         "CRIT",
@@ -101,6 +85,8 @@ def _get_crit_and_mix_setup(
     )
     if r.ierr > 100:
         raise RuntimeError(f"REFPROP 获取临界点失败 (ierr={r.ierr}): {r.herr.strip()}")
+    if i_flag == 1:
+        mark_spline_fitted(RP)
     tc = float(r.Output[0])
     pc_pa = float(r.Output[1])
     hc = float(r.Output[2])
@@ -110,7 +96,7 @@ def _get_crit_and_mix_setup(
 
 def _get_nbp(RP, refprop_fluid: str, z: List[float]) -> Optional[float]:
     """标准沸点：P=101.325 kPa 下的饱和气相温度"""
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
+    MOLAR_BASE_SI = molar_base_si(RP)
     p_kpa = 101.325
     r = RP.REFPROPdll(
         refprop_fluid,
@@ -130,7 +116,7 @@ def _get_nbp(RP, refprop_fluid: str, z: List[float]) -> Optional[float]:
 
 def _get_triple_point(RP, refprop_fluid: str, z: List[float]) -> Dict[str, Optional[float]]:
     """三相点 T, P（若存在）"""
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
+    MOLAR_BASE_SI = molar_base_si(RP)
     r = RP.REFPROPdll(
         refprop_fluid,
         "TRIP",
@@ -156,10 +142,10 @@ def _get_k_value(RP, refprop_fluid: str, z: List[float]) -> Optional[float]:
     k 值 = CP/CV（绝热指数）
     参考状态：101.325 kPa, 298.15 K（常温常压气相）
     """
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
+    MOLAR_BASE_SI = molar_base_si(RP)
     r = RP.REFPROPdll(
         refprop_fluid,
-        "TP",
+        "PT",  # a=P, b=T（顺序须与 hIn 字母一致）
         "CP;CV",
         MOLAR_BASE_SI,
         0,
@@ -177,46 +163,66 @@ def _get_k_value(RP, refprop_fluid: str, z: List[float]) -> Optional[float]:
     return None
 
 
-def get_fluid_info(
-    fluid_string: str,
-    rpprefix: Optional[str] = None,
-) -> Dict[str, Any]:
+def _get_pure_fixed_props(RP, refprop_fluid: str, z: List[float]) -> Optional[Dict[str, Any]]:
     """
-    获取工质参考属性
-    
-    Args:
-        fluid_string: 工质字符串，如 "R32", "R32&R125|0.5&0.5"
-        rpprefix: REFPROP 路径
-    
-    Returns:
-        {
-            "safety_class": str | null,      # ASHRAE 34 安全类别
-            "gwp": float | null,             # 全球变暖潜能值
-            "odp": float | null,             # 臭氧消耗潜能
-            "critical_temperature": float | null,  # 临界温度 [K]
-            "normal_boiling_point": float | null,  # 标准沸点 [K]
-            "cas_number": str | null,        # CAS 编号
-            "triple_point": {"T": K, "P": kPa} | null,  # 三相点
-            "molecular_weight": float | null,  # 分子量 [g/mol]
-            "k_value": float | null,         # 绝热指数 CP/CV（101.325 kPa, 298.15 K）
-        }
+    纯工质：一次 REFPROPdll 调用取回三相点 T/P 及临界温度、分子量、标准沸点、GWP、ODP
+    （hIn=TRIP 给出三相点状态，其余为流体文件中的固定参数）。
+    调用失败（如流体文件缺少某项）时返回 None，由调用方逐项查询。
     """
+    MOLAR_BASE_SI = molar_base_si(RP)
+    r = RP.REFPROPdll(
+        refprop_fluid,
+        "TRIP",
+        "T;P;TC;M;TNBP;GWP;ODP",
+        MOLAR_BASE_SI,
+        0,
+        0,
+        0.0,
+        0.0,
+        list(z),
+    )
+    if r.ierr > 100:
+        return None
+    out = [_clean_num(float(v)) for v in r.Output[:7]]
+    t_trp, p_trp, tc, mol_mass, nbp, gwp, odp = out
+    if tc is None:
+        return None
+    return {
+        "triple": {
+            "T": round(t_trp, 4) if t_trp is not None else None,
+            "P": round(p_trp / KPA_TO_PA, 8) if p_trp is not None else None,
+        },
+        "tc": tc,
+        "mol_mass": mol_mass,
+        "nbp": nbp,
+        "gwp": gwp,
+        "odp": odp,
+    }
+
+
+def _fluid_info_with(RP, fluid_string: str) -> Dict[str, Any]:
+    """在给定 REFPROP 实例上获取单个工质的参考属性"""
     refprop_fluid, z = parse_fluid_string(fluid_string)
     is_mixture = "*" in refprop_fluid
 
-    RP = _get_rp_instance(rpprefix)
+    # 纯工质优先一次调用取回全部数值属性，失败时退回逐项查询
+    fixed = None if is_mixture else _get_pure_fixed_props(RP, refprop_fluid, z)
 
-    # 1. 临界点 + 分子量
-    try:
+    if fixed is not None:
+        tc, mol_mass, nbp = fixed["tc"], fixed["mol_mass"], fixed["nbp"]
+        triple = fixed["triple"]
+        gwp_raw, odp_raw = fixed["gwp"], fixed["odp"]
+    else:
+        # 1. 临界点 + 分子量（混合物同时调用 SATSPLN）
         tc, pc, hc, mol_mass = _get_crit_and_mix_setup(RP, refprop_fluid, z, is_mixture)
-    except RuntimeError:
-        raise
-
-    # 2. 标准沸点
-    nbp = _get_nbp(RP, refprop_fluid, z)
-
-    # 3. 三相点
-    triple = _get_triple_point(RP, refprop_fluid, z)
+        # 2. 标准沸点
+        nbp = _get_nbp(RP, refprop_fluid, z)
+        # 3. 三相点
+        triple = _get_triple_point(RP, refprop_fluid, z)
+        gwp_raw = odp_raw = None
+        if not is_mixture:
+            gwp_raw = _get_info_number(RP, refprop_fluid, z, "GWP")
+            odp_raw = _get_info_number(RP, refprop_fluid, z, "ODP")
     triple_point = triple if (triple["T"] is not None or triple["P"] is not None) else None
 
     # 4. k 值
@@ -229,19 +235,17 @@ def get_fluid_info(
     cas_number = None
     if not is_mixture:
         safety_class = _get_info_string(RP, refprop_fluid, z, "SAFETY")
-        gwp_raw = _get_info_number(RP, refprop_fluid, z, "GWP")
         # REFPROP 流体文件用 GWP=-1 表示“不适用/零”，需转为 0
         gwp = 0.0 if (gwp_raw is not None and gwp_raw < 0) else gwp_raw
-        odp_raw = _get_info_number(RP, refprop_fluid, z, "ODP")
         # REFPROP 流体文件用 ODP=-1 表示“零/不消耗臭氧”，需转为 0
         odp = 0.0 if (odp_raw is not None and odp_raw < 0) else odp_raw
         cas_number = _get_info_string(RP, refprop_fluid, z, "CAS#")
         if mol_mass is None:
             mol_mass = _get_info_number(RP, refprop_fluid, z, "M")
 
-    # 混合物分子量：临界点调用已返回 M，若为空则用 INFO 补充
+    # 混合物分子量：临界点调用已返回 M，若为空则用 INFO 补充（样条已由临界点调用拟合，iFlag=0）
     if mol_mass is None:
-        mol_mass = _get_info_number(RP, refprop_fluid, z, "M", i_flag=1 if is_mixture else 0)
+        mol_mass = _get_info_number(RP, refprop_fluid, z, "M")
 
     # REFPROP MOLAR_BASE_SI 返回分子量 [kg/mol]，API 约定为 [g/mol]，需乘以 1000
     if mol_mass is not None and mol_mass < 10:
@@ -258,3 +262,96 @@ def get_fluid_info(
         "molecular_weight": round(mol_mass, 4) if mol_mass is not None else None,
         "k_value": k_val,
     }
+
+
+def get_fluid_info(
+    fluid_string: str,
+    rpprefix: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    获取工质参考属性
+    
+    Args:
+        fluid_string: 工质字符串，如 "R32", "R32&R125|0.5&0.5"
+        rpprefix: REFPROP 路径
+    
+    Returns:
+        {
+            "safety_class": str | null,      # ASHRAE 34 安全类别
+            "gwp": float | null,             # 全球变暖潜能值
+            "odp": float | null,             # 臭氧消耗潜能
+            "critical_temperature": float | null,  # 临界温度 [K]
+            "normal_boiling_point": float | null,  # 标准沸点 [K]
+            "cas_number": str | null,        # CAS 编号
+            "triple_point": {"T": K, "P": kPa} | null,  # 三相点
+            "molecular_weight": float | null,  # 分子量 [g/mol]
+            "k_value": float | null,         # 绝热指数 CP/CV（101.325 kPa, 298.15 K）
+        }
+    """
+    RP = get_rp(canonical_fluid_key(fluid_string), rpprefix)
+    return _fluid_info_with(RP, fluid_string)
+
+
+def get_fluid_info_batch(
+    fluid_strings: List[str],
+    rpprefix: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    批量获取工质参考属性（同一 REFPROP 实例依次处理）
+    
+    Returns:
+        与输入顺序一致的列表，每项为 {"fluid": 工质字符串, "info": {...}}
+        或 {"fluid": 工质字符串, "error": 错误信息}；单个工质失败不影响其他工质
+    """
+    results: List[Dict[str, Any]] = []
+    for fluid_string in fluid_strings:
+        try:
+            RP = get_rp(canonical_fluid_key(fluid_string), rpprefix)
+            results.append({"fluid": fluid_string, "info": _fluid_info_with(RP, fluid_string)})
+        except (ValueError, RuntimeError) as e:
+            results.append({"fluid": fluid_string, "error": str(e)})
+    return results
+
+
+def _get_eos_limits(RP, refprop_fluid: str, z: List[float]) -> Dict[str, Optional[float]]:
+    """状态方程适用范围：EOSMIN 给出最低温度，EOSMAX 给出最高温度、最高压力、最大密度"""
+    MOLAR_BASE_SI = molar_base_si(RP)
+    limits: Dict[str, Optional[float]] = {"T_min": None, "T_max": None, "P_max": None, "D_max": None}
+    r = RP.REFPROPdll(refprop_fluid, "EOSMIN", "T", MOLAR_BASE_SI, 0, 0, 0.0, 0.0, list(z))
+    if r.ierr <= 100:
+        limits["T_min"] = _clean_num(float(r.Output[0]))
+    r = RP.REFPROPdll(refprop_fluid, "EOSMAX", "T;P;D", MOLAR_BASE_SI, 0, 0, 0.0, 0.0, list(z))
+    if r.ierr <= 100:
+        t_max, p_max, d_max = (_clean_num(float(v)) for v in r.Output[:3])
+        limits["T_max"] = t_max
+        limits["P_max"] = p_max / KPA_TO_PA if p_max is not None else None
+        limits["D_max"] = d_max / MOL_DM3_TO_MOL_M3 if d_max is not None else None
+    return limits
+
+
+def get_fluid_limits(
+    fluid_string: str,
+    rpprefix: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    工质输入范围，供 API 进程在调用 REFPROP 之前校验输入（input_limits）
+
+    Returns:
+        {
+            "mixture": bool,
+            "T_min": K | null, "T_max": K | null,     # 状态方程温度范围
+            "P_max": kPa | null, "D_max": mol/dm³ | null,
+            "triple_point": {"T": K, "P": kPa},       # 值可能为 null
+            "critical": {"T": K, "P": kPa},
+        }
+    """
+    refprop_fluid, z = parse_fluid_string(fluid_string)
+    is_mixture = "*" in refprop_fluid
+    RP = get_rp(canonical_fluid_key(fluid_string), rpprefix)
+    tc, pc, _, _ = _get_crit_and_mix_setup(RP, refprop_fluid, z, is_mixture)
+    return {
+        "mixture": is_mixture,
+        **_get_eos_limits(RP, refprop_fluid, z),
+        "triple_point": _get_triple_point(RP, refprop_fluid, z),
+        "critical": {"T": tc, "P": pc},
+    }
@@ -0,0 +1,168 @@
+"""
+换热器沿程物性离散计算（冷凝器 / 蒸发器）
+校核夹点与温度滑移需要沿换热器 50~200 个状态点；以前前端对每个点单独调用一次 /calculate PH。
+
+compute_hx_profile 在一个计算进程、一次工质设置内完成整条沿程：
+  - 焓从进口到出口按换热量等分为 segments 段，压力按换热量比例线性计入压降
+  - 相邻两点相态不同（过冷 / 两相 / 过热）时，在两点之间求出泡点、露点的准确位置并插入沿程，
+    夹点常常正好位于相变点
+  - 混合物首次闪蒸拟合 SATSPLN 相界样条（已拟合则复用），其后各点的两相闪蒸都使用样条
+  - 给定二次流体（水、空气等，按定比热处理，温度沿换热量线性变化）时返回各点的二次流体温度与夹点
+  - 个别等分点闪蒸失败时该点物性为 None 并记入 errors，其余各点照常计算（同 /calculate/batch）
+
+单位：同 /calculate，P [kPa]，H [J/mol]，T [K]。
+"""
+from typing import Dict, List, Optional, Tuple
+
+from refprop_engine import KPA_TO_PA, canonical_fluid_key, flash, parse_fluid_string
+from refprop_session import get_rp, mark_spline_fitted, spline_flag
+
+HX_MAX_SEGMENTS = 500   # 单条沿程最多的分段数
+BOUNDARY_ITERS = 20     # 求相变点位置的迭代次数上限
+BOUNDARY_TOL = 1e-9     # 相变点位置（换热量比例）的收敛判据
+FLOW_ARRANGEMENTS = ("counter", "parallel")
+STATE_PROPERTIES = ("T", "P", "D", "H", "S", "Q", "CP", "CV", "W", "VIS", "TCX", "PRANDTL")
+
+
+def _phase(q: Optional[float]) -> int:
+    """相态分类：0 过冷液 / 1 两相 / 2 过热气或超临界（REFPROP 单相区的 Q 为 -998、998、999）"""
+    if q is None or q > 1.0:
+        return 2
+    return 0 if q < 0.0 else 1
+
+
+def _locate_boundary(
+    solve, p_at, h_at, q: float, f_a: float, f_b: float,
+) -> Optional[Tuple[float, dict]]:
+    """
+    在换热量比例 [f_a, f_b] 内求饱和线（q=0 泡点 / q=1 露点）的位置
+
+    位置 f 满足 H(f) = H_sat(P(f), q)：以区间端点为初值做不动点迭代（压降对饱和焓的影响很小，
+    通常两三次即收敛）。超临界或未收敛时返回 None。
+    """
+    lo, hi = min(f_a, f_b), max(f_a, f_b)
+    f = f_a
+    for _ in range(BOUNDARY_ITERS):
+        try:
+            state = solve("PQ", p_at(f), q)
+        except RuntimeError:
+            return None
+        f_new = (state["H"] - h_at(0.0)) / (h_at(1.0) - h_at(0.0))
+        if not lo - BOUNDARY_TOL <= f_new <= hi + BOUNDARY_TOL:
+            return None
+        if abs(f_new - f) < BOUNDARY_TOL:
+            return f_new, state
+        f = f_new
+    return None
+
+
+def _secondary_temperature(secondary: dict, f: float) -> float:
+    """二次流体在换热量比例 f 处的温度：逆流时二次流体从制冷剂出口侧进入"""
+    t_in, t_out = float(secondary["T_in"]), float(secondary["T_out"])
+    if secondary.get("flow", "counter") == "counter":
+        return t_out + (t_in - t_out) * f
+    return t_in + (t_out - t_in) * f
+
+
+def compute_hx_profile(
+    fluid_string: str,
+    pressure: float,
+    h_in: float,
+    h_out: float,
+    segments: int = 50,
+    pressure_drop: float = 0.0,
+    secondary: Optional[dict] = None,
+    rpprefix: Optional[str] = None,
+    fluids_path: Optional[str] = None,
+) -> dict:
+    """
+    换热器内制冷剂的沿程状态
+
+    Args:
+        pressure: 进口压力 [kPa]
+        h_in, h_out: 进口、出口焓 [J/mol]；h_out < h_in 为冷凝器/气冷器（制冷剂放热），反之为蒸发器
+        segments: 分段数，返回 segments + 1 个等分点（另加沿程中的泡点、露点）
+        pressure_drop: 进出口压降 [kPa]，按换热量比例线性分布
+        secondary: 二次流体 {T_in, T_out [K], flow: "counter" | "parallel"}，给定时计算夹点
+
+    Returns:
+        {
+          "mode": "cooling" | "heating",
+          "points": [{fraction, kind: "segment" | "bubble" | "dew", T, P, D, H, S, Q, CP, ..., T_secondary?}, ...],
+          "glide": 沿程露点与泡点温差 [K]（两者都在沿程内时），
+          "pinch": {index, fraction, T, T_secondary, delta_T}（给定二次流体时；delta_T < 0 为温度交叉），
+          "errors": {points 序号: 错误信息}（闪蒸失败的等分点，物性为 None，不参与相变点与夹点计算）
+        }
+    """
+    segments = int(segments)
+    if not 1 <= segments <= HX_MAX_SEGMENTS:
+        raise ValueError(f"segments 须在 1~{HX_MAX_SEGMENTS} 之间。当前: {segments}")
+    if h_in == h_out:
+        raise ValueError("h_in 与 h_out 相同，换热量为 0")
+    if not 0.0 <= pressure_drop < pressure:
+        raise ValueError(f"pressure_drop 须在 0 与进口压力 {pressure:g} kPa 之间。当前: {pressure_drop:g}")
+    if secondary is not None and secondary.get("flow", "counter") not in FLOW_ARRANGEMENTS:
+        raise ValueError(f"flow 须为 {' / '.join(FLOW_ARRANGEMENTS)}。当前: {secondary.get('flow')}")
+
+    refprop_fluid, z = parse_fluid_string(fluid_string)
+    RP = get_rp(canonical_fluid_key(fluid_string), rpprefix, fluids_path)
+    iflag = spline_flag(RP) if "*" in refprop_fluid else 0
+
+    def solve(h_in_type: str, p: float, b: float) -> dict:
+        """以压力 [kPa] 与焓或干度为输入闪蒸（PH / PQ）"""
+        nonlocal iflag
+        state = flash(RP, refprop_fluid, z, h_in_type, p * KPA_TO_PA, b, [], iflag)
+        if iflag:
+            mark_spline_fitted(RP)
+            iflag = 0
+        return state
+
+    def p_at(f: float) -> float:
+        return pressure - pressure_drop * f
+
+    def h_at(f: float) -> float:
+        return h_in + (h_out - h_in) * f
+
+    points: List[dict] = []
+    errors: Dict[int, str] = {}
+    previous: Optional[dict] = None  # 上一个计算成功的点，相变点在它与当前点之间查找
+    for i in range(segments + 1):
+        f = i / segments
+        try:
+            state = {"fraction": f, "kind": "segment", **solve("PH", p_at(f), h_at(f))}
+        except RuntimeError as e:
+            errors[len(points)] = str(e)
+            points.append({"fraction": f, "kind": "segment", **dict.fromkeys(STATE_PROPERTIES)})
+            continue
+        if previous is not None:
+            a, b = _phase(previous["Q"]), _phase(state["Q"])
+            if a != b:
+                # 跨越的饱和线，按流动方向排列：过冷->过热依次经过泡点、露点
+                crossed = [q for q, lo, hi in ((0.0, 0, 1), (1.0, 1, 2)) if min(a, b) <= lo and hi <= max(a, b)]
+                for q in crossed if a < b else reversed(crossed):
+                    found = _locate_boundary(solve, p_at, h_at, q, previous["fraction"], f)
+                    if found is not None:
+                        f_sat, sat = found
+                        points.append({**sat, "fraction": f_sat, "kind": "bubble" if q == 0.0 else "dew"})
+        points.append(state)
+        previous = state
+
+    result: dict = {"mode": "cooling" if h_out < h_in else "heating", "points": points, "errors": errors}
+    t_sat = {p["kind"]: p["T"] for p in points if p["kind"] != "segment"}
+    if "bubble" in t_sat and "dew" in t_sat:
+        result["glide"] = t_sat["dew"] - t_sat["bubble"]
+
+    if secondary is not None:
+        pinch = None
+        for index, point in enumerate(points):
+            t_sec = _secondary_temperature(secondary, point["fraction"])
+            point["T_secondary"] = t_sec
+            if point["T"] is None:
+                continue
+            # 冷凝器中制冷剂为热侧，蒸发器中为冷侧；delta_T 为热侧减冷侧
+            delta = point["T"] - t_sec if h_out < h_in else t_sec - point["T"]
+            if pinch is None or delta < pinch["delta_T"]:
+                pinch = {"index": index, "fraction": point["fraction"], "T": point["T"],
+                         "T_secondary": t_sec, "delta_T": delta}
+        result["pinch"] = pinch
+    return result
@@ -0,0 +1,162 @@
+"""
+输入范围预校验
+超出工质适用范围的输入（低于状态方程最低温度、压力远超上限、干度不在 0~1 等）以前要一直送进 REFPROPdll，
+以 ierr > 100 的 RuntimeError 返回 500；失败的闪蒸往往还是最慢的调用。
+
+各工质的范围（状态方程 Tmin/Tmax/Pmax/Dmax、三相点、临界点）由计算进程查询一次（fluid_info.get_fluid_limits，
+混合物含带 SATSPLN 拟合的临界点计算，按 fluid_limits 成本计入请求方的准入），按规范化工质键存入结果缓存（进程内 + 跨 worker 共享），此后 /calculate 与批量接口在 API 进程内
+以微秒级开销拒绝不可能的输入，返回结构化的 400。
+
+REFPROP 允许在 Tmax、Pmax 以上一定范围内外推（只给出警告），因此上限按 T_MAX_EXTRAPOLATION、
+P_MAX_EXTRAPOLATION 放宽后才拒绝；只拒绝一定会失败的输入。查询失败的工质在 FAILED_RETRY 秒内不再查询，
+其输入照常交给 REFPROP 计算（由 REFPROP 给出错误信息）。
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from admission import admit
+from calc_pool import CalculationTimeout, pool_size, run_task, run_tasks
+from result_cache import cache_get, cache_put
+
+T_MAX_EXTRAPOLATION = 1.5  # 温度上限：状态方程 Tmax 的倍数
+P_MAX_EXTRAPOLATION = 2.0  # 压力上限：状态方程 Pmax 的倍数
+D_MAX_MARGIN = 1.05        # 密度上限：状态方程 Dmax 的倍数
+FAILED_RETRY = 300.0       # 范围查询失败后多久再重试 [s]
+
+# 输入字母 -> (性质名, 单位)
+_PROPS = {"T": ("温度", "K"), "P": ("压力", "kPa"), "D": ("密度", "mol/dm³"), "Q": ("干度", "-")}
+
+_failed: Dict[str, float] = {}  # 规范化工质键 -> 范围查询失败的时间
+_failed_lock = threading.Lock()
+
+
+class InputOutOfRange(ValueError):
+    """输入超出工质适用范围（路由返回结构化的 400）"""
+
+    def __init__(self, field: str, prop: str, value: float, message: str, limits: Dict[str, Optional[float]]):
+        super().__init__(message)
+        self.field = field
+        self.prop = prop
+        self.value = value
+        self.limits = limits
+
+    def detail(self) -> dict:
+        return {
+            "error": "input_out_of_range",
+            "message": str(self),
+            "field": self.field,
+            "property": self.prop,
+            "value": self.value,
+            "limits": self.limits,
+        }
+
+
+def _known(fluid_key: str) -> Tuple[bool, Optional[dict]]:
+    """(无需查询, 范围)：缓存命中，或 FAILED_RETRY 秒内查询失败过（范围未知，返回 None）"""
+    limits = cache_get("limits", fluid_key)
+    if limits is not None:
+        return True, limits
+    with _failed_lock:
+        failed_at = _failed.get(fluid_key)
+    return failed_at is not None and time.monotonic() - failed_at < FAILED_RETRY, None
+
+
+def _store(fluid_key: str, limits: Optional[dict]) -> None:
+    """记录查询结果：成功的存入结果缓存，失败的记下时间"""
+    if limits is None:
+        with _failed_lock:
+            _failed[fluid_key] = time.monotonic()
+    else:
+        cache_put("limits", fluid_key, limits)
+
+
+def get_limits(fluid_key: str, fluid_string: str, client: str) -> Optional[dict]:
+    """
+    取工质的输入范围（缓存未命中时在 client 的准入下于计算进程中查询一次）；查询失败返回 None
+
+    准入拒绝时抛出 HTTPException（429/503），与随后的计算请求一样返回给客户端。
+    """
+    known, limits = _known(fluid_key)
+    if known:
+        return limits
+    try:
+        with admit(client, "fluid_limits"):
+            limits = run_task("fluid_limits", fluid_string=fluid_string)
+    except (ValueError, RuntimeError, CalculationTimeout):
+        limits = None
+    _store(fluid_key, limits)
+    return limits
+
+
+def get_limits_many(fluids: Dict[str, str], client: str) -> Dict[str, Optional[dict]]:
+    """
+    批量取多个工质的输入范围（规范化工质键 -> 工质字符串），返回 规范化工质键 -> 范围（失败为 None）
+
+    缓存未命中的工质在 client 的一次准入下（按工质数计费）于各计算进程间并行查询。
+    """
+    result: Dict[str, Optional[dict]] = {}
+    missing = []
+    for key in fluids:
+        known, limits = _known(key)
+        if known:
+            result[key] = limits
+        else:
+            missing.append(key)
+    if missing:
+        with admit(client, "fluid_limits", len(missing), min(len(missing), pool_size())):
+            for i, limits, err in run_tasks("fluid_limits", [{"fluid_string": fluids[k]} for k in missing]):
+                result[missing[i]] = limits if err is None else None
+                _store(missing[i], result[missing[i]])
+    return result
+
+
+def _reject(field: str, letter: str, value: float, reason: str, **limits: Optional[float]) -> None:
+    name, unit = _PROPS[letter]
+    raise InputOutOfRange(field, letter, value, f"{field} ({name} {value:g} {unit}) {reason}", limits)
+
+
+def _check_value(limits: dict, field: str, letter: str, value: float) -> None:
+    if letter == "T":
+        t_min, t_max = limits.get("T_min"), limits.get("T_max")
+        if t_min is not None and value < t_min:
+            _reject(field, letter, value, f"低于状态方程最低温度 {t_min:g} K", min=t_min)
+        if t_max is not None and value > t_max * T_MAX_EXTRAPOLATION:
+            _reject(field, letter, value, f"超出状态方程可外推的最高温度 {t_max * T_MAX_EXTRAPOLATION:g} K",
+                    max=t_max * T_MAX_EXTRAPOLATION)
+    elif letter == "P":
+        p_max = limits.get("P_max")
+        if value <= 0:
+            _reject(field, letter, value, "必须大于 0", min=0.0)
+        if p_max is not None and value > p_max * P_MAX_EXTRAPOLATION:
+            _reject(field, letter, value, f"超出状态方程可外推的最高压力 {p_max * P_MAX_EXTRAPOLATION:g} kPa",
+                    max=p_max * P_MAX_EXTRAPOLATION)
+    elif letter == "D":
+        d_max = limits.get("D_max")
+        if value <= 0:
+            _reject(field, letter, value, "必须大于 0", min=0.0)
+        if d_max is not None and value > d_max * D_MAX_MARGIN:
+            _reject(field, letter, value, f"超出状态方程最大密度 {d_max:g} mol/dm³", max=d_max * D_MAX_MARGIN)
+    elif letter == "Q":
+        if not 0.0 <= value <= 1.0:
+            _reject(field, letter, value, "须在 0~1 之间", min=0.0, max=1.0)
+
+
+def check_inputs(limits: Optional[dict], h_in: str, value1: float, value2: float) -> None:
+    """
+    校验一个状态点的输入，超出范围时抛出 InputOutOfRange
+
+    h_in 为规范化（大写、两字符）的输入类型；limits 为 None（范围未知）时只做与工质无关的检查。
+    纯工质的饱和输入（含 Q）另外要求 T、P 不高于临界点；混合物的临界凝析温度/压力高于临界点，不做此检查。
+    """
+    limits = limits or {}
+    fields = (("value1", h_in[0], value1), ("value2", h_in[1], value2))
+    for field, letter, value in fields:
+        _check_value(limits, field, letter, value)
+    critical = limits.get("critical") or {}
+    if "Q" in h_in and not limits.get("mixture", True):
+        for field, letter, value in fields:
+            if letter == "T" and critical.get("T") is not None and value > critical["T"]:
+                _reject(field, letter, value, f"高于临界温度 {critical['T']:g} K，不存在饱和状态", max=critical["T"])
+            if letter == "P" and critical.get("P") is not None and value > critical["P"]:
+                _reject(field, letter, value, f"高于临界压力 {critical['P']:g} kPa，不存在饱和状态", max=critical["P"])
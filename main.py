@@ -2,17 +2,63 @@
 基于 REFPROP 10.0 的热力学计算 API（进阶版）
 用于高温热泵、新工质开发等高精度工业应用，支持多 App 接入
 """
-from contextlib import asynccontextmanager
-from typing import Optional
+import csv
+import json
+import os
+import tempfile
+from contextlib import ExitStack, asynccontextmanager, closing
+from typing import Dict, Iterator, List, Literal, Optional, Tuple, Union
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
-from config import ALLOWED_ORIGINS
-from dome_engine import compute_saturation_dome
-from fluid_info import get_fluid_info
-from refprop_engine import calculate_properties
+from admission import admit, get_controller
+from calc_pool import (
+    CalculationTimeout,
+    batch_timeout,
+    pool_size,
+    pool_stats,
+    run_task,
+    run_tasks,
+    start_pool,
+    stop_pool,
+)
+from bulk_job import MEDIA_TYPES, detect_format, run_job
+from capture import CaptureMiddleware, capture_stats
+from config import ADMISSION_ENABLED, ALLOWED_ORIGINS, BULK_MAX_MB, CALC_TIMEOUT_FLUID_INFO, CAPTURE_PATH
+from dependencies import client_identity, verify_api_key
+from compressor_map import SUBCOOLING_DEFAULT, SUPERHEAT_DEFAULT, fit_ahri540
+from dome_engine import CHART_MAX_LINES
+from hx_profile import HX_MAX_SEGMENTS
+from input_limits import InputOutOfRange, check_inputs, get_limits
+from micro_batch import get_batcher
+from refprop_engine import canonical_fluid_key
+from resource_stats import resources
+from result_cache import cache_get, cache_put, cache_stats
+
+MAX_COMPARE_FLUIDS = 12  # /dome/compare 单次最多对比的工质数
+MAX_BATCH_FLUIDS = 50    # /fluid-info/batch 单次最多查询的工质数
+MAX_BATCH_POINTS = 1000  # /calculate/batch 单次最多计算的状态点数
+MAX_MAP_TEMPERATURES = 40  # /compressor/map 蒸发、冷凝温度各自最多的取值数
+MAP_MIN_CHUNK = 16         # /compressor/map 分给一个计算进程的最少网格点数
+
+# /fluid-info/batch 列表格的列（三相点拆为 T、P 两列）
+FLUID_INFO_COLUMNS = [
+    "safety_class",
+    "gwp",
+    "odp",
+    "critical_temperature",
+    "normal_boiling_point",
+    "cas_number",
+    "triple_point_T",
+    "triple_point_P",
+    "molecular_weight",
+    "k_value",
+]
 
 
 # --- 请求/响应模型 ---
@@ -29,6 +75,28 @@ class CalculateRequest(BaseModel):
     )
     value1: float = Field(..., description="第一个输入参数的值")
     value2: float = Field(..., description="第二个输入参数的值")
+    derivatives: Optional[List[str]] = Field(
+        None,
+        description="同时返回的偏导数，如 ['DPDT','DPDD','DHDP_T','DDDP_H','JT']，见 API.md",
+    )
+    jacobian: bool = Field(
+        False,
+        description="为 true 时同时返回 T/P/D/H/S 中各输出性质对两个输入量的偏导（输入类型须由这些性质组成）",
+    )
+
+
+class CalculateBatchRequest(BaseModel):
+    """POST /calculate/batch 请求体"""
+    fluid_string: str = Field(..., description="工质字符串，同 /calculate")
+    input_type: str = Field(..., description="输入类型，同 /calculate，所有状态点共用")
+    points: List[Tuple[float, float]] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_POINTS,
+        description="状态点列表 [[value1, value2], ...]",
+    )
+    derivatives: Optional[List[str]] = Field(None, description="同 /calculate")
+    jacobian: bool = Field(False, description="同 /calculate")
 
 
 class DomeRequest(BaseModel):
@@ -37,13 +105,70 @@ class DomeRequest(BaseModel):
         ...,
         description="工质字符串。纯工质如 'R32'；混合物别名如 'R515B'；混合工质如 'R32&R125|0.5&0.5'"
     )
+    mode: Literal["tq", "envelope"] = Field(
+        "tq",
+        description="tq：逐温度饱和计算至临界点前；envelope：混合物沿相界样条计算穿过临界点的完整相包络线",
+    )
 
 
 class DomeResponse(BaseModel):
-    """POST /dome 响应体"""
+    """POST /dome 响应体；cricondenbar、cricondentherm 仅在 envelope 模式下出现，fallback 仅在 envelope 退回 tq 时出现"""
     liquid: list = Field(..., description="饱和液线 (q=0) 的 [P, H] 点列表")
     vapor: list = Field(..., description="饱和气线 (q=1) 的 [P, H] 点列表")
     critical: dict = Field(..., description="临界点 {T, P, H}")
+    cricondenbar: Optional[dict] = Field(None, description="临界凝析压力点（包络线最高压力）{T, P, H}")
+    cricondentherm: Optional[dict] = Field(None, description="临界凝析温度点（包络线最高温度）{T, P, H}")
+    fallback: Optional[str] = Field(None, description="仅当 envelope 模式计算失败、退回 tq 计算时出现：失败原因")
+
+
+class DomeCompareRequest(BaseModel):
+    """POST /dome/compare 请求体"""
+    fluids: List[str] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_COMPARE_FLUIDS,
+        description="待对比的工质字符串列表，如 ['R32', 'R454B', 'R515B', 'R1234ZEE']",
+    )
+    stream: bool = Field(
+        False,
+        description="为 true 时以 NDJSON 流式返回，每完成一个工质输出一行",
+    )
+    mode: Literal["tq", "envelope"] = Field("tq", description="同 /dome")
+
+
+class DomeCompareResponse(BaseModel):
+    """POST /dome/compare 响应体"""
+    domes: Dict[str, DomeResponse] = Field(..., description="工质字符串 -> 饱和包络线")
+    errors: Dict[str, str] = Field(default_factory=dict, description="计算失败的工质 -> 错误信息")
+
+
+class ChartRequest(BaseModel):
+    """POST /dome/chart 请求体；窗口边界未给定时由饱和包络线确定"""
+    fluid_string: str = Field(..., description="工质字符串，同 /dome")
+    p_min: Optional[float] = Field(None, gt=0, description="窗口最低压力 [kPa]，默认饱和线最低压力")
+    p_max: Optional[float] = Field(None, gt=0, description="窗口最高压力 [kPa]，默认 3 倍临界压力")
+    h_min: Optional[float] = Field(None, description="窗口最小焓 [J/mol]，默认饱和液线最小焓")
+    h_max: Optional[float] = Field(None, description="窗口最大焓 [J/mol]，默认饱和气线最大焓外加 50% 饱和焓范围")
+    isotherms: List[float] = Field(default_factory=list, max_length=CHART_MAX_LINES, description="等温线温度 [K]")
+    isentropes: List[float] = Field(default_factory=list, max_length=CHART_MAX_LINES, description="等熵线熵值 [J/(mol·K)]")
+    isochores: List[float] = Field(default_factory=list, max_length=CHART_MAX_LINES, description="等容线密度 [mol/dm³]")
+    qualities: List[float] = Field(default_factory=list, max_length=CHART_MAX_LINES, description="等干度线干度 (0~1)")
+
+
+class ChartLine(BaseModel):
+    """P-h 图上的一条等值线"""
+    value: float = Field(..., description="等值线取值（T [K]、S [J/(mol·K)]、D [mol/dm³] 或 Q）")
+    points: List[dict] = Field(..., description="[{P, H}, ...]，按曲线顺序；无法计算时为空")
+
+
+class ChartResponse(BaseModel):
+    """POST /dome/chart 响应体"""
+    dome: DomeResponse = Field(..., description="饱和包络线，同 /dome")
+    window: Dict[str, List[float]] = Field(..., description="实际使用的窗口 {P: [p_min, p_max], H: [h_min, h_max]}")
+    isotherms: List[ChartLine] = Field(default_factory=list, description="等温线，顺序同请求")
+    isentropes: List[ChartLine] = Field(default_factory=list, description="等熵线，顺序同请求")
+    isochores: List[ChartLine] = Field(default_factory=list, description="等容线，顺序同请求")
+    qualities: List[ChartLine] = Field(default_factory=list, description="等干度线，顺序同请求")
 
 
 class FluidInfoRequest(BaseModel):
@@ -67,8 +192,27 @@ class FluidInfoResponse(BaseModel):
     k_value: Optional[float] = Field(None, description="绝热指数 CP/CV @ 101.325 kPa, 298.15 K")
 
 
-class CalculateResponse(BaseModel):
-    """POST /calculate 响应体"""
+class FluidInfoBatchRequest(BaseModel):
+    """POST /fluid-info/batch 请求体"""
+    fluids: List[str] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_FLUIDS,
+        description="工质字符串列表，如 ['R32', 'R454B', 'R515B']",
+    )
+
+
+class FluidInfoBatchResponse(BaseModel):
+    """POST /fluid-info/batch 响应体（列式表格）"""
+    fluids: List[str] = Field(..., description="工质字符串（去重后，顺序同请求），各列与之一一对应")
+    columns: Dict[str, List[Optional[Union[float, str]]]] = Field(
+        ..., description="列名 -> 各工质的值；三相点拆为 triple_point_T [K]、triple_point_P [kPa]"
+    )
+    errors: Dict[str, str] = Field(default_factory=dict, description="查询失败的工质 -> 错误信息")
+
+
+class StateProperties(BaseModel):
+    """状态点物性（/calculate 响应体的基本字段）"""
     T: Optional[float] = Field(None, description="温度 [K]")
     P: Optional[float] = Field(None, description="压力 [kPa]")
     D: Optional[float] = Field(None, description="密度 [mol/dm³]")
@@ -83,10 +227,66 @@ class CalculateResponse(BaseModel):
     PRANDTL: Optional[float] = Field(None, description="普朗特数 [-]")
 
 
+class CalculateResponse(StateProperties):
+    """POST /calculate 响应体；derivatives、jacobian 仅在请求时出现（路由按 exclude_unset 输出）"""
+    derivatives: Optional[Dict[str, Optional[float]]] = Field(
+        None, description="偏导数名称 -> 值（DEFAULT 单位），仅在请求 derivatives 时返回"
+    )
+    jacobian: Optional[Dict[str, Dict[str, Optional[float]]]] = Field(
+        None, description="输出性质 -> {输入性质: 偏导数}，仅在 jacobian=true 时返回"
+    )
+
+
+class CalculateBatchResponse(BaseModel):
+    """POST /calculate/batch 响应体"""
+    results: List[Optional[CalculateResponse]] = Field(
+        ..., description="与 points 一一对应；计算失败的点为 null"
+    )
+    errors: Dict[int, str] = Field(default_factory=dict, description="失败状态点序号 -> 错误信息")
+
+
+class SecondaryFluid(BaseModel):
+    """换热器二次流体（水、空气等，按定比热处理，温度沿换热量线性变化）"""
+    T_in: float = Field(..., gt=0, description="二次流体进口温度 [K]")
+    T_out: float = Field(..., gt=0, description="二次流体出口温度 [K]")
+    flow: Literal["counter", "parallel"] = Field("counter", description="流动方式：counter 逆流 / parallel 顺流")
+
+
+class HXProfileRequest(BaseModel):
+    """POST /hx/profile 请求体"""
+    fluid_string: str = Field(..., description="工质字符串，同 /calculate")
+    pressure: float = Field(..., gt=0, description="制冷剂进口压力 [kPa]")
+    pressure_drop: float = Field(0.0, ge=0, description="进出口压降 [kPa]，按换热量比例线性分布")
+    h_in: float = Field(..., description="制冷剂进口焓 [J/mol]")
+    h_out: float = Field(..., description="制冷剂出口焓 [J/mol]；小于 h_in 为冷凝器/气冷器，大于 h_in 为蒸发器")
+    segments: int = Field(50, ge=1, le=HX_MAX_SEGMENTS, description=f"分段数（1~{HX_MAX_SEGMENTS}），返回 segments+1 个等分点")
+    secondary: Optional[SecondaryFluid] = Field(None, description="二次流体，给定时计算各点二次流体温度与夹点")
+
+
+class HXPoint(StateProperties):
+    """换热器沿程的一个状态点"""
+    fraction: float = Field(..., description="距制冷剂进口的换热量比例 (0~1)")
+    kind: Literal["segment", "bubble", "dew"] = Field(..., description="segment 等分点 / bubble 泡点 / dew 露点")
+    T_secondary: Optional[float] = Field(None, description="该处二次流体温度 [K]（给定 secondary 时）")
+
+
+class HXProfileResponse(BaseModel):
+    """POST /hx/profile 响应体"""
+    mode: Literal["cooling", "heating"] = Field(..., description="cooling 制冷剂放热（冷凝器）/ heating 制冷剂吸热（蒸发器）")
+    points: List[HXPoint] = Field(..., description="沿程状态点，按换热量比例排列，含沿程中的泡点、露点")
+    glide: Optional[float] = Field(None, description="沿程露点与泡点温差 [K]（含压降影响；两者都在沿程内时返回）")
+    pinch: Optional[dict] = Field(
+        None, description="夹点 {index, fraction, T, T_secondary, delta_T}，delta_T 为热侧减冷侧，小于 0 为温度交叉"
+    )
+    errors: Dict[int, str] = Field(default_factory=dict, description="闪蒸失败的点（points 序号）-> 错误信息，该点物性为 null")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """应用生命周期：启动时记录配置"""
+    """应用生命周期：启动/关闭本 worker 的 REFPROP 计算子进程池"""
+    start_pool()
     yield
+    stop_pool()
 
 
 app = FastAPI(
@@ -103,35 +303,330 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Content-Type"],
+    allow_headers=["Content-Type", "X-API-Key"],
+    expose_headers=["Retry-After"],
 )
 
+# 流量抓取（CAPTURE_PATH 非空时开启，replay.py 回放）；最外层，耗时含 CORS 等全部处理
+if CAPTURE_PATH:
+    app.add_middleware(CaptureMiddleware)
 
-@app.post("/calculate", response_model=CalculateResponse)
-def calculate(req: CalculateRequest) -> CalculateResponse:
+
+@app.post("/calculate", response_model=CalculateResponse, response_model_exclude_unset=True)
+def calculate(req: CalculateRequest, client: str = Depends(client_identity)) -> CalculateResponse:
     """
     热力学性质计算
     
     - **fluid_string**: 工质（纯或混合）。混合格式: `R32&R125|0.5&0.5`
     - **input_type**: PT, PQ, PH, TD 等两字符组合
     - **value1, value2**: 对应输入类型的数值（单位见 REFPROP 文档）
+    - **derivatives / jacobian**: 可选偏导数，与状态点在同一次 REFPROP 调用中计算
+
+    计算进程全忙时，同一工质、同一输入类型的并发请求在服务端合并为一批计算（见 micro_batch）。
+    超出工质适用范围的输入在调用 REFPROP 之前即返回 400，detail 为 {error, message, field, property, value, limits}。
     """
     try:
-        result = calculate_properties(
-            fluid_string=req.fluid_string,
-            input_type=req.input_type,
-            value1=req.value1,
-            value2=req.value2,
+        key = (
+            canonical_fluid_key(req.fluid_string),
+            req.input_type.upper().strip(),
+            req.value1,
+            req.value2,
+            tuple(sorted(d.upper().strip() for d in req.derivatives or [])),
+            req.jacobian,
         )
+        result = cache_get("calculate", key)
+        if result is None:
+            if len(key[1]) == 2:
+                check_inputs(get_limits(key[0], req.fluid_string, client), key[1], req.value1, req.value2)
+            result = get_batcher().calculate(
+                client,
+                (key[0], key[1], key[4], key[5]),
+                fluid_string=req.fluid_string,
+                input_type=req.input_type,
+                value1=req.value1,
+                value2=req.value2,
+                derivatives=req.derivatives,
+                jacobian=req.jacobian,
+            )
+            cache_put("calculate", key, result)
         return CalculateResponse(**result)
+    except InputOutOfRange as e:
+        raise HTTPException(status_code=400, detail=e.detail())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CalculationTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/calculate/batch", response_model=CalculateBatchResponse, response_model_exclude_unset=True)
+def calculate_batch(
+    req: CalculateBatchRequest, client: str = Depends(client_identity)
+) -> CalculateBatchResponse:
+    """
+    同一工质、同一输入类型的多状态点批量计算（如循环各节点、牛顿迭代所需的偏导数）
+    
+    所有状态点在一个计算进程中依次计算，只建立一次工质设置；单点失败不影响其他点。
+    超出工质适用范围的状态点不送入计算，直接记入 errors。
+    """
+    items: Dict[int, dict] = {}
+    try:
+        h_in = req.input_type.upper().strip()
+        valid = list(range(len(req.points)))
+        if len(h_in) == 2:
+            limits = get_limits(canonical_fluid_key(req.fluid_string), req.fluid_string, client)
+            valid = []
+            for i, (value1, value2) in enumerate(req.points):
+                try:
+                    check_inputs(limits, h_in, value1, value2)
+                    valid.append(i)
+                except InputOutOfRange as e:
+                    items[i] = {"error": str(e)}
+        if valid:
+            with admit(client, "calculate", len(valid)):
+                computed = run_task(
+                    "calculate_batch",
+                    batch_timeout(len(valid)),
+                    fluid_string=req.fluid_string,
+                    input_type=req.input_type,
+                    points=[list(req.points[i]) for i in valid],
+                    derivatives=req.derivatives,
+                    jacobian=req.jacobian,
+                )
+            items.update(zip(valid, computed))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CalculationTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    results: List[Optional[CalculateResponse]] = []
+    errors: Dict[int, str] = {}
+    for i in range(len(req.points)):
+        item = items[i]
+        if "result" in item:
+            results.append(CalculateResponse(**item["result"]))
+        else:
+            results.append(None)
+            errors[i] = item["error"]
+    return CalculateBatchResponse(results=results, errors=errors)
+
+
+class CompressorEfficiency(BaseModel):
+    """压缩机效率模型：对压比 PR = P_cond / P_evap 的多项式系数（常数项在前），η = Σ c_k · PR^k"""
+    isentropic: List[float] = Field([0.7], min_length=1, max_length=4, description="等熵效率系数，默认常数 0.7")
+    volumetric: List[float] = Field([0.9], min_length=1, max_length=4, description="容积效率系数，默认常数 0.9")
+
+
+class CompressorMapRequest(BaseModel):
+    """POST /compressor/map 请求体"""
+    fluid_string: str = Field(..., description="工质字符串，同 /calculate")
+    t_evap: List[float] = Field(
+        ..., min_length=1, max_length=MAX_MAP_TEMPERATURES, description="蒸发露点温度 [K]"
+    )
+    t_cond: List[float] = Field(
+        ..., min_length=1, max_length=MAX_MAP_TEMPERATURES, description="冷凝露点温度 [K]"
+    )
+    displacement: float = Field(..., gt=0, description="理论排量 [m³/h]")
+    superheat: float = Field(SUPERHEAT_DEFAULT, ge=0, description="吸气过热度 [K]，默认 11.1 K（AHRI 540 额定 20 °F）")
+    subcooling: float = Field(SUBCOOLING_DEFAULT, ge=0, description="冷凝器出口过冷度 [K]，默认 8.3 K（15 °F）")
+    efficiency: CompressorEfficiency = Field(default_factory=CompressorEfficiency, description="效率模型")
+
+
+class CompressorPoint(BaseModel):
+    """压缩机性能图的一个网格点"""
+    T_evap: float = Field(..., description="蒸发露点温度 [K]")
+    T_cond: float = Field(..., description="冷凝露点温度 [K]")
+    P_evap: float = Field(..., description="蒸发压力 [kPa]")
+    P_cond: float = Field(..., description="冷凝压力 [kPa]")
+    pressure_ratio: float = Field(..., description="压比 [-]")
+    T_suction: float = Field(..., description="吸气温度 [K]")
+    T_discharge: Optional[float] = Field(None, description="排气温度 [K]")
+    eta_isentropic: float = Field(..., description="等熵效率 [-]")
+    eta_volumetric: float = Field(..., description="容积效率 [-]")
+    mass_flow: float = Field(..., description="质量流量 [kg/s]")
+    capacity: float = Field(..., description="制冷量 [W]")
+    power: float = Field(..., description="压缩功率 [W]")
+    COP: Optional[float] = Field(None, description="制冷系数 [-]")
+
+
+class AHRI540Fit(BaseModel):
+    """AHRI 540 十系数多项式拟合结果（S、D 为蒸发、冷凝露点 [°C]）"""
+    coefficients: Optional[List[float]] = Field(
+        None, description="C1..C10：X = C1 + C2·S + C3·D + C4·S² + C5·S·D + C6·D² + C7·S³ + C8·D·S² + C9·S·D² + C10·D³"
+    )
+    rms: Optional[float] = Field(None, description="残差均方根")
+    max_abs: Optional[float] = Field(None, description="最大绝对残差")
+    max_rel: Optional[float] = Field(None, description="最大相对残差 [-]")
+    residuals: Optional[List[Optional[float]]] = Field(None, description="与 points 一一对应的残差（拟合值 - 计算值）")
+    error: Optional[str] = Field(None, description="无法拟合的原因")
+
+
+class CompressorMapResponse(BaseModel):
+    """POST /compressor/map 响应体"""
+    points: List[Optional[CompressorPoint]] = Field(
+        ..., description="网格点，按 t_evap 外层、t_cond 内层排列；计算失败的点为 null"
+    )
+    errors: Dict[int, str] = Field(default_factory=dict, description="失败网格点序号 -> 错误信息")
+    fits: Dict[str, AHRI540Fit] = Field(..., description="mass_flow / capacity / power 的 AHRI 540 拟合")
+
+
+async def _spool_upload(request: Request) -> str:
+    """把请求体写入临时文件（不在内存中保留整个文件），返回路径；超过 BULK_MAX_MB 时返回 413"""
+    limit = BULK_MAX_MB * 1024 * 1024
+    size = 0
+    with tempfile.NamedTemporaryFile(prefix="bulk-", suffix=".upload", delete=False) as f:
+        try:
+            async for part in request.stream():
+                size += len(part)
+                if size > limit:
+                    raise HTTPException(status_code=413, detail=f"上传文件超过 {BULK_MAX_MB:g} MB")
+                await run_in_threadpool(f.write, part)  # 落盘可能阻塞，不占用事件循环
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    return f.name
+
+
+@app.post("/calculate/file")
+async def calculate_file(request: Request, client: str = Depends(client_identity)):
+    """
+    批量文件作业：请求体为 CSV 或 Parquet 文件（列 fluid、input_type、value1、value2），流式返回同格式的结果文件
+
+    文件按块读取、按工质分组后在计算进程间并行计算，每块计算完立即发送，内存占用与文件大小无关。
+    单行失败只写入该行的 error 列；缺少必需列、无法识别的文件与首块准入拒绝在响应开始前返回。
+    """
+    path = await _spool_upload(request)
+    try:
+        fmt = detect_format(path)
+        job = run_job(client, path, fmt)
+        await run_in_threadpool(next, job)  # 首块：格式错误与准入拒绝在响应开始前返回
+    except BaseException as e:
+        os.unlink(path)
+        if isinstance(e, (ValueError, UnicodeDecodeError, csv.Error)):
+            raise HTTPException(status_code=400, detail=f"无法读取输入文件: {e}")
+        raise
+
+    def cleanup():
+        job.close()
+        os.unlink(path)
+
+    return StreamingResponse(
+        job,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="results.{fmt}"'},
+        background=BackgroundTask(cleanup),
+    )
+
+
+@app.post("/hx/profile", response_model=HXProfileResponse, response_model_exclude_unset=True)
+def hx_profile(req: HXProfileRequest, client: str = Depends(client_identity)) -> HXProfileResponse:
+    """
+    换热器（冷凝器 / 蒸发器）沿程物性
+
+    按换热量把进口到出口的焓差等分为 segments 段，返回各点的 T、P、Q、H、CP 与输运性质，
+    并插入沿程中的泡点、露点；整条沿程在一个计算进程中、同一次工质设置内计算。
+    给定二次流体时返回各点的二次流体温度与夹点。个别点闪蒸失败时该点物性为 null，错误列在 errors 中。
+    """
+    try:
+        fluid_key = canonical_fluid_key(req.fluid_string)
+        secondary = req.secondary.model_dump() if req.secondary is not None else None
+        key = (
+            fluid_key,
+            req.pressure,
+            req.pressure_drop,
+            req.h_in,
+            req.h_out,
+            req.segments,
+            tuple(secondary.values()) if secondary is not None else None,
+        )
+        result = cache_get("hx_profile", key)
+        if result is None:
+            with admit(client, "calculate", req.segments + 1):
+                result = run_task(
+                    "hx_profile",
+                    batch_timeout(req.segments + 3),
+                    fluid_string=req.fluid_string,
+                    pressure=req.pressure,
+                    h_in=req.h_in,
+                    h_out=req.h_out,
+                    segments=req.segments,
+                    pressure_drop=req.pressure_drop,
+                    secondary=secondary,
+                )
+            cache_put("hx_profile", key, result)
+        return HXProfileResponse(**result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CalculationTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/compressor/map", response_model=CompressorMapResponse, response_model_exclude_unset=True)
+def compressor_map(req: CompressorMapRequest, client: str = Depends(client_identity)) -> CompressorMapResponse:
+    """
+    压缩机性能图与 AHRI 540 多项式拟合
+
+    在蒸发、冷凝露点温度网格上计算质量流量、制冷量、功率、排气温度与效率；
+    网格分块后在本 worker 的计算进程间并行，每块只建立一次工质设置。
+    质量流量、制冷量、功率各自拟合 AHRI 540 十系数多项式并返回残差。
+    """
+    try:
+        fluid_key = canonical_fluid_key(req.fluid_string)
+        key = (
+            fluid_key,
+            tuple(req.t_evap),
+            tuple(req.t_cond),
+            req.displacement,
+            req.superheat,
+            req.subcooling,
+            tuple(req.efficiency.isentropic),
+            tuple(req.efficiency.volumetric),
+        )
+        result = cache_get("compressor_map", key)
+        if result is None:
+            grid = [(t_evap, t_cond) for t_evap in req.t_evap for t_cond in req.t_cond]
+            n_chunks = max(1, min(pool_size(), -(-len(grid) // MAP_MIN_CHUNK)))
+            bounds = [len(grid) * i // n_chunks for i in range(n_chunks + 1)]
+            kwargs_list = [
+                {
+                    "fluid_string": req.fluid_string,
+                    "points": [list(p) for p in grid[lo:hi]],
+                    "displacement": req.displacement,
+                    "superheat": req.superheat,
+                    "subcooling": req.subcooling,
+                    "isentropic": req.efficiency.isentropic,
+                    "volumetric": req.efficiency.volumetric,
+                }
+                for lo, hi in zip(bounds, bounds[1:])
+            ]
+            items: List[dict] = [{}] * len(grid)
+            with admit(client, "compressor_point", len(grid), n_chunks):
+                for i, chunk, err in run_tasks("compressor_points", kwargs_list, batch_timeout(bounds[1] - bounds[0])):
+                    lo, hi = bounds[i], bounds[i + 1]
+                    items[lo:hi] = chunk if err is None else [{"error": err}] * (hi - lo)
+            points = [item.get("result") for item in items]
+            result = {
+                "points": points,
+                "errors": {i: item["error"] for i, item in enumerate(items) if "error" in item},
+                "fits": fit_ahri540(points),
+            }
+            cache_put("compressor_map", key, result)
+        return CompressorMapResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except CalculationTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/fluid-info", response_model=FluidInfoResponse)
-def fluid_info(req: FluidInfoRequest) -> FluidInfoResponse:
+def fluid_info(req: FluidInfoRequest, client: str = Depends(client_identity)) -> FluidInfoResponse:
     """
     获取工质参考属性
     
@@ -139,37 +634,265 @@ def fluid_info(req: FluidInfoRequest) -> FluidInfoResponse:
     三相点、分子量、k值（绝热指数）。混合物时 GWP/ODP/SAFETY/CAS 可能为空。
     """
     try:
-        result = get_fluid_info(fluid_string=req.fluid_string)
+        key = canonical_fluid_key(req.fluid_string)
+        result = cache_get("fluid_info", key)
+        if result is None:
+            with admit(client, "fluid_info"):
+                result = run_task("fluid_info", fluid_string=req.fluid_string)
+            cache_put("fluid_info", key, result)
         return FluidInfoResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except CalculationTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/dome", response_model=DomeResponse)
-def dome(req: DomeRequest) -> DomeResponse:
+@app.post("/fluid-info/batch", response_model=FluidInfoBatchResponse)
+def fluid_info_batch(
+    req: FluidInfoBatchRequest, client: str = Depends(client_identity)
+) -> FluidInfoBatchResponse:
+    """
+    批量获取工质参考属性（工质对比表）
+    
+    已缓存的工质直接复用；其余工质分组后在各计算进程间并行查询，每个计算进程对其分到的
+    工质依次计算，纯工质的数值属性合并为一次 REFPROP 调用。返回列式表格，单个工质失败不影响其他工质。
+    """
+    fluids = list(dict.fromkeys(req.fluids))
+    infos: Dict[str, dict] = {}
+    errors: Dict[str, str] = {}
+    pending: Dict[str, List[str]] = {}  # 规范化键 -> 请求中的工质字符串
+    for fluid in fluids:
+        try:
+            key = canonical_fluid_key(fluid)
+        except ValueError as e:
+            errors[fluid] = str(e)
+            continue
+        result = cache_get("fluid_info", key)
+        if result is not None:
+            infos[fluid] = result
+        else:
+            pending.setdefault(key, []).append(fluid)
+
+    if pending:
+        keys = list(pending)
+        n_chunks = min(len(keys), pool_size())
+        chunks = [keys[i::n_chunks] for i in range(n_chunks)]
+        kwargs_list = [{"fluid_strings": [pending[k][0] for k in chunk]} for chunk in chunks]
+        timeout = batch_timeout(max(len(chunk) for chunk in chunks), CALC_TIMEOUT_FLUID_INFO)
+        with admit(client, "fluid_info", len(keys), n_chunks):
+            for i, results, err in run_tasks("fluid_info_batch", kwargs_list, timeout):
+                for j, key in enumerate(chunks[i]):
+                    item = results[j] if results is not None else {"error": err}
+                    if "info" in item:
+                        cache_put("fluid_info", key, item["info"])
+                    for fluid in pending[key]:
+                        if "info" in item:
+                            infos[fluid] = item["info"]
+                        else:
+                            errors[fluid] = item["error"]
+
+    columns: Dict[str, list] = {name: [] for name in FLUID_INFO_COLUMNS}
+    for fluid in fluids:
+        info = dict(infos.get(fluid) or {})
+        triple = info.pop("triple_point", None) or {}
+        info["triple_point_T"] = triple.get("T")
+        info["triple_point_P"] = triple.get("P")
+        for name in FLUID_INFO_COLUMNS:
+            columns[name].append(info.get(name))
+    return FluidInfoBatchResponse(fluids=fluids, columns=columns, errors=errors)
+
+
+def _dome_key(fluid_key: str, mode: str) -> str:
+    """dome 缓存键：默认 tq 模式沿用工质键，其他模式附加模式名"""
+    return fluid_key if mode == "tq" else f"{fluid_key}#{mode}"
+
+
+def _cache_dome(key: str, result: dict) -> None:
+    """写入 dome 缓存；envelope 退回 tq 的结果不缓存（不能以包络线的键返回给之后的请求）"""
+    if "fallback" not in result:
+        cache_put("dome", key, result)
+
+
+def _compute_dome(fluid_string: str, key: str, mode: str) -> dict:
+    """在计算进程中生成饱和包络线并写入缓存"""
+    result = run_task("dome", fluid_string=fluid_string, mode=mode)
+    _cache_dome(key, result)
+    return result
+
+
+@app.post("/dome", response_model=DomeResponse, response_model_exclude_unset=True)
+def dome(req: DomeRequest, client: str = Depends(client_identity)) -> DomeResponse:
     """
     生成饱和包络线 (P-h Dome) 数据
     
     返回饱和液线 (q=0) 和饱和气线 (q=1) 的 (P, H) 坐标点数组，
     供前端绘制 P-h 压焓图。单位：P [kPa]，H [J/mol]。
+    mode=envelope 时混合物返回穿过临界点的完整相包络线及临界凝析压力点、临界凝析温度点；
+    相包络线计算失败时按 tq 计算并在 fallback 中给出原因，该结果不缓存。
     """
     try:
-        result = compute_saturation_dome(fluid_string=req.fluid_string)
+        key = _dome_key(canonical_fluid_key(req.fluid_string), req.mode)
+        result = cache_get("dome", key)
+        if result is None:
+            with admit(client, "dome"):
+                result = _compute_dome(req.fluid_string, key, req.mode)
         return DomeResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except CalculationTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/dome/chart", response_model=ChartResponse, response_model_exclude_unset=True)
+def dome_chart(req: ChartRequest, client: str = Depends(client_identity)) -> ChartResponse:
+    """
+    完整 P-h 图数据：饱和包络线 + 等温线、等熵线、等容线、等干度线
+
+    在一个计算进程中、同一次工质设置内完成，各等值线在绘图窗口内按曲率自适应采样。
+    结果按工质、窗口与等值线取值缓存，整张图只需一次请求；同时顺带缓存该工质的 /dome。
+    """
+    try:
+        fluid_key = canonical_fluid_key(req.fluid_string)
+        key = (
+            fluid_key,
+            req.p_min,
+            req.p_max,
+            req.h_min,
+            req.h_max,
+            tuple(req.isotherms),
+            tuple(req.isentropes),
+            tuple(req.isochores),
+            tuple(req.qualities),
+        )
+        result = cache_get("chart", key)
+        if result is None:
+            n_lines = len(req.isotherms) + len(req.isentropes) + len(req.isochores) + len(req.qualities)
+            with admit(client, "chart_line", n_lines + 2):
+                result = run_task(
+                    "chart",
+                    fluid_string=req.fluid_string,
+                    p_min=req.p_min,
+                    p_max=req.p_max,
+                    h_min=req.h_min,
+                    h_max=req.h_max,
+                    isotherms=req.isotherms,
+                    isentropes=req.isentropes,
+                    isochores=req.isochores,
+                    qualities=req.qualities,
+                )
+            cache_put("chart", key, result)
+            cache_put("dome", fluid_key, result["dome"])
+        return ChartResponse(**result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CalculationTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _iter_dome_compare(
+    ready: Dict[str, dict],
+    pending: Dict[str, List[str]],
+    errors: Dict[str, str],
+    client: str,
+    mode: str,
+) -> Iterator[Optional[Tuple[str, Optional[dict], Optional[str]]]]:
+    """
+    首次迭代获取准入槽位后产出 None（由路由同步执行，准入拒绝在响应开始前抛出），
+    然后依次产出 (工质字符串, dome, 错误)：先输出缓存命中与解析失败的工质，再按完成顺序输出并行计算的结果。
+    槽位按同时计算的工质数占用；生成器结束或被关闭（含流式响应的客户端断开、未开始发送即失败）时释放。
+    """
+    with ExitStack() as stack:
+        if pending:
+            stack.enter_context(admit(client, "dome", len(pending), min(len(pending), pool_size())))
+        yield None
+        for fluid, err in errors.items():
+            yield fluid, None, err
+        for fluid, result in ready.items():
+            yield fluid, result, None
+        keys = list(pending)
+        kwargs_list = [{"fluid_string": pending[key][0], "mode": mode} for key in keys]
+        for i, result, err in run_tasks("dome", kwargs_list):
+            if result is not None:
+                _cache_dome(keys[i], result)
+            for fluid in pending[keys[i]]:
+                yield fluid, result, err
+
+
+@app.post("/dome/compare", response_model=DomeCompareResponse, response_model_exclude_unset=True)
+def dome_compare(req: DomeCompareRequest, client: str = Depends(client_identity)):
+    """
+    多工质饱和包络线对比
+    
+    已缓存的 dome 直接复用，其余工质在本 worker 的计算进程间并行计算，
+    总耗时取决于最慢的工质而非各工质之和。单个工质失败不影响其他工质，错误列在 errors 中。
+    stream=true 时以 NDJSON 流式返回：每行 `{"fluid", "dome"}` 或 `{"fluid", "error"}`。
+    """
+    ready: Dict[str, dict] = {}
+    pending: Dict[str, List[str]] = {}  # 规范化键 -> 请求中的工质字符串（同一工质的不同写法只算一次）
+    errors: Dict[str, str] = {}
+    for fluid in dict.fromkeys(req.fluids):
+        try:
+            key = _dome_key(canonical_fluid_key(fluid), req.mode)
+        except ValueError as e:
+            errors[fluid] = str(e)
+            continue
+        result = cache_get("dome", key)
+        if result is not None:
+            ready[fluid] = result
+        else:
+            pending.setdefault(key, []).append(fluid)
+
+    results = _iter_dome_compare(ready, pending, errors, client, req.mode)
+    next(results)  # 准入：429/503 在开始响应前返回
+
+    if req.stream:
+        lines = (
+            json.dumps({"fluid": f, "dome": d} if e is None else {"fluid": f, "error": e}) + "\n"
+            for f, d, e in results
+        )
+        return StreamingResponse(lines, media_type="application/x-ndjson", background=BackgroundTask(results.close))
+
+    domes: Dict[str, dict] = {}
+    with closing(results):
+        for fluid, result, err in results:
+            if err is None:
+                domes[fluid] = result
+            else:
+                errors[fluid] = err
+    return DomeCompareResponse(domes=domes, errors=errors)
+
+
 @app.get("/")
 def root():
     """健康检查（无需鉴权）"""
     return {"status": "ok", "api": "REFPROP 热力学计算 API"}
 
 
+@app.get("/stats", dependencies=[Depends(verify_api_key)])
+def stats():
+    """运行状态：准入控制（跨 worker 共享）与本 worker 的计算进程池"""
+    return {
+        "pid": os.getpid(),
+        "admission": get_controller().snapshot() if ADMISSION_ENABLED else None,
+        "calculators": pool_stats(),
+        "cache": cache_stats(),
+        "microbatch": get_batcher().stats(),
+        "capture": capture_stats(),
+    }
+
+
+@app.get("/stats/resources", dependencies=[Depends(verify_api_key)])
+def stats_resources():
+    """本 worker 及其计算进程的 RSS、文件描述符、内存映射与 REFPROP 库实例数（长时间运行测试据此判断泄漏）"""
+    return resources(pool_stats())
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003)
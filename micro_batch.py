@@ -0,0 +1,242 @@
+"""
+单点 /calculate 的服务端微批处理
+不同用户并发请求同一工质的单点计算时，每个请求各自占用一次计算进程调用；
+计算进程全忙时这些请求本来也要排队。
+
+微批处理把同一分组（规范化工质 + 输入类型 + 偏导数选项）的并发单点请求合并：
+  - 本 worker 有空闲计算进程且该组没有正在收集的批次时立即单独计算（正常准入），轻负载时不增加任何延迟
+  - 否则先按本请求自己的客户端通过准入（slots=0：计 1 个成本单位、受单客户端排队上限与加权公平约束，
+    不占槽位），通过后才加入批次；准入拒绝（429/503）只影响该请求
+  - 首个加入的请求成为批次的发起者，最多等待 MICROBATCH_WINDOW_MS 毫秒（或凑满 MICROBATCH_MAX_SIZE 个请求）
+    收集同组请求，然后取一个计算槽位（admit_slot，不再计费）、以一次 calculate_batch 调用（一个计算进程、
+    一次工质设置）计算整批，再把各点结果分发给各自的调用方
+  - 批内相同的状态点只计算一次；整批超时后逐点重算，只有确实卡住的状态点返回 504
+  - 每个批次有截止时间（收集窗口 + 一次准入等待 + 一次批量计算超时），逐点重算不超过截止时间，
+    跟随者最多等到截止时间
+"""
+import copy
+import threading
+import time
+from typing import Callable, ContextManager, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from admission import admit, admit_slot
+from calc_pool import CalculationTimeout, batch_timeout, pool_idle, run_task
+from config import ADMISSION_MAX_WAIT, MICROBATCH_MAX_SIZE, MICROBATCH_WINDOW_MS
+
+# 批大小分布的分桶上界（/stats 使用，最后一桶含更大的批次）
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# 跟随者在批次截止时间之后再多等的时间 [s]（发起者分发结果的余量）
+DEADLINE_GRACE = 1.0
+
+
+class _Entry:
+    """批内的一个单点请求"""
+
+    __slots__ = ("point", "done", "result", "error")
+
+    def __init__(self, point: Tuple[float, float]):
+        self.point = point
+        self.done = threading.Event()
+        self.result: Optional[dict] = None
+        self.error: Optional[BaseException] = None
+
+
+class _Batch:
+    """同一分组正在收集或计算的一批请求"""
+
+    __slots__ = ("kwargs", "entries", "full", "created", "deadline")
+
+    def __init__(self, kwargs: dict, budget: float = float("inf")):
+        self.kwargs = kwargs
+        self.entries: List[_Entry] = []
+        self.full = threading.Event()
+        self.created = time.monotonic()
+        self.deadline = self.created + budget  # 超过后不再逐点重算，跟随者也不再等待
+
+
+class MicroBatcher:
+    """按分组合并并发单点计算；线程安全"""
+
+    def __init__(self, window_ms: float = MICROBATCH_WINDOW_MS, max_size: int = MICROBATCH_MAX_SIZE):
+        self.window = max(float(window_ms), 0.0) / 1000.0
+        self.max_size = max(int(max_size), 1)
+        self._lock = threading.Lock()
+        self._forming: Dict[Hashable, _Batch] = {}
+        self.counters = {
+            "requests": 0,
+            "immediate": 0,        # 有空闲计算进程，直接单独计算
+            "batches": 0,          # 经过收集窗口的批次数
+            "batched_requests": 0, # 这些批次中的请求数
+            "deduplicated": 0,     # 批内重复、未重复计算的状态点
+            "split_on_timeout": 0, # 整批超时后逐点重算的批次数
+            "largest": 0,          # 最大批次的请求数
+        }
+        self.sizes = {bound: 0 for bound in SIZE_BUCKETS}
+        self.wait_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_size > 1
+
+    def calculate(
+        self,
+        client: str,
+        group: Hashable,
+        fluid_string: str,
+        input_type: str,
+        value1: float,
+        value2: float,
+        derivatives: Optional[Sequence[str]] = None,
+        jacobian: bool = False,
+    ) -> dict:
+        """
+        计算一个状态点（可能与同组的其他请求合并为一批）
+
+        group 为分组键，须唯一确定工质、输入类型与偏导数选项；异常与单独调用 run_task("calculate") 相同，
+        另有准入控制的 HTTPException（429/503）。
+        """
+        kwargs = {
+            "fluid_string": fluid_string,
+            "input_type": input_type,
+            "derivatives": derivatives,
+            "jacobian": jacobian,
+        }
+        entry = _Entry((value1, value2))
+        with self._lock:
+            self.counters["requests"] += 1
+            immediate = not self.enabled or (group not in self._forming and pool_idle() > 0)
+            if immediate:
+                self.counters["immediate"] += 1
+        if immediate:
+            batch = _Batch(kwargs)
+            batch.entries.append(entry)
+            self._run(batch, lambda: admit(client, "calculate"))
+        else:
+            with admit(client, "calculate", slots=0):
+                self._join(client, group, kwargs, entry)
+
+        if entry.error is not None:
+            raise copy.copy(entry.error)  # 各调用方各自抛出，不共享 traceback
+        return entry.result
+
+    def _join(self, client: str, group: Hashable, kwargs: dict, entry: _Entry) -> None:
+        """已通过准入的请求加入同组正在收集的批次（没有则发起一批）；返回时 entry 已有结果或异常"""
+        with self._lock:
+            batch = self._forming.get(group)
+            leader = batch is None
+            if leader:
+                batch = _Batch(kwargs, self.window + ADMISSION_MAX_WAIT + batch_timeout(self.max_size))
+                self._forming[group] = batch
+            batch.entries.append(entry)
+            if not leader and len(batch.entries) >= self.max_size:
+                del self._forming[group]
+                batch.full.set()
+
+        if not leader:
+            if not entry.done.wait(max(batch.deadline - time.monotonic(), 0.0) + DEADLINE_GRACE):
+                raise CalculationTimeout("REFPROP 计算超时（微批处理未在限定时间内返回）。")
+            return
+        batch.full.wait(self.window)
+        with self._lock:
+            if self._forming.get(group) is batch:
+                del self._forming[group]
+        self._record(batch)
+        self._run(batch, lambda: admit_slot(client))
+
+    def _record(self, batch: _Batch) -> None:
+        n = len(batch.entries)
+        with self._lock:
+            self.counters["batches"] += 1
+            self.counters["batched_requests"] += n
+            self.counters["largest"] = max(self.counters["largest"], n)
+            self.wait_seconds += time.monotonic() - batch.created
+            bound = next((b for b in SIZE_BUCKETS if n <= b), SIZE_BUCKETS[-1])  # 超出最大分桶的计入最后一桶
+            self.sizes[bound] += 1
+
+    def _run(self, batch: _Batch, admission: Callable[[], ContextManager]) -> None:
+        """发起者在 admission() 内计算整批并分发结果；任何情况下都唤醒全部跟随者"""
+        points = list(dict.fromkeys(entry.point for entry in batch.entries))
+        with self._lock:
+            self.counters["deduplicated"] += len(batch.entries) - len(points)
+        try:
+            with admission():
+                outcomes = self._compute(batch.kwargs, points, batch.deadline)
+            by_point = dict(zip(points, outcomes))
+            for entry in batch.entries:
+                entry.result, entry.error = by_point[entry.point]
+        except BaseException as e:
+            for entry in batch.entries:
+                entry.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            for entry in batch.entries:
+                if entry.result is None and entry.error is None:
+                    entry.error = RuntimeError("微批处理未返回结果，请重试。")
+                entry.done.set()
+
+    def _compute(
+        self, kwargs: dict, points: List[Tuple[float, float]], deadline: float
+    ) -> List[Tuple[Optional[dict], Optional[Exception]]]:
+        """返回与 points 对应的 (结果, 异常)；参数错误（对整批相同）直接抛出"""
+        if len(points) == 1:
+            return [self._single(kwargs, points[0])]
+        try:
+            items = run_task(
+                "calculate_batch",
+                batch_timeout(len(points)),
+                points=[list(p) for p in points],
+                **kwargs,
+            )
+        except CalculationTimeout:
+            # 多半只有个别状态点卡住：逐点重算，其余状态点照常返回
+            with self._lock:
+                self.counters["split_on_timeout"] += 1
+            return [
+                self._single(kwargs, p) if time.monotonic() < deadline
+                else (None, CalculationTimeout("REFPROP 计算超时（微批处理已超过截止时间）。"))
+                for p in points
+            ]
+        return [
+            (item["result"], None) if "result" in item else (None, RuntimeError(item["error"]))
+            for item in items
+        ]
+
+    @staticmethod
+    def _single(kwargs: dict, point: Tuple[float, float]) -> Tuple[Optional[dict], Optional[Exception]]:
+        try:
+            return run_task("calculate", value1=point[0], value2=point[1], **kwargs), None
+        except ValueError:
+            raise
+        except (RuntimeError, CalculationTimeout) as e:
+            return None, e
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            sizes = {f"<={bound}": n for bound, n in self.sizes.items()}
+            wait = self.wait_seconds
+        batches = counters["batches"]
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_size": self.max_size,
+            **counters,
+            "mean_size": round(counters["batched_requests"] / batches, 3) if batches else None,
+            "mean_wait_ms": round(wait / batches * 1000.0, 3) if batches else None,
+            "size_histogram": sizes,
+        }
+
+
+_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> MicroBatcher:
+    """进程内单例（各 worker 独立批处理）"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher()
+    return _batcher
@@ -7,10 +7,9 @@ REFPROP 核心计算引擎
   - VIS [µPa·s], TCX [W/(m·K)], PRANDTL [-]
 内部使用 MOLAR BASE SI 调用 REFPROP，在边界做单位转换。
 """
-import os
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from config import FLUIDS_PATH, RPPREFIX
+from refprop_session import get_rp
 
 # REFPROP 错误码：特定哨兵值表示两相区未定义的属性
 REFPROP_UNDEFINED = -9999970
@@ -23,6 +22,35 @@ KPA_TO_PA = 1000.0
 MOL_DM3_TO_MOL_M3 = 1000.0  # 1 mol/dm³ = 1000 mol/m³
 PA_S_TO_UPAS = 1e6  # 1 Pa·s = 1e6 µPa·s
 
+# MOLAR BASE SI -> API DEFAULT 单位的换算系数（乘以该系数），未列出的性质两者一致
+_SI_TO_API = {"P": 1.0 / KPA_TO_PA, "D": 1.0 / MOL_DM3_TO_MOL_M3}
+
+# 基本输出（顺序固定，见 _unpack_outputs）
+BASE_OUTPUTS = "T;P;D;H;S;Qmole;CP;CV;W;VIS;TCX;PRANDTL"
+
+# 可选偏导数：API 名称 -> (REFPROP hOut, 分子性质, 分母性质)，与基本输出在同一次 REFPROPdll 中计算
+DERIVATIVES: Dict[str, Tuple[str, str, str]] = {
+    "DPDT": ("DPDT", "P", "T"),              # (∂P/∂T)_D  [kPa/K]
+    "DPDD": ("DPDD", "P", "D"),              # (∂P/∂D)_T  [kPa·dm³/mol]
+    "DDDT": ("DDDT", "D", "T"),              # (∂D/∂T)_P  [mol/(dm³·K)]
+    "DDDP": ("DDDP", "D", "P"),              # (∂D/∂P)_T  [mol/(dm³·kPa)]
+    "DHDT_D": ("DHDT_D", "H", "T"),          # (∂H/∂T)_D  [J/(mol·K)]
+    "DHDT_P": ("DHDT_P", "H", "T"),          # (∂H/∂T)_P  [J/(mol·K)]
+    "DHDD_T": ("DHDD_T", "H", "D"),          # (∂H/∂D)_T  [J·dm³/mol²]
+    "DHDD_P": ("DHDD_P", "H", "D"),          # (∂H/∂D)_P  [J·dm³/mol²]
+    "DHDP_T": ("DHDP_T", "H", "P"),          # (∂H/∂P)_T  [J/(mol·kPa)]
+    "DHDP_D": ("DHDP_D", "H", "P"),          # (∂H/∂P)_D  [J/(mol·kPa)]
+    "DDDP_H": ("d(D)/d(P)H", "D", "P"),      # (∂D/∂P)_H  [mol/(dm³·kPa)]
+    "JT": ("JT", "T", "P"),                  # Joule-Thomson 系数 (∂T/∂P)_H  [K/kPa]
+}
+
+# 雅可比矩阵：输出性质对两个输入量的偏导 d(X)/d(a)b、d(X)/d(b)a，输入输出均限于这些状态量
+JACOBIAN_PROPS = ("T", "P", "D", "H", "S")
+
+HOUT_MAX = 255  # REFPROPdll 输出字符串 hOut 的最大长度
+
+_MOLAR_BASE_SI: Optional[int] = None
+
 # 混合物别名：预定义混合物用组分形式等效，避免 REFPROP error 813
 # （813: 使用预定义混合物名时，传入的 z 必须与 .MIX 组分完全一致，否则报错）
 # 摩尔分数按规范，REFPROP 10 流体名：R1234ZEE, R1234YF 等
@@ -86,6 +114,21 @@ def parse_fluid_string(fluid_string: str) -> Tuple[str, List[float]]:
     return fluid_string, [1.0] + [0.0] * 19
 
 
+def canonical_fluid_key(fluid_string: str) -> str:
+    """
+    规范化工质标识，用于缓存与调度
+    
+    同一工质的不同写法（大小写、别名、未归一化的比例）得到相同的键：
+    "r515b"、"R515B"、"R1234ZEE&R227EA|93.8&6.2" -> "R1234ZEE*R227EA|0.938,0.062"
+    """
+    refprop_fluid, z = parse_fluid_string(fluid_string)
+    key = refprop_fluid.upper()
+    if "*" in refprop_fluid:
+        n = len(refprop_fluid.split("*"))
+        key += "|" + ",".join(f"{x:.6g}" for x in z[:n])
+    return key
+
+
 def _is_sentinel(value: float) -> bool:
     """检查是否为 REFPROP 的未定义/错误标记值"""
     return (
@@ -102,58 +145,27 @@ def _clean_value(value: float) -> Optional[float]:
     return value
 
 
-def calculate_properties(
-    fluid_string: str,
-    input_type: str,
-    value1: float,
-    value2: float,
-    rpprefix: Optional[str] = None,
-    fluids_path: Optional[str] = None,
-) -> dict:
-    """
-    通用热力学性质计算函数（ctREFPROP 直连）
-    
-    Args:
-        fluid_string: 工质字符串，如 "R32" 或 "R32&R125|0.5&0.5"
-        input_type: 输入类型，如 PT/PQ/PH/TD/TQ/PS 等
-        value1: 第一个输入参数
-        value2: 第二个输入参数
-        rpprefix: REFPROP 安装路径（含 librefprop.so）
-        fluids_path: FLUIDS 文件夹路径，默认与 rpprefix 相同
-    
-    Returns:
-        包含 T, P, D, H, S, Q, CP, CV, W 的字典
-    """
-    # 使用环境变量配置的路径
-    prefix = rpprefix or RPPREFIX
-    fluids = fluids_path or FLUIDS_PATH or prefix
-
-    if not prefix or not os.path.isdir(prefix):
-        raise RuntimeError(
-            f"REFPROP 路径未配置或无效: {prefix}。请设置 RPPREFIX 环境变量。"
-        )
-
-    from ctREFPROP.ctREFPROP import REFPROPFunctionLibrary
-
-    # 实例化 REFPROP 库，传入包含 librefprop.so 的目录
-    RP = REFPROPFunctionLibrary(prefix)
-    RP.SETPATHdll(fluids)
+def molar_base_si(RP) -> int:
+    """MOLAR BASE SI 单位制枚举值（库内常量，进程内只查询一次）"""
+    global _MOLAR_BASE_SI
+    if _MOLAR_BASE_SI is None:
+        _MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
+    return _MOLAR_BASE_SI
 
-    # 摩尔基 SI 单位
-    MOLAR_BASE_SI = RP.GETENUMdll(0, "MOLAR BASE SI").iEnum
 
-    refprop_fluid, z = parse_fluid_string(fluid_string)
-    h_out = "T;P;D;H;S;Qmole;CP;CV;W;VIS;TCX;PRANDTL"
+def _normalize_input_type(input_type: str) -> str:
     h_in = input_type.upper().strip()
-
     if len(h_in) != 2:
         raise ValueError(
             f"input_type 必须为两个字符，如 PT/PQ/PH。当前: {input_type}"
         )
+    return h_in
 
-    # API 使用 DEFAULT 单位 (kPa, mol/dm³)，REFPROP 内部用 MOLAR BASE SI (Pa, mol/m³)
-    # 输入压力：kPa -> Pa
+
+def _inputs_to_si(h_in: str, value1: float, value2: float) -> Tuple[float, float]:
+    """API 使用 DEFAULT 单位 (kPa, mol/dm³)，REFPROP 内部用 MOLAR BASE SI (Pa, mol/m³)"""
     v1, v2 = float(value1), float(value2)
+    # 输入压力：kPa -> Pa
     if h_in[0] == "P":
         v1 *= KPA_TO_PA
     if h_in[1] == "P":
@@ -163,29 +175,47 @@ def calculate_properties(
         v1 *= MOL_DM3_TO_MOL_M3
     if h_in[1] == "D":
         v2 *= MOL_DM3_TO_MOL_M3
+    return v1, v2
 
-    # REFPROPdll 会原地修改 z 数组（见 REFPROP-wrappers#229），传入副本避免污染
-    z_copy = list(z)
-    r = RP.REFPROPdll(
-        refprop_fluid,
-        h_in,
-        h_out,
-        MOLAR_BASE_SI,
-        0,  # iMass: 0 摩尔基
-        0,  # iFlag
-        v1,
-        v2,
-        z_copy,
-    )
 
-    # 严谨的 herr 错误捕获
-    if r.ierr > 100:
-        raise RuntimeError(
-            f"REFPROP 计算错误 (ierr={r.ierr}): {r.herr.strip()}"
-        )
+def _derivative_outputs(
+    h_in: str,
+    derivatives: Optional[Sequence[str]],
+    jacobian: bool,
+) -> List[Tuple[Tuple[str, ...], str, float]]:
+    """
+    组装额外输出项：[(结果路径, REFPROP hOut, 单位换算系数), ...]
+    结果路径 ("derivatives", 名称) 或 ("jacobian", 输出性质, 输入性质)
+    重复的偏导数名称只计算一次；拼接后的 hOut 超出 REFPROP 长度限制时抛出 ValueError
+    """
+    extra: List[Tuple[Tuple[str, ...], str, float]] = []
+    for name in derivatives or []:
+        if name.upper().strip() not in DERIVATIVES:
+            raise ValueError(
+                f"不支持的偏导数: {name}。可选: {', '.join(DERIVATIVES)}"
+            )
+    for key in dict.fromkeys(name.upper().strip() for name in derivatives or []):
+        h_out, num, den = DERIVATIVES[key]
+        extra.append((("derivatives", key), h_out, _SI_TO_API.get(num, 1.0) / _SI_TO_API.get(den, 1.0)))
+    if jacobian:
+        a, b = h_in[0], h_in[1]
+        if a not in JACOBIAN_PROPS or b not in JACOBIAN_PROPS:
+            raise ValueError(
+                f"jacobian 仅支持由 {'/'.join(JACOBIAN_PROPS)} 组成的输入类型。当前: {h_in}"
+            )
+        for x in JACOBIAN_PROPS:
+            if x in (a, b):
+                continue
+            for wrt, held in ((a, b), (b, a)):
+                factor = _SI_TO_API.get(x, 1.0) / _SI_TO_API.get(wrt, 1.0)
+                extra.append((("jacobian", x, wrt), f"d({x})/d({wrt}){held}", factor))
+    if len(";".join([BASE_OUTPUTS] + [item[1] for item in extra])) > HOUT_MAX:
+        raise ValueError(f"请求的输出项过多（REFPROP 输出字符串最长 {HOUT_MAX} 个字符），请减少 derivatives")
+    return extra
 
-    outputs = list(r.Output[:12])
-    # 输出单位转换：P Pa->kPa, D mol/m³->mol/dm³, VIS Pa·s->µPa·s（与 REFPROP DEFAULT 一致）
+
+def _unpack_outputs(outputs: Sequence[float]) -> dict:
+    """基本输出单位转换：P Pa->kPa, D mol/m³->mol/dm³, VIS Pa·s->µPa·s（与 REFPROP DEFAULT 一致）"""
     p_val = _clean_value(outputs[1])
     d_val = _clean_value(outputs[2])
     vis_val = _clean_value(outputs[9])
@@ -203,3 +233,123 @@ def calculate_properties(
         "TCX": _clean_value(outputs[10]),
         "PRANDTL": _clean_value(outputs[11]),
     }
+
+
+def flash(
+    RP,
+    refprop_fluid: str,
+    z: List[float],
+    h_in: str,
+    v1: float,
+    v2: float,
+    extra: List[Tuple[Tuple[str, ...], str, float]],
+    iflag: int = 0,
+) -> dict:
+    """
+    单次 REFPROPdll 闪蒸（输入为 MOLAR BASE SI），基本输出与所请求的偏导数一并计算
+    
+    若带偏导数的调用失败而仅基本输出可以计算（如两相区或该库不支持某偏导数），
+    偏导数返回 None 而不使整个请求失败。iflag 为 REFPROPdll 的 iFlag（混合物见 refprop_session.spline_flag）。
+    """
+    h_out = ";".join([BASE_OUTPUTS] + [item[1] for item in extra])
+    # REFPROPdll 会原地修改 z 数组（见 REFPROP-wrappers#229），传入副本避免污染
+    r = RP.REFPROPdll(
+        refprop_fluid,
+        h_in,
+        h_out,
+        molar_base_si(RP),
+        0,  # iMass: 0 摩尔基
+        iflag,
+        v1,
+        v2,
+        list(z),
+    )
+    derivs_ok = True
+    if r.ierr > 100 and extra:
+        derivs_ok = False
+        r = RP.REFPROPdll(refprop_fluid, h_in, BASE_OUTPUTS, molar_base_si(RP), 0, iflag, v1, v2, list(z))
+
+    # 严谨的 herr 错误捕获
+    if r.ierr > 100:
+        raise RuntimeError(
+            f"REFPROP 计算错误 (ierr={r.ierr}): {r.herr.strip()}"
+        )
+
+    result = _unpack_outputs(r.Output[:12])
+    n_base = 12
+    for i, (path, _, factor) in enumerate(extra):
+        value = _clean_value(r.Output[n_base + i]) if derivs_ok else None
+        node = result
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        node[path[-1]] = value * factor if value is not None else None
+    return result
+
+
+def calculate_properties(
+    fluid_string: str,
+    input_type: str,
+    value1: float,
+    value2: float,
+    rpprefix: Optional[str] = None,
+    fluids_path: Optional[str] = None,
+    derivatives: Optional[Sequence[str]] = None,
+    jacobian: bool = False,
+) -> dict:
+    """
+    通用热力学性质计算函数（ctREFPROP 直连）
+    
+    Args:
+        fluid_string: 工质字符串，如 "R32" 或 "R32&R125|0.5&0.5"
+        input_type: 输入类型，如 PT/PQ/PH/TD/TQ/PS 等
+        value1: 第一个输入参数
+        value2: 第二个输入参数
+        rpprefix: REFPROP 安装路径（含 librefprop.so）
+        fluids_path: FLUIDS 文件夹路径，默认与 rpprefix 相同
+        derivatives: 需同时返回的偏导数名称列表（见 DERIVATIVES），如 ["DPDT", "JT"]
+        jacobian: 是否同时返回各输出性质对两个输入量的偏导（雅可比矩阵）
+    
+    Returns:
+        包含 T, P, D, H, S, Q, CP, CV, W 等的字典；
+        请求偏导数时附带 "derivatives": {名称: 值}，请求雅可比时附带 "jacobian": {X: {a: ∂X/∂a, b: ∂X/∂b}}
+    """
+    h_in = _normalize_input_type(input_type)
+    extra = _derivative_outputs(h_in, derivatives, jacobian)
+    refprop_fluid, z = parse_fluid_string(fluid_string)
+    RP = get_rp(canonical_fluid_key(fluid_string), rpprefix, fluids_path)
+    v1, v2 = _inputs_to_si(h_in, value1, value2)
+    return flash(RP, refprop_fluid, z, h_in, v1, v2, extra)
+
+
+def calculate_batch(
+    fluid_string: str,
+    input_type: str,
+    points: Sequence[Sequence[float]],
+    rpprefix: Optional[str] = None,
+    fluids_path: Optional[str] = None,
+    derivatives: Optional[Sequence[str]] = None,
+    jacobian: bool = False,
+) -> List[dict]:
+    """
+    同一工质、同一输入类型的多个状态点批量计算（只建立一次 REFPROP 实例与工质设置）
+    
+    Args:
+        points: [(value1, value2), ...]
+        其余参数同 calculate_properties
+    
+    Returns:
+        与 points 顺序一致的列表，每项为 {"result": {...}} 或 {"error": 错误信息}；
+        单点计算失败不影响其他点
+    """
+    h_in = _normalize_input_type(input_type)
+    extra = _derivative_outputs(h_in, derivatives, jacobian)
+    refprop_fluid, z = parse_fluid_string(fluid_string)
+    RP = get_rp(canonical_fluid_key(fluid_string), rpprefix, fluids_path)
+    results: List[dict] = []
+    for value1, value2 in points:
+        v1, v2 = _inputs_to_si(h_in, value1, value2)
+        try:
+            results.append({"result": flash(RP, refprop_fluid, z, h_in, v1, v2, extra)})
+        except RuntimeError as e:
+            results.append({"error": str(e)})
+    return results
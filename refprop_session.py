@@ -0,0 +1,199 @@
+"""
+计算进程内的 REFPROP 工质设置缓存
+REFPROP 的一个库实例同一时刻只加载一种工质/混合物，换工质要重新读取流体文件与混合参数。
+以前每次调用都新建实例，而同一路径的 librefprop.so 在进程内只会加载一次，
+R32、R515B 交替请求时每次都要重新设置工质。
+
+每个计算进程按规范化工质键维护一个小型 LRU（RP_SETUP_CACHE 个条目），
+每个条目独占一份 librefprop.so 副本（Fortran 全局状态互不干扰），保持各自的工质常驻：
+  - 命中：直接复用该实例，无需重新设置
+  - 未命中：有空位则加载新副本，否则复用最久未用的实例改设新工质（记为一次切换）
+副本加载后立即删除文件（已映射的内存仍有效），计算进程被强杀也不会遗留临时文件。
+找不到 .so 文件或 RP_SETUP_CACHE=1 时退化为单个实例，仍统计切换次数。
+
+线程模式（CALC_MODE=thread，见 calc_pool.ThreadCalculatorPool）下一个进程内有多个计算线程，
+每个线程绑定自己的 Session（bind_session），其全部实例都是独立副本，线程之间不共享任何 Fortran 全局状态。
+未绑定的线程使用进程级默认 Session（首个实例直接加载原库文件）。
+
+混合物的 SATSPLN 相界样条拟合（CRIT 等调用 iFlag=1）开销很大，拟合结果保存在库实例内，
+随该条目常驻：同一 (组分, 组成) 只拟合一次，条目被淘汰或改设其他工质时失效。
+"""
+import itertools
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from config import FLUIDS_PATH, RPPREFIX, RP_SETUP_CACHE, RUNTIME_DIR
+
+# 各平台的 REFPROP 共享库文件名（ctREFPROP 传入目录时按同样的名称查找）
+LIBRARY_NAMES = ("librefprop.so", "librefprop.dylib", "REFPRP64.DLL")
+
+
+class _Setup:
+    """一个 REFPROP 库实例及其当前加载的工质"""
+
+    __slots__ = ("rp", "key", "spline_fitted")
+
+    def __init__(self, rp: Any, key: Optional[str]):
+        self.rp = rp
+        self.key = key
+        self.spline_fitted = False  # 当前混合物的 SATSPLN 样条是否已拟合
+
+
+class Session:
+    """一组工质设置条目（LRU）及其库实例；isolated=True 时所有实例（含第一个）都加载独立副本"""
+
+    def __init__(self, isolated: bool = False):
+        self.isolated = isolated
+        self.setups: "OrderedDict[Optional[str], _Setup]" = OrderedDict()
+        self.n_loaded = 0  # 已加载的库实例数（含基础实例）
+        self.by_rp: "dict[int, _Setup]" = {}  # id(库实例) -> 当前条目
+        self.counters = {"hits": 0, "switches": 0, "evictions": 0, "spline_fits": 0, "spline_reuses": 0}
+
+
+_lock = threading.Lock()
+_default = Session()
+_local = threading.local()
+_copy_ids = itertools.count(1)
+
+
+def bind_session(session: Optional[Session]) -> None:
+    """当前线程此后的 get_rp 等调用使用 session（None 恢复为进程级默认 Session）"""
+    _local.session = session
+
+
+def _session() -> Session:
+    return getattr(_local, "session", None) or _default
+
+
+def _check_prefix(prefix: Optional[str]) -> str:
+    if not prefix or not os.path.isdir(prefix):
+        raise RuntimeError(
+            f"REFPROP 路径未配置或无效: {prefix}。请设置 RPPREFIX 环境变量。"
+        )
+    return prefix
+
+
+def _library_file(prefix: str) -> Optional[str]:
+    for name in LIBRARY_NAMES:
+        path = os.path.join(prefix, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def load_library(prefix: str, fluids: str, isolated: bool = False) -> Any:
+    """
+    加载并配置一个 REFPROP 实例
+
+    isolated=True 时加载 librefprop.so 的独立副本（进程内同一路径只会 dlopen 一次，
+    副本才有独立的全局状态）；找不到库文件时返回 None。
+    """
+    from ctREFPROP.ctREFPROP import REFPROPFunctionLibrary
+
+    if not isolated:
+        rp = REFPROPFunctionLibrary(prefix)
+        rp.SETPATHdll(fluids)
+        return rp
+    src = _library_file(prefix)
+    if src is None:
+        return None
+    lib_dir = os.path.join(RUNTIME_DIR, "lib")
+    os.makedirs(lib_dir, exist_ok=True)
+    root, ext = os.path.splitext(os.path.basename(src))
+    dst = os.path.join(lib_dir, f"{root}-{os.getpid()}-{next(_copy_ids)}{ext}")
+    shutil.copyfile(src, dst)
+    try:
+        rp = REFPROPFunctionLibrary(dst)
+    finally:
+        os.unlink(dst)  # 已映射到进程内存，删除文件不影响使用
+    rp.SETPATHdll(fluids)
+    return rp
+
+
+def get_rp(
+    fluid_key: Optional[str] = None,
+    rpprefix: Optional[str] = None,
+    fluids_path: Optional[str] = None,
+) -> Any:
+    """
+    取已加载 fluid_key 对应工质的 REFPROP 实例（未加载时分配一个实例，由随后的调用完成设置）
+
+    Args:
+        fluid_key: 规范化工质键（refprop_engine.canonical_fluid_key）；None 表示任意实例
+        rpprefix / fluids_path: 非默认路径时不走缓存，每次新建实例
+    """
+    prefix = _check_prefix(rpprefix or RPPREFIX)
+    fluids = fluids_path or FLUIDS_PATH or prefix
+    if prefix != RPPREFIX or fluids != FLUIDS_PATH:
+        return load_library(prefix, fluids)
+
+    session = _session()
+    with _lock:
+        setup = session.setups.get(fluid_key)
+        if setup is None and fluid_key is None and session.setups:
+            setup = next(reversed(session.setups.values()))
+        if setup is not None:
+            session.setups.move_to_end(setup.key)
+            if fluid_key is not None:
+                session.counters["hits"] += 1
+            return setup.rp
+
+        # 基础实例尚未加载任何工质时以 None 占位，首个工质直接接管
+        placeholder = session.setups.pop(None, None) if fluid_key is not None else None
+        rp = placeholder.rp if placeholder is not None else None
+        if rp is None and session.n_loaded < max(RP_SETUP_CACHE, 1):
+            rp = load_library(prefix, fluids, isolated=session.isolated or session.n_loaded > 0)
+            if rp is not None:
+                session.n_loaded += 1
+        if rp is None:
+            if not session.setups:
+                raise RuntimeError(f"无法加载 REFPROP 库的独立副本：{prefix} 下没有共享库文件")
+            # 容量已满（或无法加载副本）：复用最久未用的实例
+            _, evicted = session.setups.popitem(last=False)
+            rp = evicted.rp
+            session.counters["evictions"] += 1
+        if fluid_key is not None:
+            session.counters["switches"] += 1
+        setup = _Setup(rp, fluid_key)
+        session.setups[fluid_key] = setup
+        session.by_rp[id(rp)] = setup
+        return rp
+
+
+def spline_flag(rp: Any) -> int:
+    """
+    混合物 CRIT 等调用应传的 iFlag：该实例当前混合物尚未拟合 SATSPLN 样条时为 1，
+    已拟合则为 0（复用实例内保留的样条）。未经 get_rp 缓存的实例始终为 1。
+    """
+    session = _session()
+    with _lock:
+        setup = session.by_rp.get(id(rp))
+        if setup is None or not setup.spline_fitted:
+            return 1
+        session.counters["spline_reuses"] += 1
+        return 0
+
+
+def mark_spline_fitted(rp: Any) -> None:
+    """iFlag=1 的调用成功后登记：该实例当前混合物的样条已拟合"""
+    session = _session()
+    with _lock:
+        setup = session.by_rp.get(id(rp))
+        if setup is not None and not setup.spline_fitted:
+            setup.spline_fitted = True
+            session.counters["spline_fits"] += 1
+
+
+def setup_stats() -> dict:
+    """本进程（线程模式下为当前线程）的工质设置统计：库实例数、命中、切换（需重新设置工质）、淘汰、样条拟合/复用次数"""
+    session = _session()
+    with _lock:
+        return {
+            "capacity": max(RP_SETUP_CACHE, 1),
+            "instances": session.n_loaded,
+            "loaded": [k for k in session.setups if k is not None],
+            **session.counters,
+        }
@@ -0,0 +1,196 @@
+"""
+抓取流量回放（抓取见 capture.py）：按原始到达间隔（或其倍速）把抓取的请求发往本地服务，
+报告吞吐、尾延迟、结果缓存命中率，以及与抓取时相比的错误变化
+
+  - 读取抓取目录（或文件）中的全部 capture-*.jsonl，按到达时间合并；请求体无法解析的记录跳过
+  - --speed 2 表示两倍速（到达间隔减半），0 表示不等待、以 --concurrency 个并发尽快发送
+  - 抓取时各客户端的摘要映射为不同的 X-Real-IP（须从 TRUSTED_PROXIES 中的地址发起，如本机），
+    准入控制的按客户端公平排队与生产一致
+  - 缓存命中率取回放前后多次请求 /stats（落到各 worker）的计数差
+  - 错误变化：抓取时成功、回放失败的请求数（new_errors），及抓取时失败、回放成功的请求数（fixed）
+
+用法：
+  python replay.py cache/capture --url http://127.0.0.1:8003 --speed 1
+  python replay.py cache/capture --speed 4 --limit 20000 --json replay-report.json
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from soak import Client
+
+Sender = Callable[[dict], int]  # 发送一条抓取记录，返回状态码（0 为连接失败）
+
+
+def load_capture(paths: Iterable[str], limit: Optional[int] = None) -> List[dict]:
+    """读取抓取文件（目录则取其中全部 capture-*.jsonl），按到达时间排序；损坏的行跳过"""
+    files: List[str] = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "capture-*.jsonl"))) if os.path.isdir(path) else [path])
+    entries = []
+    for name in files:
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 轮转或写入中断留下的半行
+                if isinstance(entry, dict) and {"t", "p", "s"} <= entry.keys():
+                    entries.append(entry)
+    entries.sort(key=lambda e: e["t"])
+    return entries[:limit] if limit else entries
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 2)
+
+
+def _latency(values: List[float]) -> dict:
+    return {"p50": _percentile(values, 0.5), "p90": _percentile(values, 0.9),
+            "p99": _percentile(values, 0.99), "max": _percentile(values, 1.0)}
+
+
+def replay(entries: List[dict], send: Sender, speed: float = 1.0, concurrency: int = 64) -> dict:
+    """
+    按到达时间回放 entries（请求体为 null 的跳过），返回报告
+
+    Returns:
+        {requests, skipped, seconds, throughput, max_lag_ms, paths: {路径: {requests, status, latency_ms,
+         captured_latency_ms, new_errors, fixed}}}；max_lag_ms 为发送时刻落后计划的最大值（回放端跟不上时增大）
+    """
+    playable = [e for e in entries if e.get("b") is not None]
+    results: List[Tuple[dict, int, float]] = []
+    lock = threading.Lock()
+    max_lag = 0.0
+
+    def run(entry: dict) -> None:
+        start = time.perf_counter()
+        status = send(entry)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        with lock:
+            results.append((entry, status, elapsed))
+
+    t0 = playable[0]["t"] if playable else 0.0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max(int(concurrency), 1)) as executor:
+        for entry in playable:
+            if speed > 0:
+                due = (entry["t"] - t0) / speed
+                delay = due - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+            executor.submit(run, entry)
+    seconds = time.perf_counter() - start
+
+    paths: Dict[str, dict] = {}
+    for entry, status, elapsed in results:
+        stats = paths.setdefault(entry["p"], {"requests": 0, "status": {}, "latency": [], "captured": [],
+                                              "new_errors": 0, "fixed": 0})
+        stats["requests"] += 1
+        stats["status"][str(status)] = stats["status"].get(str(status), 0) + 1
+        stats["latency"].append(elapsed)
+        if entry.get("ms") is not None:
+            stats["captured"].append(entry["ms"])
+        ok_then, ok_now = entry["s"] < 400, 0 < status < 400
+        stats["new_errors"] += ok_then and not ok_now
+        stats["fixed"] += ok_now and not ok_then
+    for stats in paths.values():
+        stats["status"] = dict(sorted(stats["status"].items()))
+        stats["latency_ms"] = _latency(stats.pop("latency"))
+        stats["captured_latency_ms"] = _latency(stats.pop("captured"))
+    return {
+        "requests": len(results),
+        "skipped": len(entries) - len(playable),
+        "seconds": round(seconds, 3),
+        "throughput": round(len(results) / seconds, 1) if seconds > 0 else None,
+        "max_lag_ms": round(max_lag * 1000.0, 1),
+        "paths": dict(sorted(paths.items())),
+    }
+
+
+def _client_ip(digest: str) -> str:
+    """客户端摘要 -> 稳定的私有地址（10.x.y.z），回放时各客户端的排队与抓取时一致"""
+    h = hashlib.sha256(digest.encode()).digest()
+    return f"10.{h[0]}.{h[1]}.{h[2] or 1}"
+
+
+def http_sender(client: Client, preserve_clients: bool = True) -> Sender:
+    def send(entry: dict) -> int:
+        headers = {"X-Real-IP": _client_ip(entry["c"])} if preserve_clients and entry.get("c") else None
+        return client.request(entry["p"], entry["b"], headers)[0]
+    return send
+
+
+def _cache_counters(client: Client, probes: int) -> Dict[int, dict]:
+    """各 worker（按 pid）的结果缓存计数：{pid: {命名空间: {hits, misses}}}"""
+    seen: Dict[int, dict] = {}
+    for _ in range(probes):
+        status, body = client.request("/stats")
+        if status == 200 and body and body.get("cache") is not None:
+            seen[body["pid"]] = {
+                ns: {"hits": c.get("hits", 0), "misses": c.get("misses", 0)} for ns, c in body["cache"].items()
+            }
+    return seen
+
+
+def cache_hit_rates(before: Dict[int, dict], after: Dict[int, dict]) -> Dict[str, dict]:
+    """回放前后都采到的 worker 的计数差，按命名空间汇总命中率（shared 为跨 worker 的 SQLite 缓存）"""
+    totals: Dict[str, Dict[str, int]] = {}
+    for pid, namespaces in after.items():
+        if pid not in before:
+            continue  # 回放期间新启动的 worker：没有基线
+        for ns, counts in namespaces.items():
+            base = before[pid].get(ns, {"hits": 0, "misses": 0})
+            total = totals.setdefault(ns, {"hits": 0, "misses": 0})
+            total["hits"] += counts["hits"] - base["hits"]
+            total["misses"] += counts["misses"] - base["misses"]
+    rates = {}
+    for ns, t in sorted(totals.items()):
+        lookups = t["hits"] + t["misses"]
+        rates[ns] = {**t, "hit_rate": round(t["hits"] / lookups, 4) if lookups else None}
+    return rates
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", nargs="+", help="抓取目录或文件（CAPTURE_PATH 下的 capture-*.jsonl）")
+    parser.add_argument("--url", default="http://127.0.0.1:8003")
+    parser.add_argument("--api-key", default=os.environ.get("SECRET_API_KEY"))
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，1 为原速，0 为尽快发送")
+    parser.add_argument("--concurrency", type=int, default=64, help="最多同时在途的请求数")
+    parser.add_argument("--limit", type=int, help="只回放最早的 N 条")
+    parser.add_argument("--probes", type=int, default=16, help="采集缓存计数时请求 /stats 的次数")
+    parser.add_argument("--no-client-ips", action="store_true", help="不按抓取的客户端设置 X-Real-IP")
+    parser.add_argument("--json", help="报告另存为 JSON 文件")
+    args = parser.parse_args()
+
+    entries = load_capture(args.capture, args.limit)
+    if not entries:
+        sys.exit("抓取文件中没有可回放的记录")
+    client = Client(args.url, args.api_key)
+    before = _cache_counters(client, args.probes)
+    report = replay(entries, http_sender(client, not args.no_client_ips), args.speed, args.concurrency)
+    report["cache"] = cache_hit_rates(before, _cache_counters(client, args.probes))
+    report["captured_span_s"] = round(entries[-1]["t"] - entries[0]["t"], 3)
+    report["speed"] = args.speed
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
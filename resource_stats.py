@@ -0,0 +1,94 @@
+"""
+进程资源统计（GET /stats/resources，长时间运行测试 soak.py 据此判断内存与句柄是否泄漏）
+读取 Linux /proc：RSS 与峰值 RSS、线程数、打开的文件描述符数、内存映射段数，以及映射进进程的
+REFPROP 库文件数（每个 librefprop.so 独立副本单独计数，副本文件加载后即删除，maps 中标记为 deleted）。
+
+进程模式下分别统计 worker 与各计算子进程；线程模式下计算线程在 worker 内，只统计 worker。
+非 Linux 平台（无 /proc）各项为 None。
+"""
+import os
+from typing import Dict, List, Optional
+
+from refprop_session import LIBRARY_NAMES
+
+_LIBRARY_STEMS = tuple(os.path.splitext(name)[0] for name in LIBRARY_NAMES)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _count_dir(path: str) -> Optional[int]:
+    try:
+        return len(os.listdir(path))
+    except OSError:
+        return None
+
+
+def _is_library(path: str) -> bool:
+    """maps 中的映射文件是否为 REFPROP 库（含独立副本 librefprop-<pid>-<n>.so）"""
+    name = os.path.basename(path.replace(" (deleted)", ""))
+    return name.startswith(_LIBRARY_STEMS)
+
+
+def process_resources(pid: Optional[int] = None) -> dict:
+    """
+    单个进程的资源占用
+
+    Returns:
+        {pid, rss_mb, rss_peak_mb, threads, open_fds, mmaps, refprop_libraries}；进程不存在或无 /proc 时各项为 None
+    """
+    pid = os.getpid() if pid is None else pid
+    result: Dict[str, Optional[float]] = {
+        "pid": pid, "rss_mb": None, "rss_peak_mb": None, "threads": None,
+        "open_fds": None, "mmaps": None, "refprop_libraries": None,
+    }
+    status = _read(f"/proc/{pid}/status")
+    if status is None:
+        return result
+    fields = {"VmRSS": "rss_mb", "VmHWM": "rss_peak_mb"}
+    for line in status.splitlines():
+        key, _, value = line.partition(":")
+        if key in fields:
+            result[fields[key]] = round(int(value.split()[0]) / 1024.0, 1)  # kB -> MB
+        elif key == "Threads":
+            result["threads"] = int(value)
+    result["open_fds"] = _count_dir(f"/proc/{pid}/fd")
+    maps = _read(f"/proc/{pid}/maps")
+    if maps is not None:
+        lines = maps.splitlines()
+        result["mmaps"] = len(lines)
+        paths = {line.split(None, 5)[5] for line in lines if len(line.split(None, 5)) == 6}
+        result["refprop_libraries"] = sum(1 for path in paths if _is_library(path))
+    return result
+
+
+def resources(pool: Optional[dict]) -> dict:
+    """
+    本 worker 的资源快照
+
+    pool 为 calc_pool.pool_stats() 的结果（未启用计算器池时为 None）；library_instances 为各计算器
+    refprop_session 已加载的库实例数（上次调用时上报）。
+    """
+    from refprop_session import setup_stats
+
+    calculators: List[dict] = []
+    if pool is not None:
+        for calc in pool["calculators"]:
+            entry = process_resources(calc["pid"]) if pool.get("mode") == "process" else {"thread_id": calc["pid"]}
+            entry["library_instances"] = calc.get("library_instances")
+            entry["calls"] = calc["calls"]
+            calculators.append(entry)
+    worker = process_resources()
+    worker["library_instances"] = setup_stats()["instances"]  # 未启用计算器池时在 worker 内直接计算
+    return {
+        "mode": pool.get("mode") if pool is not None else None,
+        "worker": worker,
+        "calculators": calculators,
+        # 线程模式：worker 进程内全部计算线程（含备用、弃用未退出）的库实例数
+        "thread_library_instances": pool.get("library_instances") if pool is not None else None,
+    }
@@ -0,0 +1,319 @@
+"""
+计算结果缓存
+两级缓存，键为命名空间（calculate / dome / fluid_info）+ 规范化的工质标识及计算参数：
+  - L1：每个 worker 进程内的小型 LRU，热点结果无需任何 IO
+  - L2：同机所有 gunicorn worker 共享的 SQLite（WAL 模式）文件，命中率不再被 worker 数平分，
+        结果也不在各 worker 内重复保存。WAL 下读取不阻塞写入；读取不更新访问时间
+        （超过 ATIME_RESOLUTION 才顺带更新一次），几乎只读的热点键不产生写竞争。
+        文件超过 RESULT_CACHE_MAX_MB 时按最久未访问淘汰；文件默认放在项目目录 cache/ 下，
+        deploy/update.sh 重启服务后仍然有效。计算逻辑或结果格式变化时递增 CACHE_VERSION，
+        旧缓存在首次打开时整体清空。
+        写入（含访问时间更新）不在请求线程中执行：放入有界队列，由后台线程批量写入，
+        队列满或等锁超时时放弃本次写入；共享缓存打开期间（各 worker 同时启动时建表需排队）
+        请求只使用进程内缓存，不等待。
+缓存值视为只读：调用方不得原地修改取出的结果。共享缓存读写失败时退化为未命中，不影响请求。
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from config import RESULT_CACHE_MAX_MB, RESULT_CACHE_PATH, RESULT_CACHE_SIZE
+
+CACHE_VERSION = 1          # 结果格式/计算逻辑版本，变化时旧缓存失效
+ATIME_RESOLUTION = 60.0    # 访问时间更新粒度 [s]
+EVICT_CHECK_EVERY = 64     # 每写入多少条检查一次文件大小
+EVICT_TARGET = 0.9         # 淘汰后保留到上限的比例
+WRITE_TIMEOUT = 0.2        # 后台写入等锁的最长时间 [s]，超时放弃本批写入
+WRITE_QUEUE_MAX = 1024     # 待写入队列上限，满时放弃新的写入
+WRITE_BATCH = 64           # 后台线程每个事务最多写入的条数
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name  TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id    INTEGER PRIMARY KEY,
+    ns    TEXT NOT NULL,
+    key   TEXT NOT NULL,
+    value TEXT NOT NULL,
+    atime REAL NOT NULL,
+    UNIQUE (ns, key)
+);
+CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime);
+"""
+
+
+class LRUCache:
+    """线程安全的定长 LRU 缓存"""
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE):
+        self.maxsize = max(int(maxsize), 0)
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SharedCache:
+    """跨 worker 共享的 SQLite 结果缓存（按文件大小上限淘汰）"""
+
+    def __init__(self, db_path: str, max_mb: float = RESULT_CACHE_MAX_MB):
+        self.db_path = db_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._queue: "queue.Queue[tuple]" = queue.Queue(WRITE_QUEUE_MAX)
+        self.counters = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0, "errors": 0, "dropped": 0}
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA busy_timeout = 5000")  # 各 worker 同时启动时建表需排队
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for stmt in _SCHEMA.split(";"):
+                if stmt.strip():
+                    conn.execute(stmt)
+            row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if row is None or row[0] != str(CACHE_VERSION):
+                conn.execute("DELETE FROM entries")
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)",
+                    (str(CACHE_VERSION),),
+                )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        conn.execute(f"PRAGMA busy_timeout = {int(WRITE_TIMEOUT * 1000)}")
+        threading.Thread(target=self._write_loop, name="result-cache-writer", daemon=True).start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接；autocommit 模式"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=WRITE_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下断电最多丢失最近的写入，缓存可接受
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def get(self, ns: str, key: str) -> Optional[Any]:
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT id, value, atime FROM entries WHERE ns = ? AND key = ?", (ns, key)
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            now = time.time()
+            if now - row[2] > ATIME_RESOLUTION:
+                self._enqueue(("touch", row[0], now))
+            self._count("hits")
+            return json.loads(row[1])
+        except (sqlite3.Error, ValueError):
+            self._count("errors")
+            return None
+
+    def put(self, ns: str, key: str, value: Any) -> None:
+        """写入放入后台队列，立即返回"""
+        try:
+            data = json.dumps(value, separators=(",", ":"))
+        except (TypeError, ValueError):
+            self._count("errors")
+            return
+        self._enqueue(("put", ns, key, data, time.time()))
+
+    def _enqueue(self, op: tuple) -> None:
+        try:
+            self._queue.put_nowait(op)
+        except queue.Full:
+            self._count("dropped")
+
+    def flush(self) -> None:
+        """等待已排队的写入完成"""
+        self._queue.join()
+
+    def _write_loop(self) -> None:
+        """后台写入线程：每次取出最多 WRITE_BATCH 条，在一个事务中写入"""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list) -> None:
+        n_puts = sum(1 for op in batch if op[0] == "put")
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for op in batch:
+                    if op[0] == "put":
+                        conn.execute(
+                            "INSERT OR REPLACE INTO entries (ns, key, value, atime) VALUES (?, ?, ?, ?)", op[1:]
+                        )
+                    else:
+                        conn.execute("UPDATE entries SET atime = ? WHERE id = ?", (op[2], op[1]))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self._count("writes", n_puts)
+            with self._lock:
+                check = self._puts // EVICT_CHECK_EVERY != (self._puts + n_puts) // EVICT_CHECK_EVERY
+                self._puts += n_puts
+            if check:
+                self._evict(conn)
+        except sqlite3.Error:
+            self._count("errors", max(n_puts, 1))
+
+    def _used_bytes(self, conn: sqlite3.Connection) -> int:
+        """数据库实际占用（不含空闲页）"""
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """超过大小上限时按最久未访问淘汰，直到降到上限的 EVICT_TARGET"""
+        used = self._used_bytes(conn)
+        if used <= self.max_bytes:
+            return
+        n_rows = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if n_rows == 0:
+            return
+        excess = 1.0 - self.max_bytes * EVICT_TARGET / used
+        n_evict = max(int(n_rows * excess), 1)
+        conn.execute(
+            "DELETE FROM entries WHERE id IN (SELECT id FROM entries ORDER BY atime LIMIT ?)",
+            (n_evict,),
+        )
+        self._count("evicted", n_evict)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        counters["pending"] = self._queue.qsize()
+        try:
+            conn = self._conn()
+            counters["entries"] = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            counters["bytes"] = self._used_bytes(conn)
+        except sqlite3.Error:
+            pass
+        return {"path": self.db_path, "max_bytes": self.max_bytes, **counters}
+
+
+_caches: Dict[str, LRUCache] = {}
+_caches_lock = threading.Lock()
+_shared: Optional[SharedCache] = None
+_shared_failed = False
+_shared_opening = False
+
+
+def _cache(namespace: str) -> LRUCache:
+    cache = _caches.get(namespace)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(namespace, LRUCache())
+    return cache
+
+
+def _shared_cache() -> Optional[SharedCache]:
+    """
+    共享缓存单例；未配置路径、打开失败或正在打开时为 None（仅使用进程内缓存）
+
+    打开（建表可能等待其他 worker 最多 5 s）在锁外进行，只由一个线程执行，其他请求不等待
+    """
+    global _shared, _shared_failed, _shared_opening
+    if _shared is not None or not RESULT_CACHE_PATH:
+        return _shared
+    with _caches_lock:
+        if _shared is not None or _shared_failed or _shared_opening:
+            return _shared
+        _shared_opening = True
+    try:
+        shared: Optional[SharedCache] = SharedCache(RESULT_CACHE_PATH)
+    except (OSError, sqlite3.Error):
+        shared = None
+    with _caches_lock:
+        _shared = shared
+        _shared_failed = shared is None
+        _shared_opening = False
+    return shared
+
+
+def _key_text(key: Hashable) -> str:
+    return key if isinstance(key, str) else json.dumps(key, separators=(",", ":"))
+
+
+def cache_get(namespace: str, key: Hashable) -> Optional[Any]:
+    """取缓存结果（先进程内，再共享缓存），未命中返回 None"""
+    l1 = _cache(namespace)
+    value = l1.get(key)
+    if value is None:
+        shared = _shared_cache()
+        if shared is not None:
+            value = shared.get(namespace, _key_text(key))
+            if value is not None:
+                l1.put(key, value)
+    return value
+
+
+def cache_put(namespace: str, key: Hashable, value: Any) -> None:
+    """写入缓存结果（进程内 + 共享缓存的后台写入队列）"""
+    _cache(namespace).put(key, value)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.put(namespace, _key_text(key), value)
+
+
+def cache_stats() -> Dict[str, dict]:
+    """各命名空间的进程内命中统计及共享缓存统计（供 /stats 使用）"""
+    with _caches_lock:
+        stats = {ns: c.stats() for ns, c in _caches.items()}
+    shared = _shared_cache()
+    if shared is not None:
+        stats["shared"] = shared.stats()
+    return stats
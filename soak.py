@@ -0,0 +1,390 @@
+"""
+长时间运行测试（soak test）：持续施加混合负载数小时，跟踪各 worker / 计算进程的内存与句柄，超过阈值即失败
+
+怀疑 worker RSS 与映射的库实例数随运行天数增长（目前靠 systemd Restart=always 兜底），本脚本用于复现与回归：
+  - 负载：多个客户端线程按权重随机发送 /calculate、/calculate/batch、/fluid-info、/dome、/dome/chart、
+    /hx/profile 以及会被拒绝的无效输入；状态点、混合物组成随机变化，绕开结果缓存，持续走到 REFPROP
+  - 采样：每隔 --sample-interval 秒多次请求 GET /stats/resources（落到不同 worker），记录各进程的
+    RSS、打开的文件描述符、内存映射段数、映射的 REFPROP 库文件数与已加载的库实例数
+  - 判定：预热（--warmup）结束时记下各进程的基线，此后任一进程 RSS 增长超过 --max-rss-growth-mb、
+    文件描述符增长超过 --max-fd-growth，或结束时映射的库文件多于仍在使用的库实例（副本未释放）即失败，退出码 1
+
+用法：
+  # 在本机启动服务（gunicorn，参数同 start.sh）并测试 4 小时；无 REFPROP 时 --fake 使用 tools/fake_refprop 替身库
+  python soak.py --fake --duration 14400 --workers 4 --csv soak.csv
+  # 对已运行的服务测试
+  python soak.py --url http://127.0.0.1:8003 --duration 3600
+计算器形态、进程数等照常由环境变量（CALC_MODE、CALC_PROCESSES、RP_SETUP_CACHE ...）传给启动的服务。
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FAKE_PATH = os.path.join(ROOT, "tools", "fake_refprop")
+
+PURE_FLUIDS = ("R32", "R125", "R1234YF", "R1234ZEE", "CO2", "PROPANE")
+MIXTURE_PAIRS = (("R32", "R125"), ("R1234ZEE", "R227EA"), ("R32", "R1234YF"))
+
+# 负载构成：(名称, 权重)；hx 为先用 /calculate PQ 取饱和焓、再请求 /hx/profile 的组合调用
+WORKLOAD = (
+    ("calculate", 55),
+    ("batch", 10),
+    ("fluid_info", 8),
+    ("dome", 6),
+    ("chart", 3),
+    ("hx", 8),
+    ("invalid", 10),
+)
+
+SAMPLE_FIELDS = ("rss_mb", "open_fds", "mmaps", "refprop_libraries", "library_instances")
+
+
+def _fluid(rng: random.Random) -> str:
+    """随机工质：约三分之一为组成随机的二元混合物（每种组成都是新的工质设置与样条）"""
+    if rng.random() < 0.35:
+        a, b = rng.choice(MIXTURE_PAIRS)
+        x = round(rng.uniform(0.1, 0.9), 3)
+        return f"{a}&{b}|{x}&{round(1 - x, 3)}"
+    return rng.choice(PURE_FLUIDS)
+
+
+def make_request(kind: str, rng: random.Random) -> Tuple[str, dict]:
+    """单次调用类负载的 (路径, 请求体)；hx 见 _run_hx"""
+    fluid = _fluid(rng)
+    if kind == "calculate":
+        return "/calculate", {
+            "fluid_string": fluid, "input_type": "PT",
+            "value1": round(rng.uniform(100.0, 2000.0), 3), "value2": round(rng.uniform(320.0, 420.0), 3),
+        }
+    if kind == "batch":
+        points = [[round(rng.uniform(100.0, 2000.0), 3), round(rng.uniform(320.0, 420.0), 3)] for _ in range(20)]
+        return "/calculate/batch", {"fluid_string": fluid, "input_type": "PT", "points": points}
+    if kind == "fluid_info":
+        return "/fluid-info", {"fluid_string": fluid}
+    if kind == "dome":
+        return "/dome", {"fluid_string": fluid}
+    if kind == "chart":
+        return "/dome/chart", {"fluid_string": fluid, "isotherms": [round(rng.uniform(280.0, 340.0), 1)]}
+    if kind == "invalid":  # 参数错误与超出适用范围，均应返回 400
+        if rng.random() < 0.5:
+            return "/calculate", {"fluid_string": "R32&R125|0.5", "input_type": "PT", "value1": 500.0, "value2": 300.0}
+        return "/calculate", {"fluid_string": fluid, "input_type": "PQ", "value1": 500.0, "value2": 1.5}
+    raise ValueError(f"未知的负载类型: {kind}")
+
+
+class Client:
+    """极简 HTTP 客户端（标准库 urllib，免安装依赖）"""
+
+    def __init__(self, url: str, api_key: Optional[str] = None, timeout: float = 120.0):
+        self.url = url.rstrip("/")
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["X-API-Key"] = api_key
+        self.timeout = timeout
+
+    def request(
+        self, path: str, body: Optional[dict] = None, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Optional[dict]]:
+        """发送请求（body 为 None 时 GET），返回 (状态码, JSON 响应)；连接失败、超时时状态码为 0"""
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.url + path, data=data, headers={**self.headers, **(headers or {})})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, json.loads(resp.read() or b"null")
+        except urllib.error.HTTPError as e:
+            return e.code, None
+        except (urllib.error.URLError, OSError, ValueError):
+            return 0, None  # 连接失败、超时或响应不完整
+
+
+def _run_hx(client: Client, rng: random.Random) -> int:
+    fluid = rng.choice(PURE_FLUIDS)
+    pressure = round(rng.uniform(300.0, 1500.0), 3)
+    enthalpies = []
+    for q in (0.0, 1.0):
+        status, body = client.request(
+            "/calculate", {"fluid_string": fluid, "input_type": "PQ", "value1": pressure, "value2": q}
+        )
+        if status != 200 or not body or body.get("H") is None:
+            return status
+        enthalpies.append(body["H"])
+    h_liquid, h_vapor = enthalpies
+    status, _ = client.request("/hx/profile", {
+        "fluid_string": fluid, "pressure": pressure, "segments": rng.choice((20, 50, 100)),
+        "h_in": h_vapor + 2000.0, "h_out": h_liquid - 1000.0,
+    })
+    return status
+
+
+class Stats:
+    """客户端统计：各负载类型的请求数、按状态码计数与延迟"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, Dict[int, int]] = {}
+        self.latencies: Dict[str, List[float]] = {}
+
+    def record(self, kind: str, status: int, seconds: float) -> None:
+        with self._lock:
+            by_status = self.counts.setdefault(kind, {})
+            by_status[status] = by_status.get(status, 0) + 1
+            latencies = self.latencies.setdefault(kind, [])
+            if len(latencies) < 100000:
+                latencies.append(seconds)
+
+    def server_errors(self) -> int:
+        """非预期的失败：5xx（503 过载拒绝、504 计算超时除外）与连接失败"""
+        with self._lock:
+            return sum(
+                n for by in self.counts.values() for s, n in by.items() if s == 0 or (s >= 500 and s not in (503, 504))
+            )
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            out = {}
+            for kind, by_status in sorted(self.counts.items()):
+                lat = sorted(self.latencies.get(kind, []))
+                out[kind] = {
+                    "requests": sum(by_status.values()),
+                    "status": {str(s): n for s, n in sorted(by_status.items())},
+                    "p50_ms": round(lat[len(lat) // 2] * 1000, 1) if lat else None,
+                    "p99_ms": round(lat[min(int(len(lat) * 0.99), len(lat) - 1)] * 1000, 1) if lat else None,
+                }
+            return out
+
+
+def _load(client: Client, stats: Stats, stop: threading.Event, seed: int) -> None:
+    rng = random.Random(seed)
+    kinds = [k for k, _ in WORKLOAD]
+    weights = [w for _, w in WORKLOAD]
+    while not stop.is_set():
+        kind = rng.choices(kinds, weights)[0]
+        start = time.monotonic()
+        if kind == "hx":
+            status = _run_hx(client, rng)
+        else:
+            status, _ = client.request(*make_request(kind, rng))
+        stats.record(kind, status, time.monotonic() - start)
+
+
+def processes(snapshot: dict) -> List[dict]:
+    """
+    把一个 worker 的 /stats/resources 展开为各进程的记录 {key, role, pid, 各项指标, expected_libraries}
+
+    expected_libraries 为该进程内仍在使用的库实例数：线程模式下 worker 进程内含全部计算线程（含备用线程）的实例。
+    """
+    worker = dict(snapshot["worker"])
+    calculators = snapshot.get("calculators") or []
+    if snapshot.get("mode") == "thread":
+        worker["expected_libraries"] = (worker.get("library_instances") or 0) + (
+            snapshot.get("thread_library_instances") or 0
+        )
+        rows = [("worker", worker)]
+    else:
+        worker["expected_libraries"] = worker.get("library_instances")
+        rows = [("worker", worker)]
+        for calc in calculators:
+            entry = dict(calc)
+            entry["expected_libraries"] = calc.get("library_instances")
+            rows.append(("calculator", entry))
+    return [{**entry, "role": role, "key": f"{role}:{entry['pid']}"} for role, entry in rows if entry.get("pid")]
+
+
+class LeakTracker:
+    """按进程记录基线并检查增长；预热期间的采样只更新基线"""
+
+    def __init__(self, max_rss_growth_mb: float, max_fd_growth: int):
+        self.max_rss_growth_mb = max_rss_growth_mb
+        self.max_fd_growth = max_fd_growth
+        self.baselines: Dict[str, dict] = {}
+        self.latest: Dict[str, dict] = {}
+
+    def observe(self, proc: dict, warm: bool) -> List[str]:
+        """记录一个进程的采样，返回超出阈值的说明（预热期间恒为空）"""
+        key = proc["key"]
+        self.latest[key] = proc
+        if not warm or key not in self.baselines:
+            self.baselines[key] = proc  # 预热期间取最后一次采样；预热后新出现的进程（重启、替换）取首次采样
+            return []
+        base = self.baselines[key]
+        failures = []
+        if proc.get("rss_mb") is not None and base.get("rss_mb") is not None:
+            growth = proc["rss_mb"] - base["rss_mb"]
+            if growth > self.max_rss_growth_mb:
+                failures.append(f"{key} RSS 增长 {growth:.1f} MB（{base['rss_mb']} -> {proc['rss_mb']}），"
+                                f"超过 {self.max_rss_growth_mb:g} MB")
+        if proc.get("open_fds") is not None and base.get("open_fds") is not None:
+            growth = proc["open_fds"] - base["open_fds"]
+            if growth > self.max_fd_growth:
+                failures.append(f"{key} 文件描述符增长 {growth}（{base['open_fds']} -> {proc['open_fds']}），"
+                                f"超过 {self.max_fd_growth}")
+        return failures
+
+    def library_excess(self) -> List[str]:
+        """最后一次采样时映射的 REFPROP 库文件多于仍在使用的库实例（副本未释放）的进程"""
+        failures = []
+        for key, proc in self.latest.items():
+            mapped, expected = proc.get("refprop_libraries"), proc.get("expected_libraries")
+            if mapped is not None and expected is not None and mapped > expected:
+                failures.append(f"{key} 映射了 {mapped} 个 REFPROP 库文件，仍在使用的库实例只有 {expected} 个")
+        return failures
+
+    def growth(self) -> Dict[str, dict]:
+        """各进程的 基线 -> 最后一次采样"""
+        return {
+            key: {f: f"{self.baselines[key].get(f)} -> {proc.get(f)}" for f in ("rss_mb", "open_fds", "mmaps")}
+            for key, proc in self.latest.items()
+        }
+
+
+def _sample(client: Client, probes: int) -> List[dict]:
+    """多次请求 /stats/resources（每次新建连接，落到不同 worker），按进程去重"""
+    seen: Dict[str, dict] = {}
+    for _ in range(probes):
+        status, body = client.request("/stats/resources")
+        if status == 200 and body:
+            for proc in processes(body):
+                seen[proc["key"]] = proc
+    return list(seen.values())
+
+
+def _prepare_fake(tmp: str, env: dict) -> None:
+    """替身库：RPPREFIX 下放一个非空的 librefprop.so（替身按文件映射内存，便于统计库实例的映射数）"""
+    if not os.path.isdir(FAKE_PATH):
+        raise SystemExit(f"找不到替身库 {FAKE_PATH}")
+    prefix = os.path.join(tmp, "refprop")
+    os.makedirs(prefix)
+    with open(os.path.join(prefix, "librefprop.so"), "wb") as f:
+        f.write(b"\0" * 1024 * 1024)
+    env["RPPREFIX"] = env["FLUIDS_PATH"] = prefix
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (FAKE_PATH, ROOT, env.get("PYTHONPATH")) if p)
+
+
+def _start_server(args, tmp: str) -> Tuple[subprocess.Popen, str]:
+    env = dict(os.environ)
+    env.setdefault("RUNTIME_DIR", os.path.join(tmp, "run"))
+    env.setdefault("RESULT_CACHE_PATH", os.path.join(tmp, "results.sqlite3"))
+    env["GUNICORN_WORKERS"] = str(args.workers)
+    if args.fake:
+        _prepare_fake(tmp, env)
+    bind = f"127.0.0.1:{args.port}"
+    cmd = [
+        sys.executable, "-m", "gunicorn", "main:app", "-w", str(args.workers),
+        "-k", "uvicorn.workers.UvicornWorker", "-b", bind, "--timeout", "120",
+    ]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    url = f"http://{bind}"
+    client = Client(url)
+    deadline = time.monotonic() + 60.0
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"服务启动失败（退出码 {proc.returncode}）")
+        if client.request("/")[0] == 200:
+            return proc, url
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit("服务 60 秒内未就绪")
+
+
+def run(args, log: Callable[[str], None] = print) -> int:
+    tmp = tempfile.mkdtemp(prefix="refbackend-soak-")
+    server = None
+    try:
+        if args.url:
+            url = args.url
+        else:
+            server, url = _start_server(args, tmp)
+        client = Client(url, args.api_key)
+        stats = Stats()
+        tracker = LeakTracker(args.max_rss_growth_mb, args.max_fd_growth)
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=_load, args=(client, stats, stop, args.seed + i), daemon=True)
+            for i in range(args.clients)
+        ]
+        for t in threads:
+            t.start()
+
+        writer = None
+        csv_file = open(args.csv, "w", newline="") if args.csv else None
+        if csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(("elapsed_s", "key") + SAMPLE_FIELDS)
+        failures: List[str] = []
+        start = time.monotonic()
+        try:
+            while True:
+                elapsed = time.monotonic() - start
+                warm = elapsed >= args.warmup
+                for proc in _sample(client, args.probes or 3 * args.workers):
+                    failures.extend(tracker.observe(proc, warm))
+                    if writer:
+                        writer.writerow([round(elapsed, 1), proc["key"]] + [proc.get(f) for f in SAMPLE_FIELDS])
+                if csv_file:
+                    csv_file.flush()
+                total_rss = sum(p.get("rss_mb") or 0 for p in tracker.latest.values())
+                log(f"[{elapsed:8.0f} s] 进程 {len(tracker.latest)}，RSS 合计 {total_rss:.0f} MB，"
+                    f"非预期失败 {stats.server_errors()}")
+                if failures or elapsed >= args.duration:
+                    break
+                time.sleep(min(args.sample_interval, max(args.duration - elapsed, 0.1)))
+        finally:
+            stop.set()
+            for t in threads:
+                t.join(client.timeout)
+            if csv_file:
+                csv_file.close()
+
+        failures.extend(tracker.library_excess())
+        if stats.server_errors() > args.max_server_errors:
+            failures.append(f"非预期失败（5xx、连接失败）{stats.server_errors()} 次，超过 {args.max_server_errors}")
+        log(json.dumps({"requests": stats.summary(), "processes": tracker.growth()}, ensure_ascii=False, indent=2))
+        for failure in failures:
+            log(f"FAIL: {failure}")
+        log("PASS" if not failures else f"FAIL（{len(failures)} 项）")
+        return 1 if failures else 0
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="已运行服务的地址；不给时在本机启动 gunicorn")
+    parser.add_argument("--api-key", default=os.environ.get("SECRET_API_KEY"))
+    parser.add_argument("--fake", action="store_true", help="启动的服务使用 tools/fake_refprop 替身库")
+    parser.add_argument("--workers", type=int, default=4, help="启动的服务的 gunicorn worker 数")
+    parser.add_argument("--port", type=int, default=8013)
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端线程数")
+    parser.add_argument("--duration", type=float, default=4 * 3600.0, help="测试时长 [s]")
+    parser.add_argument("--warmup", type=float, default=600.0, help="预热时长 [s]，结束时记录基线")
+    parser.add_argument("--sample-interval", type=float, default=60.0, help="资源采样间隔 [s]")
+    parser.add_argument("--probes", type=int, default=0, help="每次采样请求 /stats/resources 的次数（默认 3 × workers）")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=100.0, help="单进程 RSS 相对基线的最大增长 [MB]")
+    parser.add_argument("--max-fd-growth", type=int, default=20, help="单进程文件描述符相对基线的最大增长")
+    parser.add_argument("--max-server-errors", type=int, default=0, help="允许的非预期失败（5xx、连接失败）次数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--csv", help="采样明细输出文件（CSV）")
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
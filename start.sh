@@ -16,13 +16,14 @@ if [ -f .env ]; then
 fi
 
 # gunicorn 配置
-# -w 4: 至少 4 个 worker 进程
+# -w: worker 进程数（GUNICORN_WORKERS，默认 4）；CALC_MODE=thread 时一个 worker 即可并行 CALC_PROCESSES 个计算，
+#     建议 GUNICORN_WORKERS=1（全部请求共享一份进程内缓存，省去多个 worker 重复的 Python 运行时）
 # -k uvicorn.workers.UvicornWorker: 使用 Uvicorn 的 ASGI worker
 # -b 0.0.0.0:8003: 绑定所有网卡，端口 8003
-# --timeout: 长时间计算请求超时（秒），按需调整
+# --timeout: worker 心跳超时（秒）；单次 REFPROP 调用的超时由计算子进程看门狗控制（CALC_TIMEOUT_*）
 # --access-logfile -: 访问日志输出到 stdout
 exec gunicorn main:app \
-  -w 4 \
+  -w "${GUNICORN_WORKERS:-4}" \
   -k uvicorn.workers.UvicornWorker \
   -b 0.0.0.0:8003 \
   --timeout 120 \
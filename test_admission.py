@@ -0,0 +1,160 @@
+"""
+准入控制测试：过载拒绝（429/503 + Retry-After）、两个客户端之间的加权公平、遗留票据清理
+"""
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from admission import AdmissionController, client_digest
+from dependencies import client_identity
+
+
+def _hold(ctrl: AdmissionController, client: str):
+    """占用一个槽位，返回用于释放的上下文"""
+    ctx = ctrl.admit(client, 1.0)
+    ctx.__enter__()
+    return ctx
+
+
+def _wait_queued(ctrl: AdmissionController, n: int, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while ctrl.snapshot()["queued"] < n:
+        assert time.monotonic() < deadline, "排队票据未按预期出现"
+        time.sleep(0.005)
+
+
+def _spawn_waiters(ctrl: AdmissionController, clients, log=None):
+    def job(client):
+        try:
+            with ctrl.admit(client, 1.0):
+                if log is not None:
+                    log.append(client)
+                time.sleep(0.01)
+        except HTTPException:
+            pass
+
+    threads = []
+    queued = ctrl.snapshot()["queued"]
+    for client in clients:
+        t = threading.Thread(target=job, args=(client,))
+        t.start()
+        threads.append(t)
+        _wait_queued(ctrl, queued + len(threads))
+    return threads
+
+
+def test_per_key_queue_limit_returns_429_with_retry_after(tmp_db):
+    ctrl = AdmissionController(tmp_db, slots=1, queue_per_key=1, queue_total=10, max_wait=2.0)
+    held = _hold(ctrl, "key:a")
+    threads = _spawn_waiters(ctrl, ["key:a"])
+    with pytest.raises(HTTPException) as exc:
+        with ctrl.admit("key:a", 1.0):
+            pass
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+    # 其他客户端不受该客户端排队上限影响
+    threads += _spawn_waiters(ctrl, ["key:b"])
+    held.__exit__(None, None, None)
+    for t in threads:
+        t.join()
+    assert ctrl.snapshot()["running"] == 0
+
+
+def test_total_queue_limit_and_wait_timeout_return_503(tmp_db):
+    ctrl = AdmissionController(tmp_db, slots=1, queue_per_key=10, queue_total=1, max_wait=0.2)
+    held = _hold(ctrl, "key:a")
+    threads = _spawn_waiters(ctrl, ["key:b"])
+    with pytest.raises(HTTPException) as exc:
+        with ctrl.admit("key:c", 1.0):
+            pass
+    assert exc.value.status_code == 503
+    assert int(exc.value.headers["Retry-After"]) >= 1
+    for t in threads:
+        t.join()  # key:b 等待超过 max_wait 后被拒绝并撤销票据
+    assert ctrl.snapshot()["queued"] == 0
+    held.__exit__(None, None, None)
+
+
+def test_fair_share_between_two_keys(tmp_db):
+    ctrl = AdmissionController(tmp_db, slots=1, queue_per_key=8, queue_total=16, max_wait=5.0)
+    held = _hold(ctrl, "key:a")
+    order = []
+    # key:a 先排了 3 个作业，key:b 后到；按 FIFO 时 key:b 排在最后
+    threads = _spawn_waiters(ctrl, ["key:a", "key:a", "key:a", "key:b"], order)
+    held.__exit__(None, None, None)
+    for t in threads:
+        t.join()
+    assert sorted(order) == ["key:a"] * 3 + ["key:b"]
+    assert order.index("key:b") <= 1
+
+
+def test_weighted_client_gets_larger_share(tmp_db, monkeypatch):
+    monkeypatch.setattr("admission.API_KEY_WEIGHTS", {"heavy": 3.0})
+    ctrl = AdmissionController(tmp_db, slots=1, queue_per_key=16, queue_total=32, max_wait=10.0)
+    held = _hold(ctrl, "key:light")
+    order = []
+    threads = _spawn_waiters(ctrl, ["key:light"] * 4 + ["key:heavy"] * 4, order)
+    held.__exit__(None, None, None)
+    for t in threads:
+        t.join()
+    # 前 5 个中权重 3 的客户端至少占 3 个
+    assert order[:5].count("key:heavy") >= 3
+
+
+def test_reap_releases_tickets_of_dead_workers(tmp_db):
+    ctrl = AdmissionController(tmp_db, slots=1, queue_per_key=4, queue_total=4, max_wait=3.0)
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    with ctrl._tx() as conn:
+        conn.execute(
+            "INSERT INTO clients (client, weight, vtime) VALUES (?, 1, 0)", (client_digest("key:gone"),)
+        )
+        conn.execute(
+            "INSERT INTO tickets (client, cost, pid, state, created) VALUES (?, 1, ?, 'running', ?)",
+            (client_digest("key:gone"), proc.pid, time.time()),
+        )
+    assert ctrl.snapshot()["running"] == 1
+    ctrl._last_reap = 0.0
+    with ctrl.admit("key:a", 1.0):  # 死亡 worker 的槽位被回收后立即获得
+        assert ctrl.snapshot()["clients"].keys() == {client_digest("key:a")}
+
+
+def _request(peer: str, api_key: str, real_ip: str = "") -> Request:
+    headers = [(b"x-api-key", api_key.encode())]
+    if real_ip:
+        headers.append((b"x-real-ip", real_ip.encode()))
+    return Request({"type": "http", "headers": headers, "client": (peer, 5000)})
+
+
+def _identity(peer: str, api_key: str, real_ip: str = "") -> str:
+    return client_identity(_request(peer, api_key, real_ip), api_key)
+
+
+def test_unverified_api_key_does_not_become_identity(monkeypatch):
+    monkeypatch.setattr("dependencies.SECRET_API_KEY", "")
+    monkeypatch.setattr("dependencies.API_KEY_WEIGHTS", {"frontend": 4.0})
+    # 开发模式下任意 Key 都能通过鉴权，但只有登记过的 Key 才作为客户端标识
+    assert _identity("203.0.113.9", "random-1") == "ip:203.0.113.9"
+    assert _identity("127.0.0.1", "random-2", "198.51.100.7") == "ip:198.51.100.7"
+    assert _identity("203.0.113.9", "frontend") == "key:frontend"
+    monkeypatch.setattr("dependencies.SECRET_API_KEY", "server-key")
+    assert _identity("203.0.113.9", "server-key") == "key:server-key"
+
+
+def test_zero_slot_ticket_is_charged_without_waiting_for_a_slot(tmp_db):
+    ctrl = AdmissionController(tmp_db, slots=1, queue_per_key=4, queue_total=4, max_wait=0.5)
+    held = _hold(ctrl, "key:a")
+    # 槽位已满：只计费的票据照常获得（计入 vtime），不占槽位
+    with ctrl.admit("key:b", 5.0, slots=0):
+        snap = ctrl.snapshot()
+        assert snap["running"] == 1 and snap["queued"] == 0
+    vtime = ctrl._conn().execute(
+        "SELECT vtime FROM clients WHERE client = ?", (client_digest("key:b"),)
+    ).fetchone()[0]
+    assert vtime == 1.0 + 5.0  # 新客户端先提升到活跃客户端 key:a 的 vtime
+    held.__exit__(None, None, None)
@@ -0,0 +1,242 @@
+"""
+批量文件作业测试：分块读取、按工质分组切分任务、结果按原始行序写出；
+单行错误只写入 error 列；缺少必需列在首块前报错；Parquet 往返；
+响应开始后整块失败或读取出错时写入 error 列而不截断文件，提前结束时关闭写入器；
+后续分块准入的总等待时长有上限；上传内容在线程池中落盘，超限返回 413
+"""
+import csv
+import io
+from types import SimpleNamespace
+
+import anyio
+import pytest
+from fastapi import HTTPException
+
+import bulk_job
+import main
+from bulk_job import detect_format, run_job
+
+CSV = (
+    "Fluid,input_type,value1,value2,note\n"
+    "R32,PT,1000,300,a\n"
+    "R454B,PH,1000,25000,b\n"
+    "R32,PT,1000,100,c\n"
+    "R32,PT,abc,300,d\n"
+    "R32,PT,2000,320,e\n"
+    "R32,TQ,280,0.5,f\n"
+    "R32,PT,1500,310,g\n"
+)
+
+
+def _run(path, fmt, chunk_rows):
+    job = run_job("ip:test", path, fmt, chunk_rows)
+    assert next(job) is None
+    return b"".join(job)
+
+
+def test_csv_job(refprop, tmp_path, monkeypatch):
+    calls = []
+    run_tasks = bulk_job.run_tasks
+
+    def counting_run_tasks(task, kwargs_list, timeout=None):
+        calls.append([len(kwargs["points"]) for kwargs in kwargs_list])
+        return run_tasks(task, kwargs_list, timeout)
+
+    monkeypatch.setattr(bulk_job, "run_tasks", counting_run_tasks)
+    monkeypatch.setattr(bulk_job, "BULK_TASK_POINTS", 2)
+    path = tmp_path / "points.csv"
+    path.write_text(CSV)
+    assert detect_format(str(path)) == "csv"
+    rows = list(csv.DictReader(io.StringIO(_run(str(path), "csv", 4).decode())))
+    assert [int(r["row"]) for r in rows] == list(range(7))
+    assert calls == [[1, 1], [2, 1]]  # 块 1：R32-PT、R454B-PH；块 2：R32-PT 切成 2+1，R32-TQ 另成一组
+    assert float(rows[0]["T"]) == pytest.approx(300.0) and rows[0]["error"] == ""
+    assert "最低温度" in rows[2]["error"] and rows[2]["T"] == ""
+    assert "不是数值" in rows[3]["error"]
+    assert float(rows[5]["Q"]) == pytest.approx(0.5)
+
+
+def test_missing_columns(tmp_path):
+    path = tmp_path / "bad.csv"
+    path.write_text("fluid,value1\nR32,1\n")
+    with pytest.raises(ValueError, match="input_type"):
+        next(run_job("ip:test", str(path), "csv"))
+
+
+def test_parquet_job(refprop, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "points.parquet"
+    pq.write_table(pa.table({
+        "fluid_string": ["R32"] * 5,
+        "input_type": ["PT"] * 5,
+        "value1": [1000.0] * 5,
+        "value2": [280.0, 290.0, 300.0, 310.0, 50.0],
+    }), str(path))
+    assert detect_format(str(path)) == "parquet"
+    table = pq.read_table(io.BytesIO(_run(str(path), "parquet", 2)))
+    assert table.column("row").to_pylist() == [0, 1, 2, 3, 4]
+    assert table.column("T").to_pylist()[:4] == pytest.approx([280.0, 290.0, 300.0, 310.0])
+    assert table.column("error").to_pylist()[4] is not None
+
+
+def test_late_chunk_failure_is_written_to_error_column(refprop, tmp_path, monkeypatch):
+    compute_chunk = bulk_job.compute_chunk
+    chunks = []
+
+    def flaky_compute_chunk(client, rows, limits, first=False):
+        chunks.append(first)
+        if len(chunks) % 3 == 2:  # 每个作业的第 2 块失败
+            raise HTTPException(status_code=503, detail="Server overloaded.")
+        return compute_chunk(client, rows, limits, first)
+
+    monkeypatch.setattr(bulk_job, "compute_chunk", flaky_compute_chunk)
+    path = tmp_path / "points.csv"
+    path.write_text(CSV)
+    rows = list(csv.DictReader(io.StringIO(_run(str(path), "csv", 3).decode())))
+    assert [int(r["row"]) for r in rows] == list(range(7))  # 没有截断
+    assert all("Server overloaded" in r["error"] for r in rows[3:6])
+    assert float(rows[6]["T"]) == pytest.approx(310.0)
+
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "points.parquet"
+    pq.write_table(pa.table({name: [r[name] for r in csv.DictReader(io.StringIO(CSV))]
+                             for name in ("Fluid", "input_type", "value1", "value2")}), str(path))
+    table = pq.read_table(io.BytesIO(_run(str(path), "parquet", 3)))  # 文件尾完整
+    assert table.column("row").to_pylist() == list(range(7))
+    assert all("Server overloaded" in e for e in table.column("error").to_pylist()[3:6])
+
+
+def test_writer_is_closed_when_job_stops_early(tmp_path, monkeypatch):
+    closed = []
+
+    class Writer(bulk_job.CsvWriter):
+        def close(self):
+            closed.append(True)
+            return super().close()
+
+    monkeypatch.setattr(bulk_job, "CsvWriter", Writer)
+    monkeypatch.setattr(bulk_job, "compute_chunk", lambda client, rows, limits, first=False: [dict(r) for r in rows])
+    path = tmp_path / "points.csv"
+    path.write_text(CSV)
+    job = run_job("ip:test", str(path), "csv", 2)
+    assert next(job) is None and next(job)
+    job.close()  # 客户端断开
+    assert closed
+
+
+def test_fluid_limits_resolved_once_per_chunk(refprop, tmp_path, monkeypatch):
+    lookups = []
+    get_limits_many = bulk_job.get_limits_many
+
+    def recording(fluids, client):
+        lookups.append(sorted(fluids))
+        return get_limits_many(fluids, client)
+
+    monkeypatch.setattr(bulk_job, "get_limits_many", recording)
+    monkeypatch.setattr(bulk_job, "JOB_LIMITS_CACHE", 1)
+    path = tmp_path / "points.csv"
+    path.write_text(CSV)
+    _run(str(path), "csv", 4)
+    # 块 1 的两种工质一次查询；作业内缓存只留最近的 1 个（R454B），块 2 的 R32 再取一次（已在结果缓存中）
+    assert [len(keys) for keys in lookups] == [2, 1] and lookups[1] == ["R32"]
+
+
+def _echo_chunk(client, rows, limits, first=False):
+    return [dict(r) for r in rows]
+
+
+def test_late_read_error_ends_csv_with_error_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_job, "compute_chunk", _echo_chunk)
+    path = tmp_path / "points.csv"
+    # 非法 UTF-8 字节位于首个读缓冲之后：首块正常返回，之后解码失败
+    path.write_bytes(b"fluid,input_type,value1,value2\n" + b"R32,PT,1000,300\n" * 2000 + b"R32,PT,\xff\xfe,300\n")
+    rows = list(csv.DictReader(io.StringIO(_run(str(path), "csv", 100).decode())))
+    failed = rows[-1]
+    assert int(failed["row"]) >= 100
+    assert [int(r["row"]) for r in rows[:-1]] == list(range(int(failed["row"])))
+    assert "读取输入文件失败" in failed["error"] and "utf-8" in failed["error"]
+    assert all(r["error"] == "" for r in rows[:-1])
+
+
+def test_late_read_error_keeps_parquet_footer(tmp_path, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    def corrupt_after_first(path, fmt, chunk_rows):
+        yield [{"fluid": "R32", "input_type": "PT", "value1": "1000", "value2": "300"}] * 2
+        raise pa.ArrowInvalid("Couldn't deserialize thrift: TProtocolException")
+
+    monkeypatch.setattr(bulk_job, "compute_chunk", _echo_chunk)
+    monkeypatch.setattr(bulk_job, "iter_chunks", corrupt_after_first)
+    table = pq.read_table(io.BytesIO(_run("unused.parquet", "parquet", 2)))
+    assert table.column("row").to_pylist() == [0, 1, 2]
+    assert table.column("error").to_pylist()[:2] == [None, None]
+    assert "thrift" in table.column("error").to_pylist()[2]
+
+
+def test_first_chunk_read_error_raises(tmp_path):
+    path = tmp_path / "points.csv"
+    path.write_bytes(b"fluid,input_type,value1,value2\nR32,PT,\xff,300\n")
+    with pytest.raises(UnicodeDecodeError):
+        next(run_job("ip:test", str(path), "csv"))
+
+
+def test_admission_retries_stop_at_deadline(monkeypatch):
+    clock = [0.0]
+    waits = []
+
+    def rejected(client, kind, cost, slots):
+        raise HTTPException(status_code=503, detail="Server overloaded.", headers={"Retry-After": "50"})
+
+    def sleep(seconds):
+        waits.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(bulk_job, "admit", rejected)
+    monkeypatch.setattr(bulk_job, "time", SimpleNamespace(monotonic=lambda: clock[0], sleep=sleep))
+    monkeypatch.setattr(bulk_job, "ADMISSION_DEADLINE", 120.0)
+    with pytest.raises(HTTPException):
+        with bulk_job._admit_chunk("ip:test", 10, 1, first=False):
+            pass
+    assert waits == [50.0, 50.0]  # 第三次等待将超过总时长上限，直接放弃
+    with pytest.raises(HTTPException):
+        with bulk_job._admit_chunk("ip:test", 10, 1, first=True):
+            pass
+    assert len(waits) == 2  # 首块不重试
+
+
+class _Upload:
+    """只提供 stream() 的请求替身"""
+
+    def __init__(self, parts):
+        self._parts = parts
+
+    async def stream(self):
+        for part in self._parts:
+            yield part
+
+
+def test_spool_upload_writes_in_threadpool(tmp_path, monkeypatch):
+    offloaded = []
+    run_in_threadpool = main.run_in_threadpool
+
+    async def recording(func, *args):
+        offloaded.append(func.__name__)
+        return await run_in_threadpool(func, *args)
+
+    monkeypatch.setattr(main, "run_in_threadpool", recording)
+    path = anyio.run(main._spool_upload, _Upload([b"fluid,", b"input_type\n"]))
+    try:
+        with open(path, "rb") as f:
+            assert f.read() == b"fluid,input_type\n"
+    finally:
+        main.os.unlink(path)
+    assert offloaded == ["write", "write"]
+
+    monkeypatch.setattr(main, "BULK_MAX_MB", 1 / 1024 / 1024)  # 1 字节
+    monkeypatch.setattr(main.tempfile, "tempdir", str(tmp_path))
+    with pytest.raises(HTTPException) as exc:
+        anyio.run(main._spool_upload, _Upload([b"ab"]))
+    assert exc.value.status_code == 413 and list(tmp_path.iterdir()) == []
@@ -0,0 +1,200 @@
+"""
+计算进程池测试：超时后计算进程被终止并替换、空闲期间退出的进程替换后重发、替换失败后恢复；
+按工质亲和路由（首选进程忙时溢出）及 /stats 中的计数；计算进程内工质设置的 LRU 命中、切换与淘汰，混合物 SATSPLN 样条按组成只拟合一次、实例改设工质后重新拟合；
+线程模式的计算线程各用独立库副本、超时后弃用并顶替
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import calc_pool
+import main
+import refprop_session
+from calc_pool import TASKS, CalculationTimeout, CalculatorPool, ThreadCalculatorPool, _Calculator
+from dome_engine import compute_saturation_dome
+from fluid_info import get_fluid_info
+
+POINT = {"fluid_string": "R32", "input_type": "PT", "value1": 1000.0, "value2": 300.0}
+
+
+@pytest.fixture
+def pool(refprop):
+    pool = CalculatorPool(size=1, spares=1)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def test_calculator_killed_and_replaced_on_timeout(pool):
+    old = pool._slots[0]
+    with pytest.raises(CalculationTimeout):
+        # 整条饱和曲线不可能在 0.1 ms 内算完（单点计算在替身库上可能快于此）
+        pool.call("dome", 1e-4, fluid_string="R32")
+    old.proc.join(5.0)
+    assert not old.proc.is_alive()
+    assert pool._slots[0] is not old
+    assert pool.counters["timeouts"] == 1 and pool.counters["replacements"] == 1
+    assert pool.call("calculate", 10.0, **POINT)["T"] == pytest.approx(300.0)
+
+
+def test_dead_calculator_replaced_and_request_resent(pool):
+    assert pool.call("calculate", 10.0, **POINT)["T"] == pytest.approx(300.0)
+    pool._slots[0].kill()  # 空闲期间退出：请求尚未发出，替换后重发
+    assert pool.call("calculate", 10.0, **POINT)["T"] == pytest.approx(300.0)
+    assert pool.counters["replacements"] == 1
+    assert pool.counters["crashes"] == 0
+
+
+def test_failed_replacement_is_retried_on_next_call(pool, monkeypatch):
+    pool._slots[0].kill()
+    pool._spares.clear()
+    monkeypatch.setattr(_Calculator, "wait_ready", lambda self, timeout=0: False)
+    with pytest.raises(RuntimeError):
+        pool.call("calculate", 10.0, **POINT)
+    monkeypatch.undo()
+    assert pool.call("calculate", 10.0, **POINT)["T"] == pytest.approx(300.0)
+    assert pool.counters["replacements"] == 1
+
+
+def test_value_error_passes_through(pool):
+    with pytest.raises(ValueError):
+        pool.call("calculate", 10.0, **{**POINT, "input_type": "PTX"})
+    assert pool.call("calculate", 10.0, **POINT)["T"] == pytest.approx(300.0)
+
+
+def test_ring_order_is_stable_and_spreads_fluids(refprop):
+    pool = CalculatorPool(size=3, spares=0)
+    order = pool._ring_order("R32")
+    assert sorted(order) == [0, 1, 2]
+    assert CalculatorPool(size=3, spares=0)._ring_order("R32") == order  # 与进程、实例无关
+    homes = {pool._ring_order(f"FLUID{i}")[0] for i in range(50)}
+    assert homes == {0, 1, 2}
+
+
+def test_affinity_falls_back_when_home_is_busy(refprop):
+    pool = CalculatorPool(size=3, spares=0)
+    pool._busy = [False] * 3
+    order = pool._ring_order("R32")
+    assert pool._acquire("R32") == order[0]
+    assert pool._acquire("R32") == order[1]  # 首选进程忙：按环上的顺序溢出
+    pool._release(order[0])
+    assert pool._acquire("R32") == order[0]
+    assert pool.counters["affinity_home"] == 2 and pool.counters["affinity_spills"] == 1
+
+
+def test_same_fluid_stays_on_one_calculator(refprop, monkeypatch):
+    pool = CalculatorPool(size=2, spares=0)
+    pool.start()
+    try:
+        home = pool._ring_order("R32")[0]
+        for _ in range(3):
+            assert pool.call("calculate", 10.0, "R32", **POINT)["T"] == pytest.approx(300.0)
+        monkeypatch.setattr(calc_pool, "_pool", pool)
+        stats = main.stats()["calculators"]
+    finally:
+        pool.shutdown()
+    assert [c["calls"] for c in stats["calculators"]] == [3 if i == home else 0 for i in range(2)]
+    assert stats["calculators"][home]["fluids_loaded"] == ["R32"]
+    assert stats["affinity_home"] == 3 and stats["affinity_spills"] == 0
+    assert stats["setup_switches"] == 1 and stats["setup_hits"] == 2
+
+
+@pytest.fixture
+def session(refprop, monkeypatch):
+    """空的工质设置缓存（新的进程级默认 Session），容量 2"""
+    monkeypatch.setattr(refprop_session, "RP_SETUP_CACHE", 2)
+    monkeypatch.setattr(refprop_session, "_default", refprop_session.Session())
+
+
+def test_setup_cache_hits_switches_and_evictions(session):
+    r32 = refprop_session.get_rp("R32")
+    assert refprop_session.get_rp("R32") is r32
+    r125 = refprop_session.get_rp("R125")
+    assert r125 is not r32  # 有空位：加载独立的库副本
+    assert refprop_session.get_rp("R32") is r32
+    assert refprop_session.get_rp("CO2") is r125  # 已满：改设最久未用的 R125 所在实例
+    stats = refprop_session.setup_stats()
+    assert stats["loaded"] == ["R32", "CO2"]
+    assert (stats["hits"], stats["switches"], stats["evictions"]) == (2, 3, 1)
+
+
+class _RecordingLibrary:
+    """记录混合物 CRIT 调用所传 iFlag 的 REFPROP 实例包装"""
+
+    def __init__(self, rp, flags):
+        self._rp = rp
+        self._flags = flags
+
+    def __getattr__(self, name):
+        return getattr(self._rp, name)
+
+    def REFPROPdll(self, hFld, hIn, hOut, iUnits, iMass, iFlag, a, b, z):
+        if hIn.upper() == "CRIT" and "*" in hFld:
+            self._flags.append(iFlag)
+        return self._rp.REFPROPdll(hFld, hIn, hOut, iUnits, iMass, iFlag, a, b, z)
+
+
+@pytest.fixture
+def crit_flags(session, monkeypatch):
+    flags = []
+    load = refprop_session.load_library
+    monkeypatch.setattr(refprop_session, "load_library", lambda *args, **kw: _RecordingLibrary(load(*args, **kw), flags))
+    return flags
+
+
+def test_spline_fitted_once_per_composition(crit_flags):
+    compute_saturation_dome("R454B")
+    compute_saturation_dome("R454B")
+    get_fluid_info("R454B")
+    assert crit_flags == [1, 0, 0]  # 同一组成只拟合一次，INFO 查询也复用
+    compute_saturation_dome("R32&R1234YF|0.5&0.5")  # 组成不同：另一个实例，重新拟合
+    assert crit_flags[3:] == [1]
+    stats = refprop_session.setup_stats()
+    assert (stats["spline_fits"], stats["spline_reuses"]) == (2, 2)
+
+
+def test_spline_fit_reset_on_eviction(crit_flags):
+    compute_saturation_dome("R454B")
+    compute_saturation_dome("R32&R1234YF|0.5&0.5")
+    compute_saturation_dome("R32")  # 容量 2：淘汰 R454B，其实例改设 R32
+    compute_saturation_dome("R454B")  # 重新设置后必须重新拟合
+    assert crit_flags == [1, 1, 1]
+    stats = refprop_session.setup_stats()
+    assert (stats["spline_fits"], stats["spline_reuses"], stats["evictions"]) == (3, 0, 2)
+def _slow(seconds: float) -> float:
+    """线程模式超时测试用的慢任务"""
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.fixture
+def thread_pool(refprop):
+    pool = ThreadCalculatorPool(size=2, spares=1)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def test_thread_calculators_use_separate_library_copies(thread_pool):
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: thread_pool.call("calculate", 10.0, **POINT), range(8)))
+    assert all(r["T"] == pytest.approx(300.0) for r in results)
+    sessions = [c.session for c in thread_pool._slots]
+    assert sessions[0] is not sessions[1]
+    rps = [setup.rp for s in sessions for setup in s.setups.values()]
+    assert len({id(rp) for rp in rps}) == len(rps)
+    assert thread_pool.stats()["mode"] == "thread"
+
+
+def test_thread_calculator_abandoned_on_timeout(thread_pool, monkeypatch):
+    monkeypatch.setitem(TASKS, "slow", f"{__name__}:_slow")
+    old = thread_pool._slots[0]
+    with pytest.raises(CalculationTimeout):
+        thread_pool.call("slow", 0.05, seconds=0.5)
+    assert thread_pool._slots[0] is not old
+    assert thread_pool.counters["timeouts"] == 1 and thread_pool.counters["abandoned"] == 1
+    assert thread_pool.call("calculate", 10.0, **POINT)["T"] == pytest.approx(300.0)
+    old.thread.join(5.0)
+    assert not old.thread.is_alive()  # 弃用线程算完后自行退出
+    assert thread_pool.stats()["abandoned_alive"] == 0
@@ -0,0 +1,111 @@
+"""
+流量抓取与回放测试：请求体脱敏、中间件记录（不含 API Key）、文件轮转与清理、回放的倍速与错误变化统计
+"""
+import asyncio
+import json
+import os
+import time
+
+from capture import CaptureMiddleware, CaptureWriter, sanitize
+from replay import cache_hit_rates, load_capture, replay
+
+
+def _call(middleware, path: str, body: bytes, headers=(), status: int = 200) -> None:
+    """以最小的 ASGI 调用驱动中间件；内层应用读完请求体后返回 status"""
+
+    async def app(scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    messages = [
+        {"type": "http.request", "body": body[:10], "more_body": True},
+        {"type": "http.request", "body": body[10:], "more_body": False},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers),
+             "client": ("203.0.113.9", 5000)}
+    asyncio.run(CaptureMiddleware(app, writer=middleware, sample=1.0)(scope, receive, send))
+
+
+def _read(writer: CaptureWriter) -> list:
+    writer.flush()
+    with open(writer.path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_sanitize_keeps_only_known_fields():
+    raw = json.dumps({"fluid_string": "R32" * 100, "input_type": "PT", "value1": 1.0, "value2": 2.0,
+                      "api_key": "secret", "nested": {"a": 1}}).encode()
+    body = sanitize("/calculate", raw)
+    assert set(body) == {"fluid_string", "input_type", "value1", "value2"}
+    assert len(body["fluid_string"]) == 200
+    assert sanitize("/dome", b"not json") is None
+    assert sanitize("/fluid-info", b"[1, 2]") is None
+
+
+def test_middleware_records_sanitized_request_without_api_key(tmp_path, monkeypatch):
+    monkeypatch.setattr("dependencies.SECRET_API_KEY", "secret-key")
+    writer = CaptureWriter(str(tmp_path))
+    body = json.dumps({"fluid_string": "R32", "input_type": "PT", "value1": 1000.0, "value2": 300.0}).encode()
+    _call(writer, "/calculate", body, headers=[(b"x-api-key", b"secret-key")], status=400)
+    _call(writer, "/calculate/batch", body)  # 不在抓取范围
+    _call(writer, "/dome", b"{}", headers=[(b"x-api-key", b"made-up")])  # 未验证的 Key 按来源 IP 区分
+    entries = _read(writer)
+    assert len(entries) == 2
+    entry = entries[0]
+    assert entry["p"] == "/calculate" and entry["s"] == 400 and entry["ms"] >= 0
+    assert entry["b"] == {"fluid_string": "R32", "input_type": "PT", "value1": 1000.0, "value2": 300.0}
+    assert entry["c"].startswith("key:") and "secret" not in json.dumps(entry)
+    assert entries[1]["c"].startswith("ip:")
+
+
+def test_writer_rotates_and_prunes_old_files(tmp_path):
+    writer = CaptureWriter(str(tmp_path), file_mb=0.0005, max_files=2)  # 约 500 字节轮转一次
+    for i in range(6):
+        writer.record({"t": i, "p": "/dome", "s": 200, "b": {"fluid_string": "R32" * 200}})  # 每条都超过上限
+        writer.flush()
+    assert writer.stats()["rotations"] == 6
+    rotated = [n for n in os.listdir(tmp_path) if n.count("-") == 2]
+    assert len(rotated) == 2
+
+
+def test_load_capture_merges_files_in_arrival_order(tmp_path):
+    lines = {
+        "capture-1.jsonl": [{"t": 3.0, "p": "/dome", "s": 200, "b": {}}, {"t": 1.0, "p": "/dome", "s": 200, "b": {}}],
+        "capture-2-5.jsonl": [{"t": 2.0, "p": "/dome", "s": 200, "b": {}}],
+    }
+    for name, entries in lines.items():
+        with open(tmp_path / name, "w") as f:
+            f.write("".join(json.dumps(e) + "\n" for e in entries) + '{"t": 4')  # 末尾半行
+    assert [e["t"] for e in load_capture([str(tmp_path)])] == [1.0, 2.0, 3.0]
+
+
+def test_replay_scales_arrival_times_and_counts_error_changes():
+    entries = [
+        {"t": 100.0, "p": "/calculate", "s": 200, "ms": 5.0, "b": {"fluid_string": "R32"}},
+        {"t": 100.2, "p": "/calculate", "s": 500, "ms": 5.0, "b": {"fluid_string": "BAD"}},
+        {"t": 100.4, "p": "/calculate", "s": 200, "ms": 5.0, "b": {"fluid_string": "R125"}},
+        {"t": 100.4, "p": "/dome", "s": 200, "ms": 5.0, "b": None},
+    ]
+    statuses = {"R32": 200, "BAD": 400, "R125": 500}
+    start = time.perf_counter()
+    report = replay(entries, lambda e: statuses[e["b"]["fluid_string"]], speed=2.0)
+    assert 0.18 <= time.perf_counter() - start < 1.0  # 0.4 s 的抓取两倍速回放约 0.2 s
+    assert report["requests"] == 3 and report["skipped"] == 1
+    calc = report["paths"]["/calculate"]
+    assert calc["new_errors"] == 1 and calc["fixed"] == 0  # 500 -> 400 仍为失败
+    assert calc["status"] == {"200": 1, "400": 1, "500": 1}
+
+
+def test_cache_hit_rates_use_per_worker_deltas():
+    before = {1: {"dome": {"hits": 10, "misses": 5}}}
+    after = {1: {"dome": {"hits": 16, "misses": 7}}, 2: {"dome": {"hits": 100, "misses": 0}}}  # 2 无基线
+    assert cache_hit_rates(before, after) == {"dome": {"hits": 6, "misses": 2, "hit_rate": 0.75}}
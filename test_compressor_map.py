@@ -0,0 +1,55 @@
+"""
+压缩机性能图测试：AHRI 540 拟合还原已知多项式、网格不足时不拟合；
+网格点的能量平衡、效率模型与失败点隔离
+"""
+import pytest
+
+from compressor_map import KELVIN_OFFSET, ahri540_terms, compute_compressor_points, fit_ahri540
+
+COEFFICIENTS = [1.0, 2.0, -3.0, 0.5, 0.1, -0.02, 0.001, 0.002, -0.0003, 0.0004]
+
+
+def _synthetic(s_values, d_values):
+    points = []
+    for s in s_values:
+        for d in d_values:
+            x = sum(c * t for c, t in zip(COEFFICIENTS, ahri540_terms(s, d)))
+            points.append({"T_evap": s + KELVIN_OFFSET, "T_cond": d + KELVIN_OFFSET,
+                           "mass_flow": x, "capacity": x, "power": x})
+    return points
+
+
+def test_fit_recovers_polynomial():
+    points = _synthetic([-30, -20, -10, 0, 10], [30, 40, 50, 60])
+    points.insert(3, None)  # 失败点不参与拟合，残差为 None
+    fit = fit_ahri540(points)["power"]
+    assert fit["coefficients"] == pytest.approx(COEFFICIENTS, rel=1e-6, abs=1e-9)
+    assert fit["rms"] < 1e-8
+    assert fit["residuals"][3] is None and len(fit["residuals"]) == len(points)
+
+
+def test_fit_needs_four_temperatures_each_way():
+    fit = fit_ahri540(_synthetic([-20, -10, 0], [30, 40, 50, 60]))["mass_flow"]
+    assert fit["coefficients"] is None and "error" in fit
+
+
+def test_compressor_points(refprop):
+    items = compute_compressor_points("R32", [(260, 310), (260, 320), (300, 290)], displacement=20)
+    first, second = items[0]["result"], items[1]["result"]
+    assert first["P_cond"] > first["P_evap"]
+    assert first["T_suction"] == pytest.approx(260 + 11.1)
+    assert first["T_discharge"] > first["T_cond"]
+    assert first["COP"] == pytest.approx(first["capacity"] / first["power"])
+    assert second["power"] > first["power"]  # 压比升高，功率增大
+    assert "error" in items[2]  # 冷凝温度低于蒸发温度的点单独失败
+
+
+def test_efficiency_model(refprop):
+    base = compute_compressor_points("R32", [(260, 310)], displacement=20)[0]["result"]
+    worse = compute_compressor_points("R32", [(260, 310)], displacement=20, isentropic=[0.5], volumetric=[1.0, -0.02])
+    worse = worse[0]["result"]
+    assert worse["eta_volumetric"] == pytest.approx(1.0 - 0.02 * worse["pressure_ratio"])
+    assert worse["T_discharge"] > base["T_discharge"]
+    assert worse["power"] / worse["mass_flow"] == pytest.approx(base["power"] / base["mass_flow"] * 0.7 / 0.5)
+    bad = compute_compressor_points("R32", [(260, 310)], displacement=20, isentropic=[1.5])
+    assert "error" in bad[0]
@@ -0,0 +1,135 @@
+"""
+偏导数与雅可比测试：DEFAULT 单位换算（与有限差分比较）、重复名称只计算一次、hOut 超长返回 400、
+带偏导数的调用失败时偏导数为 null、雅可比形状、/calculate/batch 携带偏导数、未请求时不输出
+"""
+import json
+
+import anyio
+import pytest
+
+import admission
+import refprop_engine
+from admission import AdmissionController
+from main import app
+from refprop_engine import BASE_OUTPUTS, calculate_properties, flash, parse_fluid_string
+from refprop_session import get_rp
+
+T, P = 300.0, 1000.0  # R32 过热气相 [K], [kPa]
+
+
+def _prop(input_type, v1, v2, name):
+    return calculate_properties("R32", input_type, v1, v2)[name]
+
+
+def _central(f, x, rel=1e-4):
+    dx = abs(x) * rel
+    return (f(x + dx) - f(x - dx)) / (2 * dx)
+
+
+@pytest.fixture
+def api(refprop, tmp_db, monkeypatch):
+    """在进程内调用 ASGI 应用（不启动计算进程池），返回 (状态码, JSON)"""
+    monkeypatch.setattr(admission, "_controller", AdmissionController(tmp_db))
+
+    def post(path: str, body: dict):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+            "client": ("127.0.0.1", 5000), "server": ("testserver", 80),
+        }
+        anyio.run(app, scope, receive, send)
+        status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+        return status, json.loads(b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body"))
+
+    return post
+
+
+def test_derivatives_in_default_units(refprop):
+    result = calculate_properties("R32", "PT", P, T, derivatives=["DPDT", "DPDD", "DHDP_T", "JT"])
+    d = result["D"]
+    derivatives = result["derivatives"]
+    assert derivatives["DPDT"] == pytest.approx(_central(lambda t: _prop("TD", t, d, "P"), T), rel=1e-3)
+    assert derivatives["DPDD"] == pytest.approx(_central(lambda x: _prop("TD", T, x, "P"), d), rel=1e-3)
+    assert derivatives["DHDP_T"] == pytest.approx(_central(lambda p: _prop("PT", p, T, "H"), P), rel=1e-3)
+    h = result["H"]
+    assert derivatives["JT"] == pytest.approx(_central(lambda p: _prop("PH", p, h, "T"), P), rel=1e-3)
+
+
+def test_repeated_derivative_names_computed_once(refprop):
+    extra = refprop_engine._derivative_outputs("PT", ["jt", "JT", " DPDT", "JT"], False)
+    assert [path for path, _, _ in extra] == [("derivatives", "JT"), ("derivatives", "DPDT")]
+    result = calculate_properties("R32", "PT", P, T, derivatives=["JT", "jt"])
+    assert list(result["derivatives"]) == ["JT"]
+
+
+def test_jacobian_shape(refprop):
+    result = calculate_properties("R32", "PT", P, T, jacobian=True)
+    assert {x: set(row) for x, row in result["jacobian"].items()} == {x: {"P", "T"} for x in ("D", "H", "S")}
+    assert result["jacobian"]["H"]["P"] == pytest.approx(
+        calculate_properties("R32", "PT", P, T, derivatives=["DHDP_T"])["derivatives"]["DHDP_T"], rel=1e-6
+    )
+    with pytest.raises(ValueError):
+        calculate_properties("R32", "PQ", P, 0.5, jacobian=True)  # Q 不在雅可比支持的性质中
+
+
+class _RejectsExtraOutputs:
+    """带偏导数的 hOut 一律返回 ierr>100 的 REFPROP 实例包装"""
+
+    def __init__(self, rp):
+        self._rp = rp
+
+    def __getattr__(self, name):
+        return getattr(self._rp, name)
+
+    def REFPROPdll(self, hFld, hIn, hOut, *args):
+        if hOut != BASE_OUTPUTS:
+            return self._rp.REFPROPdll(hFld, hIn, "NO_SUCH_OUTPUT", *args)
+        return self._rp.REFPROPdll(hFld, hIn, hOut, *args)
+
+
+def test_failed_derivative_call_retries_base_outputs(refprop):
+    refprop_fluid, z = parse_fluid_string("R32")
+    extra = refprop_engine._derivative_outputs("PT", ["DPDT"], True)
+    rp = _RejectsExtraOutputs(get_rp("R32"))
+    result = flash(rp, refprop_fluid, z, "PT", P * 1000.0, T, extra)
+    assert result["T"] == pytest.approx(T)
+    assert result["derivatives"] == {"DPDT": None}
+    assert all(v is None for row in result["jacobian"].values() for v in row.values())
+
+
+def test_calculate_omits_unrequested_fields(api):
+    point = {"fluid_string": "R32", "input_type": "PT", "value1": P, "value2": T}
+    status, body = api("/calculate", point)
+    assert status == 200 and "derivatives" not in body and "jacobian" not in body
+    status, body = api("/calculate", {**point, "derivatives": ["JT"]})
+    assert status == 200 and list(body["derivatives"]) == ["JT"] and "jacobian" not in body
+
+
+def test_calculate_batch_with_derivatives(api):
+    request = {"fluid_string": "R32", "input_type": "PT", "points": [[P, T], [P, 1.0]], "derivatives": ["DPDT"]}
+    status, body = api("/calculate/batch", {**request, "jacobian": True})
+    assert status == 200
+    first, failed = body["results"]
+    assert failed is None and list(body["errors"]) == ["1"]
+    assert first["derivatives"]["DPDT"] == pytest.approx(
+        calculate_properties("R32", "PT", P, T, derivatives=["DPDT"])["derivatives"]["DPDT"]
+    )
+    assert set(first["jacobian"]) == {"D", "H", "S"}
+    status, body = api("/calculate/batch", {**request, "derivatives": None})
+    assert status == 200 and "derivatives" not in body["results"][0] and "jacobian" not in body["results"][0]
+
+
+def test_output_string_too_long_is_400(api, monkeypatch):
+    monkeypatch.setattr(refprop_engine, "HOUT_MAX", len(BASE_OUTPUTS) + 10)
+    point = {"fluid_string": "R32", "input_type": "PT", "value1": P, "value2": T}
+    status, body = api("/calculate", {**point, "derivatives": ["DPDT", "DHDP_T", "JT"]})
+    assert status == 400 and "REFPROP" in body["detail"]
@@ -0,0 +1,87 @@
+"""
+P-h 图测试：等值线落在窗口内、按曲率自适应加密、等温线在露点/泡点处分段、窗口参数校验；
+混合物相包络线穿过临界点并给出临界凝析点；包络线计算失败时退回 tq 并注明、且不缓存
+"""
+import pytest
+
+import admission
+import dome_engine
+import main
+from admission import AdmissionController
+from dome_engine import compute_ph_chart, compute_saturation_dome
+
+
+def test_chart_lines_inside_window(refprop):
+    chart = compute_ph_chart("R32", isotherms=[300.0], isentropes=[60.0], isochores=[1.0], qualities=[0.5])
+    (p_min, p_max), (h_min, h_max) = chart["window"]["P"], chart["window"]["H"]
+    assert chart["dome"]["liquid"] and chart["dome"]["vapor"]
+    for family in ("isotherms", "isentropes", "isochores", "qualities"):
+        (line,) = chart[family]
+        assert len(line["points"]) > dome_engine.CHART_INITIAL_SEGMENTS
+        assert all(p_min * 0.999 <= p["P"] <= p_max * 1.001 for p in line["points"])
+    assert sum(h_min <= p["H"] <= h_max for p in chart["isotherms"][0]["points"]) > 0
+
+
+def test_isotherm_crosses_dome_at_saturation(refprop):
+    chart = compute_ph_chart("R32", isotherms=[300.0])
+    points = chart["isotherms"][0]["points"]
+    pressures = [p["P"] for p in points]
+    assert pressures == sorted(pressures)  # 气相段 → 两相段 → 液相段，压力单调不减
+    assert len({(p["P"], p["H"]) for p in points}) == len(points)  # 分段端点不重复
+
+
+def test_tighter_tolerance_adds_points(refprop, monkeypatch):
+    coarse = compute_ph_chart("R32", isentropes=[60.0])["isentropes"][0]["points"]
+    monkeypatch.setattr(dome_engine, "CHART_TOLERANCE", dome_engine.CHART_TOLERANCE / 20)
+    fine = compute_ph_chart("R32", isentropes=[60.0])["isentropes"][0]["points"]
+    assert len(fine) > len(coarse)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"p_min": 500.0, "p_max": 100.0}, {"h_min": 3e4, "h_max": 1e4}, {"qualities": [1.5]}, {"isochores": [0.0]}],
+)
+def test_invalid_chart_request(refprop, kwargs):
+    with pytest.raises(ValueError):
+        compute_ph_chart("R32", **kwargs)
+
+
+def test_envelope_runs_through_critical_point(refprop):
+    dome = compute_saturation_dome("R454B", mode="envelope")
+    critical = {"P": dome["critical"]["P"], "H": dome["critical"]["H"]}
+    assert dome["liquid"][-1] == critical and dome["vapor"][-1] == critical
+    assert dome["cricondenbar"]["P"] >= max(p["P"] for p in dome["liquid"] + dome["vapor"]) * 0.999
+    assert dome["cricondentherm"]["T"] >= dome["critical"]["T"] * 0.999
+
+
+def test_envelope_mode_for_pure_fluid_uses_tq(refprop):
+    assert compute_saturation_dome("R32", mode="envelope") == compute_saturation_dome("R32")
+    with pytest.raises(ValueError):
+        compute_saturation_dome("R32", mode="spline")
+
+
+def _broken_envelope(*args):
+    raise RuntimeError("相界样条不可用")
+
+
+def test_envelope_failure_falls_back_to_tq_and_says_so(refprop, monkeypatch):
+    monkeypatch.setattr(dome_engine, "_phase_envelope", _broken_envelope)
+    dome = compute_saturation_dome("R454B", mode="envelope")
+    assert "相界样条不可用" in dome.pop("fallback")
+    assert dome == compute_saturation_dome("R454B")
+
+
+def test_envelope_fallback_is_not_cached(refprop, tmp_db, monkeypatch):
+    monkeypatch.setattr(admission, "_controller", AdmissionController(tmp_db))
+    store, runs = {}, []
+    monkeypatch.setattr(main, "cache_get", lambda ns, key: store.get((ns, key)))
+    monkeypatch.setattr(main, "cache_put", lambda ns, key, value: store.__setitem__((ns, key), value))
+    monkeypatch.setattr(main, "run_task", lambda task, **kwargs: runs.append(kwargs) or compute_saturation_dome(**kwargs))
+    request = main.DomeRequest(fluid_string="R454B", mode="envelope")
+    with monkeypatch.context() as m:
+        m.setattr(dome_engine, "_phase_envelope", _broken_envelope)
+        assert main.dome(request, "key:test").fallback
+    result = main.dome(request, "key:test")  # 退回 tq 的结果没有缓存：重新计算出包络线
+    assert result.fallback is None and result.cricondenbar is not None
+    main.dome(request, "key:test")  # 包络线已缓存
+    assert len(runs) == 2
@@ -0,0 +1,76 @@
+"""
+多工质饱和包络线对比测试：JSON 与 NDJSON 流式返回、单个工质失败不影响其他工质、
+同一工质的不同写法只计算一次、客户端断开时释放准入槽位
+"""
+import json
+
+import anyio
+import pytest
+
+import admission
+import calc_pool
+import main
+from admission import AdmissionController
+from main import DomeCompareRequest, dome_compare
+
+CLIENT = "key:test"
+
+
+@pytest.fixture
+def computed(refprop, tmp_db, monkeypatch):
+    """独立的准入控制与结果缓存；返回实际计算过的工质字符串列表"""
+    monkeypatch.setattr(admission, "_controller", AdmissionController(tmp_db))
+    store = {}
+    monkeypatch.setattr(main, "cache_get", lambda ns, key: store.get((ns, key)))
+    monkeypatch.setattr(main, "cache_put", lambda ns, key, value: store.__setitem__((ns, key), value))
+    fluids = []
+    resolve = calc_pool._resolve
+
+    def counting(task):
+        target = resolve(task)
+        if task != "dome":
+            return target
+        return lambda fluid_string, **kwargs: fluids.append(fluid_string) or target(fluid_string, **kwargs)
+
+    monkeypatch.setattr(calc_pool, "_resolve", counting)
+    return fluids
+
+
+def _lines(response) -> list:
+    async def collect():
+        return [chunk async for chunk in response.body_iterator]
+
+    body = "".join(c if isinstance(c, str) else c.decode() for c in anyio.run(collect))
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_compare_json_with_errors_and_equivalent_fluids(computed):
+    fluids = ["R32", "r32", "R454B", "NOT_A_FLUID", "R32&R125|0.5"]
+    result = dome_compare(DomeCompareRequest(fluids=fluids), CLIENT)
+    assert result.domes.keys() == {"R32", "r32", "R454B"}
+    assert result.domes["R32"] == result.domes["r32"]
+    assert result.errors.keys() == {"NOT_A_FLUID", "R32&R125|0.5"}  # 计算失败与解析失败各自列出
+    assert sorted(computed) == ["NOT_A_FLUID", "R32", "R454B"]
+
+    again = dome_compare(DomeCompareRequest(fluids=["R32", "R454B"]), CLIENT)  # 全部命中缓存
+    assert again.domes.keys() == {"R32", "R454B"} and len(computed) == 3
+    assert admission.get_controller().snapshot()["running"] == 0
+
+
+def test_compare_stream_ndjson(computed):
+    response = dome_compare(DomeCompareRequest(fluids=["R32", "BAD&R32|1", "R454B"], stream=True), CLIENT)
+    assert response.media_type == "application/x-ndjson"
+    lines = _lines(response)
+    assert lines[0].keys() == {"fluid", "error"} and lines[0]["fluid"] == "BAD&R32|1"  # 解析失败的工质最先输出
+    assert {line["fluid"] for line in lines[1:]} == {"R32", "R454B"}
+    assert all(line["dome"]["liquid"] and line["dome"]["vapor"] for line in lines[1:])
+    anyio.run(response.background)
+    assert admission.get_controller().snapshot()["running"] == 0
+
+
+def test_compare_stream_releases_admission_on_disconnect(computed):
+    response = dome_compare(DomeCompareRequest(fluids=["R32", "R454B"], stream=True), CLIENT)
+    assert admission.get_controller().snapshot()["running"] == 1  # 准入在响应开始前获得
+    anyio.run(response.background)  # 客户端断开：响应未发送完即执行后台任务
+    assert admission.get_controller().snapshot()["running"] == 0
+    assert computed == []
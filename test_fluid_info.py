@@ -0,0 +1,60 @@
+"""
+工质参考属性测试：k 值在 101.325 kPa、298.15 K 下计算；/fluid-info/batch 的列式表格、
+单个工质的错误、同一工质的不同写法只查询一次
+"""
+import pytest
+
+import admission
+import calc_pool
+import main
+from admission import AdmissionController
+from fluid_info import get_fluid_info
+from main import FLUID_INFO_COLUMNS, FluidInfoBatchRequest, fluid_info_batch
+from refprop_engine import calculate_properties
+
+
+@pytest.fixture
+def queried(refprop, tmp_db, monkeypatch):
+    """独立的准入控制与结果缓存；返回各次批量查询的工质字符串列表"""
+    monkeypatch.setattr(admission, "_controller", AdmissionController(tmp_db))
+    store = {}
+    monkeypatch.setattr(main, "cache_get", lambda ns, key: store.get((ns, key)))
+    monkeypatch.setattr(main, "cache_put", lambda ns, key, value: store.__setitem__((ns, key), value))
+    calls = []
+    resolve = calc_pool._resolve
+
+    def counting(task):
+        target = resolve(task)
+        if task != "fluid_info_batch":
+            return target
+        return lambda fluid_strings, **kwargs: calls.append(list(fluid_strings)) or target(fluid_strings, **kwargs)
+
+    monkeypatch.setattr(calc_pool, "_resolve", counting)
+    return calls
+
+
+def test_k_value_at_reference_state(refprop):
+    state = calculate_properties("R32", "PT", 101.325, 298.15)
+    assert get_fluid_info("R32")["k_value"] == pytest.approx(state["CP"] / state["CV"], rel=1e-5)
+
+
+def test_batch_columns_errors_and_equivalent_fluids(queried):
+    fluids = ["R32", "R454B", "r32", "NOT_A_FLUID", "R32&R125|0.5", "R32"]
+    result = fluid_info_batch(FluidInfoBatchRequest(fluids=fluids), "key:test")
+    assert result.fluids == ["R32", "R454B", "r32", "NOT_A_FLUID", "R32&R125|0.5"]  # 去重，顺序同请求
+    assert list(result.columns) == FLUID_INFO_COLUMNS
+    assert all(len(column) == len(result.fluids) for column in result.columns.values())
+    assert result.errors.keys() == {"NOT_A_FLUID", "R32&R125|0.5"}
+    assert [sorted(call) for call in queried] == [["NOT_A_FLUID", "R32", "R454B"]]  # r32 与 R32 只查询一次
+
+    single = get_fluid_info("R32")
+    column = {name: values[0] for name, values in result.columns.items()}
+    assert column["critical_temperature"] == single["critical_temperature"]
+    assert column["triple_point_T"] == single["triple_point"]["T"]
+    assert column["triple_point_P"] == single["triple_point"]["P"]
+    assert result.columns["critical_temperature"][2] == column["critical_temperature"]
+    assert result.columns["critical_temperature"][3] is None  # 失败的工质整行为 null
+    assert admission.get_controller().snapshot()["running"] == 0
+
+    again = fluid_info_batch(FluidInfoBatchRequest(fluids=["R454B", "R32"]), "key:test")  # 全部命中缓存
+    assert not again.errors and len(queried) == 1
@@ -0,0 +1,83 @@
+"""
+换热器沿程物性测试：等分点与插入的泡点、露点按换热量排列，压降按比例分布，
+混合物两相段温度滑移，二次流体夹点，单点闪蒸失败不影响其余各点
+"""
+import pytest
+
+import hx_profile
+from hx_profile import compute_hx_profile
+from main import HXProfileResponse
+from refprop_engine import calculate_properties
+
+
+def _saturation_h(fluid, p):
+    return calculate_properties(fluid, "PQ", p, 0)["H"], calculate_properties(fluid, "PQ", p, 1)["H"]
+
+
+def test_condenser_inserts_dew_and_bubble(refprop):
+    h_bubble, h_dew = _saturation_h("R32", 2000)
+    result = compute_hx_profile("R32", 2000, h_dew + 3000, h_bubble - 2000, segments=10, pressure_drop=50)
+    points = result["points"]
+    assert result["mode"] == "cooling"
+    assert [p["kind"] for p in points if p["kind"] != "segment"] == ["dew", "bubble"]
+    assert sum(p["kind"] == "segment" for p in points) == 11
+    fractions = [p["fraction"] for p in points]
+    assert fractions == sorted(fractions)
+    assert points[0]["P"] == pytest.approx(2000)
+    assert points[-1]["P"] == pytest.approx(1950)
+    dew = next(p for p in points if p["kind"] == "dew")
+    assert dew["Q"] == pytest.approx(1.0)
+    assert dew["P"] == pytest.approx(2000 - 50 * dew["fraction"])
+    assert result["glide"] > 0  # 纯工质的沿程温差仅来自压降
+
+
+def test_evaporator_mixture_glide_and_pinch(refprop):
+    h_bubble, h_dew = _saturation_h("R454B", 800)
+    result = compute_hx_profile(
+        "R454B", 800, h_bubble + 1000, h_dew + 1500, segments=20,
+        secondary={"T_in": 300.0, "T_out": 295.0, "flow": "counter"},
+    )
+    assert result["mode"] == "heating"
+    assert [p["kind"] for p in result["points"] if p["kind"] != "segment"] == ["dew"]
+    two_phase = [p["T"] for p in result["points"] if 0 <= p["Q"] <= 1]
+    assert two_phase == sorted(two_phase) and two_phase[-1] > two_phase[0]  # 非共沸混合物的温度滑移
+    pinch = result["pinch"]
+    assert pinch["delta_T"] == min(p["T_secondary"] - p["T"] for p in result["points"])
+    assert result["points"][-1]["T_secondary"] == pytest.approx(300.0)  # 逆流：二次流体从制冷剂出口侧进入
+
+
+def test_failed_segment_is_null_and_pinch_uses_the_rest(refprop, monkeypatch):
+    h_bubble, h_dew = _saturation_h("R32", 2000)
+    h_in, h_out = h_dew + 3000, h_bubble - 2000
+    h_failed = h_in + (h_out - h_in) * 0.5
+    flash = hx_profile.flash
+
+    def failing(RP, refprop_fluid, z, h_in_type, p, b, *args):
+        if h_in_type == "PH" and b == h_failed:
+            raise RuntimeError("REFPROP 计算错误 (ierr=248): 闪蒸未收敛")
+        return flash(RP, refprop_fluid, z, h_in_type, p, b, *args)
+
+    monkeypatch.setattr(hx_profile, "flash", failing)
+    secondary = {"T_in": 290.0, "T_out": 300.0, "flow": "counter"}
+    result = compute_hx_profile("R32", 2000, h_in, h_out, segments=10, secondary=secondary)
+    (index, error), = result["errors"].items()
+    failed = result["points"][index]
+    assert "ierr=248" in error and failed["fraction"] == 0.5 and failed["kind"] == "segment"
+    assert all(failed[name] is None for name in hx_profile.STATE_PROPERTIES)
+    assert [p["kind"] for p in result["points"] if p["kind"] != "segment"] == ["dew", "bubble"]
+    valid = [p for p in result["points"] if p["T"] is not None]
+    assert len(valid) == len(result["points"]) - 1
+    assert result["pinch"]["delta_T"] == min(p["T"] - p["T_secondary"] for p in valid)
+    assert HXProfileResponse(**result).points[index].T is None
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"segments": 0},
+    {"h_out": 20000.0},
+    {"pressure_drop": 2500.0},
+    {"secondary": {"T_in": 300.0, "T_out": 290.0, "flow": "cross"}},
+])
+def test_invalid_arguments(refprop, kwargs):
+    args = {"fluid_string": "R32", "pressure": 2000.0, "h_in": 20000.0, "h_out": 10000.0, **kwargs}
+    with pytest.raises(ValueError):
+        compute_hx_profile(**args)
@@ -0,0 +1,111 @@
+"""
+输入范围预校验测试：超出状态方程范围、干度越界、纯工质超临界饱和输入被拒绝；
+REFPROP 可外推的范围内照常放行；范围查询计入请求方的准入，失败时不重复查询
+"""
+from contextlib import contextmanager
+
+import pytest
+
+import input_limits
+from input_limits import InputOutOfRange, check_inputs, get_limits, get_limits_many
+
+LIMITS = {
+    "mixture": False,
+    "T_min": 150.0,
+    "T_max": 450.0,
+    "P_max": 70000.0,
+    "D_max": 27.5,
+    "triple_point": {"T": 150.0, "P": 0.05},
+    "critical": {"T": 351.0, "P": 5780.0},
+}
+
+
+@pytest.mark.parametrize("h_in, value1, value2, field, prop", [
+    ("PT", 1000.0, 100.0, "value2", "T"),
+    ("PT", -5.0, 300.0, "value1", "P"),
+    ("PT", 200000.0, 300.0, "value1", "P"),
+    ("DT", 40.0, 300.0, "value1", "D"),
+    ("TQ", 300.0, 1.5, "value2", "Q"),
+    ("TQ", 400.0, 0.5, "value1", "T"),
+    ("PQ", 6000.0, 0.0, "value1", "P"),
+])
+def test_rejects_out_of_range(h_in, value1, value2, field, prop):
+    with pytest.raises(InputOutOfRange) as info:
+        check_inputs(LIMITS, h_in, value1, value2)
+    detail = info.value.detail()
+    assert detail["error"] == "input_out_of_range"
+    assert (detail["field"], detail["property"]) == (field, prop)
+    assert isinstance(info.value, ValueError)
+
+
+@pytest.mark.parametrize("h_in, value1, value2", [
+    ("PT", 1000.0, 300.0),
+    ("PT", 100000.0, 600.0),  # 在 REFPROP 允许的外推范围内
+    ("TQ", 300.0, 0.0),
+    ("PH", 1000.0, 40000.0),
+])
+def test_accepts_valid_inputs(h_in, value1, value2):
+    check_inputs(LIMITS, h_in, value1, value2)
+
+
+def test_mixture_and_unknown_limits_skip_critical_check():
+    check_inputs({**LIMITS, "mixture": True}, "TQ", 400.0, 0.5)
+    check_inputs(None, "TQ", 400.0, 0.5)
+    with pytest.raises(InputOutOfRange):
+        check_inputs(None, "TQ", 400.0, 2.0)
+
+
+def test_failed_lookup_is_remembered_and_charged_to_the_client(monkeypatch):
+    calls = []
+
+    def fake_run_task(task, timeout=None, **kwargs):
+        calls.append(task)
+        raise RuntimeError("REFPROP 错误")
+
+    @contextmanager
+    def fake_admit(client, kind, n_items=1, slots=1):
+        calls.append((client, kind))
+        yield
+
+    monkeypatch.setattr(input_limits, "run_task", fake_run_task)
+    monkeypatch.setattr(input_limits, "admit", fake_admit)
+    monkeypatch.setattr(input_limits, "_failed", {})
+    assert get_limits("NOSUCHFLUID", "NOSUCHFLUID", "ip:test") is None
+    assert get_limits("NOSUCHFLUID", "NOSUCHFLUID", "ip:test") is None
+    assert calls == [("ip:test", "fluid_limits"), "fluid_limits"]
+
+
+def test_fluid_limits_from_refprop(refprop):
+    from fluid_info import get_fluid_limits
+
+    limits = get_fluid_limits("R32")
+    assert limits["mixture"] is False
+    assert limits["T_min"] < limits["critical"]["T"] < limits["T_max"]
+    assert limits["P_max"] > limits["critical"]["P"]
+
+
+def test_limits_lookup_batches_misses_under_one_admission(monkeypatch):
+    admitted = []
+
+    def fake_run_tasks(task, kwargs_list, timeout=None):
+        for i, kwargs in enumerate(kwargs_list):
+            if kwargs["fluid_string"] == "BAD":
+                yield i, None, "REFPROP 错误"
+            else:
+                yield i, dict(LIMITS, fluid=kwargs["fluid_string"]), None
+
+    @contextmanager
+    def fake_admit(client, kind, n_items=1, slots=1):
+        admitted.append((client, kind, n_items))
+        yield
+
+    monkeypatch.setattr(input_limits, "run_tasks", fake_run_tasks)
+    monkeypatch.setattr(input_limits, "admit", fake_admit)
+    monkeypatch.setattr(input_limits, "_failed", {})
+    fluids = {"R32&R125|0.3&0.7": "R32&R125|0.3&0.7", "R32&R125|0.4&0.6": "R32&R125|0.4&0.6", "BAD": "BAD"}
+    found = get_limits_many(fluids, "ip:test")
+    assert found["R32&R125|0.3&0.7"]["fluid"] == "R32&R125|0.3&0.7" and found["BAD"] is None
+    assert admitted == [("ip:test", "fluid_limits", 3)]
+    # 第二次全部命中（成功的在结果缓存中，失败的在 FAILED_RETRY 内不再查询），不再准入
+    assert get_limits_many(fluids, "ip:test") == found
+    assert len(admitted) == 1
@@ -0,0 +1,120 @@
+"""
+微批处理测试：计算进程全忙时并发单点请求合并为一次批量调用、各自收到自己的结果；
+有空闲计算进程时立即计算；整批超时后逐点重算；批内错误只影响对应的调用方；各请求按自己的客户端准入
+"""
+import threading
+from contextlib import contextmanager
+
+import pytest
+from fastapi import HTTPException
+
+import micro_batch
+from calc_pool import CalculationTimeout
+from micro_batch import MicroBatcher
+
+FLUID = {"fluid_string": "R32", "input_type": "PT"}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """替换 run_task：记录调用，按 value2 返回 T；value2 < 0 的点计算失败，value2 == 999 的点卡住"""
+    log = []
+
+    def fake_run_task(task, timeout=None, **kwargs):
+        if task == "calculate_batch":
+            log.append(("batch", len(kwargs["points"])))
+            if any(p[1] == 999 for p in kwargs["points"]):
+                raise CalculationTimeout("timeout")
+            return [{"result": {"T": p[1]}} if p[1] >= 0 else {"error": "REFPROP 计算错误"} for p in kwargs["points"]]
+        log.append(("single", kwargs["value2"]))
+        if kwargs["value2"] == 999:
+            raise CalculationTimeout("timeout")
+        return {"T": kwargs["value2"]}
+
+    monkeypatch.setattr(micro_batch, "run_task", fake_run_task)
+    monkeypatch.setattr(micro_batch, "pool_idle", lambda: 0)
+    return log
+
+
+def _concurrent(batcher, values, clients=None):
+    """同时提交 len(values) 个请求（clients 为各请求的客户端标识），返回各自的结果或异常"""
+    results = [None] * len(values)
+    barrier = threading.Barrier(len(values))
+
+    def job(i, v):
+        barrier.wait()
+        try:
+            client = clients[i] if clients else "ip:test"
+            results[i] = batcher.calculate(client, "R32|PT", value1=1000.0, value2=v, **FLUID)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=job, args=(i, v)) for i, v in enumerate(values)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5.0)
+    return results
+
+
+def test_concurrent_requests_share_one_batch(calls):
+    batcher = MicroBatcher(window_ms=200, max_size=8)
+    values = [300.0 + i for i in range(8)]
+    results = _concurrent(batcher, values)
+    assert [r["T"] for r in results] == values
+    assert calls == [("batch", 8)]  # 凑满 max_size 立即计算，不等满窗口
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["largest"] == 8 and stats["size_histogram"]["<=8"] == 1
+
+
+def test_idle_calculator_runs_immediately(calls, monkeypatch):
+    monkeypatch.setattr(micro_batch, "pool_idle", lambda: 1)
+    batcher = MicroBatcher(window_ms=1000, max_size=8)
+    assert batcher.calculate("ip:test", "R32|PT", value1=1000.0, value2=300.0, **FLUID)["T"] == 300.0
+    assert calls == [("single", 300.0)]
+    assert batcher.stats()["immediate"] == 1 and batcher.stats()["batches"] == 0
+
+
+def test_errors_stay_with_their_caller(calls):
+    batcher = MicroBatcher(window_ms=200, max_size=4)
+    results = _concurrent(batcher, [300.0, -1.0, 300.0, 310.0])
+    assert results[0]["T"] == 300.0 and results[2]["T"] == 300.0 and results[3]["T"] == 310.0
+    assert isinstance(results[1], RuntimeError)
+    assert calls == [("batch", 3)]  # 重复的状态点只计算一次
+    assert batcher.stats()["deduplicated"] == 1
+
+
+def test_timed_out_batch_is_split(calls):
+    batcher = MicroBatcher(window_ms=200, max_size=3)
+    results = _concurrent(batcher, [300.0, 999.0, 310.0])
+    assert results[0]["T"] == 300.0 and results[2]["T"] == 310.0
+    assert isinstance(results[1], CalculationTimeout)
+    assert calls[0] == ("batch", 3) and sorted(c[1] for c in calls[1:]) == [300.0, 310.0, 999.0]
+    assert batcher.stats()["split_on_timeout"] == 1
+
+
+def test_each_request_is_admitted_under_its_own_client(calls, monkeypatch):
+    charged = []
+
+    @contextmanager
+    def fake_admit(client, kind, n_items=1, slots=1):
+        if client == "ip:flood":
+            raise HTTPException(status_code=429, detail="too many")
+        charged.append((client, slots))
+        yield
+
+    @contextmanager
+    def fake_admit_slot(client):
+        charged.append((client, "slot"))
+        yield
+
+    monkeypatch.setattr(micro_batch, "admit", fake_admit)
+    monkeypatch.setattr(micro_batch, "admit_slot", fake_admit_slot)
+    batcher = MicroBatcher(window_ms=200, max_size=3)
+    results = _concurrent(batcher, [300.0, 310.0, 320.0, 330.0], clients=["ip:a", "ip:b", "ip:flood", "ip:c"])
+    # 被拒绝的请求只影响自己，也不进入批次
+    assert isinstance(results[2], HTTPException) and results[2].status_code == 429
+    assert [r["T"] for r in results[:2] + results[3:]] == [300.0, 310.0, 330.0]
+    assert calls == [("batch", 3)]
+    assert sorted(c for c in charged if c[1] == 0) == [("ip:a", 0), ("ip:b", 0), ("ip:c", 0)]
+    assert [c[1] for c in charged].count("slot") == 1
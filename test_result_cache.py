@@ -0,0 +1,71 @@
+"""
+结果缓存测试：进程内 LRU、跨实例（跨 worker）的共享缓存命中、版本变化时清空、按大小淘汰
+"""
+import sqlite3
+
+import result_cache
+from result_cache import LRUCache, SharedCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_shared_hit_across_instances(tmp_db):
+    writer = SharedCache(tmp_db)
+    reader = SharedCache(tmp_db)  # 相当于另一个 worker
+    writer.put("calculate", '["R32","PT",1000,300]', {"T": 300.0, "P": 1000.0})
+    writer.flush()
+    assert reader.get("calculate", '["R32","PT",1000,300]') == {"T": 300.0, "P": 1000.0}
+    assert reader.get("dome", '["R32","PT",1000,300]') is None  # 命名空间隔离
+    assert reader.stats()["hits"] == 1 and reader.stats()["misses"] == 1
+    assert writer.stats()["writes"] == 1 and writer.stats()["pending"] == 0
+
+
+def test_version_change_clears_entries(tmp_db, monkeypatch):
+    cache = SharedCache(tmp_db)
+    cache.put("dome", "R32", {"critical": {"T": 351.255}})
+    cache.flush()
+    monkeypatch.setattr(result_cache, "CACHE_VERSION", result_cache.CACHE_VERSION + 1)
+    reopened = SharedCache(tmp_db)
+    assert reopened.get("dome", "R32") is None
+    conn = sqlite3.connect(tmp_db)
+    assert conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()[0] == str(
+        result_cache.CACHE_VERSION
+    )
+    conn.close()
+
+
+def test_eviction_keeps_file_under_limit(tmp_db, monkeypatch):
+    monkeypatch.setattr(result_cache, "EVICT_CHECK_EVERY", 8)
+    cache = SharedCache(tmp_db, max_mb=0.25)
+    payload = "x" * 4096
+    for i in range(200):
+        cache.put("calculate", f"k{i}", payload)
+    cache.flush()
+    stats = cache.stats()
+    assert stats["evicted"] > 0
+    assert stats["entries"] < 200
+    assert stats["bytes"] <= cache.max_bytes + 64 * 1024  # 最后一次检查之后的写入尚未淘汰
+    assert cache.get("calculate", "k199") == payload  # 最新写入的保留
+
+
+def test_write_queue_full_drops_instead_of_blocking(tmp_db, monkeypatch):
+    monkeypatch.setattr(result_cache, "WRITE_QUEUE_MAX", 1)
+    cache = SharedCache(tmp_db)
+    blocker = sqlite3.connect(tmp_db, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")  # 其他 worker 长时间持有写锁
+    try:
+        for i in range(50):
+            cache.put("calculate", f"k{i}", i)  # 请求线程不等待写锁
+        assert cache.stats()["dropped"] > 0
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    cache.flush()
@@ -0,0 +1,58 @@
+"""
+资源统计与长时间运行测试的判定：/proc 读数、库副本映射计数、基线与增长阈值、库副本未释放
+"""
+import pytest
+
+from calc_pool import CalculatorPool
+from config import FLUIDS_PATH, RPPREFIX
+from resource_stats import process_resources, resources
+from soak import LeakTracker, processes
+
+POINT = {"fluid_string": "R32", "input_type": "PT", "value1": 1000.0, "value2": 300.0}
+
+
+def _proc(pid: int, rss: float, fds: int = 10, **extra) -> dict:
+    return {"key": f"worker:{pid}", "pid": pid, "rss_mb": rss, "open_fds": fds, **extra}
+
+
+def test_process_resources_counts_isolated_library_copies(refprop):
+    from refprop_session import load_library
+
+    before = process_resources()
+    assert before["rss_mb"] > 0 and before["open_fds"] > 0 and before["mmaps"] > 0
+    rp = load_library(RPPREFIX, FLUIDS_PATH, isolated=True)
+    assert process_resources()["refprop_libraries"] == before["refprop_libraries"] + 1
+    del rp
+
+
+def test_resources_report_calculator_processes(refprop):
+    pool = CalculatorPool(size=1, spares=0)
+    pool.start()
+    try:
+        pool.call("calculate", 10.0, **POINT)
+        rows = processes(resources(pool.stats()))
+    finally:
+        pool.shutdown()
+    roles = {row["role"]: row for row in rows}
+    assert set(roles) == {"worker", "calculator"}
+    calc = roles["calculator"]
+    assert calc["rss_mb"] > 0 and calc["library_instances"] >= 1
+    assert calc["refprop_libraries"] <= calc["expected_libraries"]
+
+
+def test_leak_tracker_checks_growth_after_warmup():
+    tracker = LeakTracker(max_rss_growth_mb=50.0, max_fd_growth=5)
+    assert tracker.observe(_proc(1, 100.0), warm=False) == []
+    assert tracker.observe(_proc(1, 400.0), warm=False) == []  # 预热期间只更新基线
+    assert tracker.observe(_proc(1, 440.0, fds=14), warm=True) == []
+    failures = tracker.observe(_proc(1, 460.0, fds=16), warm=True)
+    assert len(failures) == 2 and "RSS" in failures[0]
+    assert tracker.observe(_proc(2, 900.0), warm=True) == []  # 预热后新出现的进程以首次采样为基线
+
+
+def test_leak_tracker_reports_unreleased_library_copies():
+    tracker = LeakTracker(max_rss_growth_mb=50.0, max_fd_growth=5)
+    tracker.observe(_proc(1, 100.0, refprop_libraries=3, expected_libraries=3), warm=True)
+    assert tracker.library_excess() == []
+    tracker.observe(_proc(1, 100.0, refprop_libraries=5, expected_libraries=3), warm=True)
+    assert len(tracker.library_excess()) == 1
@@ -0,0 +1,393 @@
+"""
+ctREFPROP 替身（无 REFPROP 安装时的本地联调、测试与长时间运行测试用）
+以简化的伪工质模型实现 refbackend 用到的 REFPROPdll / GETENUMdll / SETPATHdll / SATSPLNdll / SPLNVALdll /
+MAXTdll / MAXPdll 接口，数值只保证量级与相态合理，不可用于任何物性结果。
+
+REFPROPFunctionLibrary 传入库文件路径时会把该文件映射进内存（与 dlopen 一样出现在 /proc/<pid>/maps），
+长时间运行测试据此统计库实例的映射数。用法：PYTHONPATH=tools/fake_refprop，
+RPPREFIX 指向含非空 librefprop.so 文件的目录（conftest.py 与 soak.py --fake 会自动准备）。
+"""
+import mmap
+import math
+import os
+import zlib
+from collections import namedtuple
+
+R = 8.314462618
+UNDEF = -9999990.0
+
+_Out = namedtuple("REFPROPdlloutput", "z Output hUnits iUCode x y x3 q ierr herr")
+_Enum = namedtuple("GETENUMdlloutput", "iEnum ierr herr")
+_Err = namedtuple("SETPATHdlloutput", "ierr herr")
+_Spl = namedtuple("SPLNVALdlloutput", "f ierr herr")
+_Max = namedtuple("MAXTdlloutput", "Tm Pm Dm ierr herr")
+
+KNOWN = {
+    "R32": (351.255, 5.782e6, 0.052024),
+    "R125": (339.173, 3.6177e6, 0.120021),
+    "R1234YF": (367.85, 3.3822e6, 0.114042),
+    "R1234ZEE": (382.513, 3.6349e6, 0.114042),
+    "R227EA": (374.9, 2.925e6, 0.17003),
+    "CO2": (304.1282, 7.3773e6, 0.0440098),
+    "WATER": (647.096, 22.064e6, 0.018015268),
+    "PROPANE": (369.89, 4.2512e6, 0.04409562),
+}
+
+
+def _params(name):
+    key = name.strip().upper().replace(".FLD", "")
+    if key in KNOWN:
+        return KNOWN[key]
+    if not key or not key.replace("-", "").isalnum():
+        return None
+    h = zlib.crc32(key.encode())
+    return (300.0 + h % 150, 3e6 + (h % 2000) * 1e3, 0.05 + (h % 100) / 1000.0)
+
+
+class _Fluid:
+    def __init__(self, hfld, z):
+        names = [n for n in hfld.split("*") if n.strip()]
+        ps = [_params(n) for n in names]
+        if not names or any(p is None for p in ps):
+            raise KeyError(hfld)
+        zz = list(z[: len(names)]) if len(names) > 1 else [1.0]
+        s = sum(zz) or 1.0
+        zz = [x / s for x in zz]
+        self.nc = len(names)
+        self.Tc = sum(x * p[0] for x, p in zip(zz, ps))
+        self.Pc = sum(x * p[1] for x, p in zip(zz, ps))
+        self.M = sum(x * p[2] for x, p in zip(zz, ps))
+        self.A = 7.0
+        self.Tt = 0.45 * self.Tc
+        self.cpl = 110.0
+        self.cpv = 75.0
+        self.L0 = 9.0 * R * self.Tc
+        self.Dl0 = 2.2e4
+        self.glide = 0.04 if self.nc > 1 else 0.0
+
+    # 饱和
+    def psat(self, T, q=0.5):
+        P = self.Pc * math.exp(self.A * (1 - self.Tc / T))
+        return P * (1 + self.glide * (0.5 - q) * (1 - T / self.Tc))
+
+    def tsat(self, P, q=0.5):
+        lo, hi = 0.3 * self.Tc, self.Tc
+        for _ in range(60):
+            mid = 0.5 * (lo + hi)
+            if self.psat(mid, q) < P:
+                lo = mid
+            else:
+                hi = mid
+        return 0.5 * (lo + hi)
+
+    def hl(self, T):
+        return self.cpl * (T - 200.0)
+
+    def lat(self, T):
+        return self.L0 * max(1 - T / self.Tc, 0.0) ** 0.38
+
+    def sl(self, T):
+        return self.cpl * math.log(T / 200.0)
+
+    def dl(self, T):
+        return self.Dl0 * (1 - 0.35 * min(T / self.Tc, 1.0))
+
+    def crit(self):
+        return self.Tc, self.Pc, self.hl(self.Tc), self.Pc / (R * self.Tc) * 3.0
+
+    # 由 (P, h) 求状态
+    def ph(self, P, h):
+        if P >= self.Pc:
+            Tb = self.Tc
+            hb = self.hl(Tb)
+            if h <= hb:
+                T = 200.0 + h / self.cpl
+                return self._liq(T, P)
+            T = Tb + (h - hb) / self.cpv
+            return self._vap(T, P, Tb)
+        Tb = self.tsat(P, 0.0)
+        Td = self.tsat(P, 1.0)
+        hlb = self.hl(Tb)
+        hvd = self.hl(Td) + self.lat(Td)
+        if h <= hlb:
+            return self._liq(200.0 + h / self.cpl, P)
+        if h >= hvd:
+            return self._vap(Td + (h - hvd) / self.cpv, P, Td)
+        q = (h - hlb) / (hvd - hlb)
+        T = Tb + q * (Td - Tb)
+        dv = P / (R * T)
+        dlq = self.dl(T)
+        D = 1.0 / ((1 - q) / dlq + q / dv)
+        s = self.sl(Tb) + q * (self.sl(Td) + self.lat(Td) / Td - self.sl(Tb))
+        return dict(T=T, P=P, D=D, H=h, S=s, Q=q, CP=None, CV=None, W=None, phase=2)
+
+    def _liq(self, T, P):
+        D = self.dl(T) * (1 + (P - self.psat(min(T, self.Tc - 1e-6))) * 1e-10)
+        return dict(T=T, P=P, D=D, H=self.hl(T), S=self.sl(T), Q=-998.0,
+                    CP=self.cpl, CV=self.cpl - 8.0, W=900.0, phase=1)
+
+    def _vap(self, T, P, Ts):
+        hv = self.hl(Ts) + self.lat(Ts)
+        sv = self.sl(Ts) + self.lat(Ts) / Ts
+        return dict(T=T, P=P, D=P / (R * T), H=hv + self.cpv * (T - Ts),
+                    S=sv + self.cpv * math.log(T / Ts), Q=998.0,
+                    CP=self.cpv, CV=self.cpv - R, W=math.sqrt(self.cpv / (self.cpv - R) * R * T / self.M),
+                    phase=3)
+
+    def hspan(self, P):
+        return self.hl(120.0) - 1.0, self.hl(self.Tc) + self.L0 + self.cpv * 1500
+
+    def solve_h(self, P, var, target):
+        lo, hi = self.hspan(P)
+        flo = self.ph(P, lo)[var] - target
+        fhi = self.ph(P, hi)[var] - target
+        if flo * fhi > 0:
+            raise ValueError("out of range")
+        for _ in range(70):
+            mid = 0.5 * (lo + hi)
+            fm = self.ph(P, mid)[var] - target
+            if (fm < 0) == (flo < 0):
+                lo, flo = mid, fm
+            else:
+                hi = mid
+        return self.ph(P, 0.5 * (lo + hi))
+
+    def state(self, hin, a, b):
+        vals = {hin[0]: a, hin[1]: b}
+        if "Q" in vals:
+            q = vals["Q"]
+            if not 0 <= q <= 1:
+                raise ValueError("quality out of range")
+            if "T" in vals:
+                T = vals["T"]
+                if T >= self.Tc or T < self.Tt:
+                    raise ValueError("T out of saturation range")
+                P = self.psat(T, q)
+            elif "P" in vals:
+                P = vals["P"]
+                if P >= self.Pc:
+                    raise ValueError("P above critical")
+                T = None
+            else:
+                raise ValueError("unsupported")
+            Tb, Td = self.tsat(P, 0.0), self.tsat(P, 1.0)
+            hlb = self.hl(Tb)
+            hvd = self.hl(Td) + self.lat(Td)
+            st = self.ph(P, hlb + q * (hvd - hlb)) if 0 < q < 1 else None
+            if q == 0:
+                st = self.ph(P, hlb)
+                st["Q"] = 0.0
+            if q == 1:
+                st = self.ph(P, hvd)
+                st["Q"] = 1.0
+            return st
+        if "P" in vals:
+            P = vals["P"]
+            other = [k for k in hin if k != "P"][0]
+            if P <= 0:
+                raise ValueError("P<=0")
+            if other == "H":
+                return self.ph(P, vals["H"])
+            var = {"T": "T", "S": "S", "D": "D", "E": "E"}.get(other)
+            if var == "E":
+                raise ValueError("unsupported")
+            if var == "D":
+                return self._solve_d(P, vals["D"])
+            return self.solve_h(P, var, vals[other])
+        if "T" in vals and ("D" in vals or "H" in vals or "S" in vals):
+            other = [k for k in hin if k != "T"][0]
+            T = vals["T"]
+            lo, hi = math.log(1.0), math.log(5e8)
+
+            def f(lp):
+                st = self.solve_h(math.exp(lp), "T", T)
+                return st
+            sign = 1.0 if other == "D" else -1.0
+            for _ in range(60):
+                mid = 0.5 * (lo + hi)
+                st = f(mid)
+                if sign * (st[other] - vals[other]) < 0:
+                    lo = mid
+                else:
+                    hi = mid
+            return f(0.5 * (lo + hi))
+        raise ValueError("unsupported input pair")
+
+    def _solve_d(self, P, D):
+        lo, hi = self.hspan(P)
+        for _ in range(70):
+            mid = 0.5 * (lo + hi)
+            if self.ph(P, mid)["D"] > D:
+                lo = mid
+            else:
+                hi = mid
+        return self.ph(P, 0.5 * (lo + hi))
+
+
+def _transport(st, fl):
+    if st["phase"] == 2 or st.get("CP") is None:
+        return None, None, None
+    vis = 2.0e-4 if st["phase"] == 1 else 1.2e-5
+    tcx = 0.09 if st["phase"] == 1 else 0.014
+    return vis, tcx, st["CP"] / fl.M * vis / tcx
+
+
+_NAMES = {"T": "T", "P": "P", "D": "D", "H": "H", "S": "S", "E": "E", "Q": "Q"}
+
+
+class _RP:
+    def __init__(self, path):
+        self.path = path
+        self._fluid_key = None
+        self._fluid = None
+        self._mapping = None
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                self._mapping = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+
+    def SETPATHdll(self, hpth):
+        return _Err(0, "")
+
+    def GETENUMdll(self, iFlag, hEnum):
+        return _Enum(21 if "SI" in hEnum.upper() else 0, 0, "")
+
+    def _setup(self, hfld, z):
+        key = (hfld.upper(), tuple(round(x, 9) for x in z))
+        if key != self._fluid_key:
+            self._fluid = _Fluid(hfld, z)
+            self._fluid_key = key
+        return self._fluid
+
+    def _out(self, outputs, hunits="", ierr=0, herr="", z=None, q=0.0):
+        vals = list(outputs) + [0.0] * (200 - len(outputs))
+        return _Out(z or [0.0] * 20, vals, hunits, 0, [0.0] * 20, [0.0] * 20, [0.0] * 20, q, ierr, herr)
+
+    def REFPROPdll(self, hFld, hIn, hOut, iUnits, iMass, iFlag, a, b, z):
+        try:
+            fl = self._setup(hFld, z)
+        except KeyError:
+            return self._out([], ierr=101, herr=f"[SETUP error 101] error in opening file for component: {hFld}")
+        hin = hIn.upper().strip()
+        keys = [k.strip() for k in hOut.split(";") if k.strip()]
+        Tc, Pc, Hc, Dc = fl.crit()
+        fixed = {
+            "TC": Tc, "PC": Pc, "DC": Dc, "M": fl.M, "TTRP": fl.Tt, "PTRP": fl.psat(fl.Tt),
+            "TNBP": fl.tsat(101325.0, 1.0), "GWP": 675.0 if fl.nc == 1 else -1.0,
+            "ODP": -1.0, "TMIN": fl.Tt, "TMAX": 2.5 * Tc, "PMAX": 70e6, "DMAX": fl.Dl0,
+        }
+        if hin in ("CRIT", "TRIP", "EOSMIN", "EOSMAX"):
+            if keys and keys[0].upper() in ("SAFETY", "CAS#"):
+                if fl.nc > 1:
+                    return self._out([], ierr=1, herr="not available for mixtures")
+                return self._out([0.0], hunits="A2L" if keys[0].upper() == "SAFETY" else "75-10-5")
+            if hin == "CRIT":
+                st = dict(T=Tc, P=Pc, H=Hc, D=Dc, S=fl.sl(Tc), Q=-998.0, CP=None, CV=None, W=None, phase=3)
+            elif hin in ("TRIP", "EOSMIN"):
+                st = fl.state("TQ", fl.Tt + 1e-9, 0.0)
+                st["T"] = fl.Tt
+            else:
+                st = dict(T=2.5 * Tc, P=70e6, D=fl.Dl0, H=0.0, S=0.0, Q=-998.0, CP=None, CV=None, W=None, phase=3)
+        else:
+            try:
+                st = fl.state(hin, float(a), float(b))
+            except ValueError as e:
+                return self._out([], ierr=248, herr=f"[REFPROP error 248] {e} ({hin} {a} {b})")
+        vis, tcx, pr = _transport(st, fl)
+        out = []
+        for k in keys:
+            ku = k.upper()
+            if ku in fixed:
+                out.append(fixed[ku])
+            elif ku in ("QMOLE", "Q", "QMASS"):
+                out.append(st["Q"])
+            elif ku in ("VIS", "TCX", "PRANDTL"):
+                v = {"VIS": vis, "TCX": tcx, "PRANDTL": pr}[ku]
+                out.append(UNDEF if v is None else v)
+            elif ku in st:
+                v = st[ku]
+                out.append(UNDEF if v is None else v)
+            elif ku == "E":
+                out.append(st["H"] - st["P"] / st["D"])
+            elif ku.startswith("D(") or ku in ("DPDT", "DPDD", "DDDT", "DDDP", "DHDT_D", "DHDT_P",
+                                               "DHDD_T", "DHDD_P", "DHDP_T", "DHDP_D", "JT"):
+                out.append(self._deriv(fl, st, ku))
+            else:
+                return self._out([], ierr=331, herr=f"[REFPROP error 331] unknown output: {k}")
+        return self._out(out, q=st["Q"] if isinstance(st.get("Q"), float) else 0.0)
+
+    def _deriv(self, fl, st, ku):
+        named = {"DPDT": ("P", "T", "D"), "DPDD": ("P", "D", "T"), "DDDT": ("D", "T", "P"),
+                 "DDDP": ("D", "P", "T"), "DHDT_D": ("H", "T", "D"), "DHDT_P": ("H", "T", "P"),
+                 "DHDD_T": ("H", "D", "T"), "DHDD_P": ("H", "D", "P"), "DHDP_T": ("H", "P", "T"),
+                 "DHDP_D": ("H", "P", "D"), "JT": ("T", "P", "H")}
+        if ku in named:
+            x, y, zc = named[ku]
+        else:
+            inner = ku[2:]
+            x = inner[0]
+            y = inner[inner.index("D(") + 2]
+            zc = inner[-1]
+        if st["phase"] == 2 and x != "H":
+            return UNDEF
+        pair = "".join(sorted(y + zc, key=lambda c: "TPDHSQ".index(c) if c in "TPDHSQ" else 9))
+        try:
+            def ev(yv):
+                vals = {y: yv, zc: st[zc]}
+                r = fl.state(pair, vals[pair[0]], vals[pair[1]])
+                return r["H"] - r["P"] / r["D"] if x == "E" else r[x]
+            dy = abs(st[y]) * 1e-5 or 1e-5
+            return (ev(st[y] + dy) - ev(st[y] - dy)) / (2 * dy)
+        except Exception:
+            return UNDEF
+
+    # 相界样条接口（SATSPLN / SPLNVAL）
+    def SATSPLNdll(self, z):
+        return _Err(0, "")
+
+    def SPLNVALdll(self, isp, iderv, a):
+        fl = self._fluid
+        nc = fl.nc
+        lo, hi = 0.0, 1.0
+        if iderv == -1:
+            return _Spl(lo, 0, "")
+        if iderv == -2:
+            return _Spl(hi, 0, "")
+        # a in [0,1]: 0..0.5 dew from Tt to Tc, 0.5..1 bubble from Tc to Tt
+        if a <= 0.5:
+            T = fl.Tt + (fl.Tc - fl.Tt) * (a / 0.5) ** 0.5
+            q = 1.0
+        else:
+            T = fl.Tt + (fl.Tc - fl.Tt) * ((1 - a) / 0.5) ** 0.5
+            q = 0.0
+        T = min(T, fl.Tc - 1e-6)
+        st = fl.state("TQ", max(T, fl.Tt + 1e-9), q)
+        if isp == nc + 1:
+            return _Spl(st["T"], 0, "")
+        if isp == nc + 2:
+            return _Spl(st["P"] / 1000.0, 0, "")
+        if isp == nc + 3:
+            return _Spl(st["D"] / 1000.0, 0, "")
+        if isp == nc + 4:
+            return _Spl(st["H"], 0, "")
+        return _Spl(0.0, 1, "bad isp")
+
+    # 样条上的极值：Dm 返回样条自变量，与 SPLNVALdll 的取值一致
+    def _spline_max(self, isp):
+        nc = self._fluid.nc
+        a = max((i / 2000.0 for i in range(2001)), key=lambda x: self.SPLNVALdll(isp, 0, x).f)
+        T, P = self.SPLNVALdll(nc + 1, 0, a).f, self.SPLNVALdll(nc + 2, 0, a).f
+        return _Max(T, P, a, 0, "")
+
+    def MAXTdll(self, z):
+        return self._spline_max(self._fluid.nc + 1)
+
+    def MAXPdll(self, z):
+        return self._spline_max(self._fluid.nc + 2)
+
+
+def REFPROPFunctionLibrary(name, shared_extension=None):
+    """name 为目录时按 ctREFPROP 的约定查找其中的 librefprop.so"""
+    if os.path.isdir(name):
+        candidate = os.path.join(name, "librefprop.so")
+        name = candidate if os.path.isfile(candidate) else name
+    return _RP(name)